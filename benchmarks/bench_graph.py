@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""Scaling benchmark for plugin dependency resolution."""
+
+import json
+import logging
+import random
+import time
+
+import click
+
+from src.lib.graph import DependencyGraph
+from src.lib.plugins import PluginManager
+
+
+def synthetic_dependencies(size, density, seed=0):
+    """
+    Generate an acyclic synthetic dependency mapping.
+
+    Args:
+        size (int): The number of plugins.
+        density (int): The maximum number of dependencies of a plugin.
+        seed (int, optional): The random seed.
+
+    Returns:
+        dict: A mapping of plugin names to the names they depend on.
+    """
+    rng = random.Random(seed)
+    dependencies = {}
+    for i in range(size):
+        count = rng.randint(0, min(i, density))
+        dependencies[f"Plugin{i}"] = [f"Plugin{j}" for j in rng.sample(range(i), count)]
+    return dependencies
+
+
+def bench(size, density, repeat):
+    """
+    Time the dependency resolution of a synthetic plugin set.
+
+    Args:
+        size (int): The number of plugins.
+        density (int): The maximum number of dependencies of a plugin.
+        repeat (int): The number of runs, the fastest is reported.
+
+    Returns:
+        dict: The benchmark result.
+    """
+    dependencies = synthetic_dependencies(size, density)
+    edges = sum(len(deps) for deps in dependencies.values())
+
+    graph_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        graph = DependencyGraph(dependencies, dependencies)
+        graph.order()
+        graph_times.append(time.perf_counter() - start)
+
+    manager = PluginManager(logging.getLogger(__name__))
+    manager.plugins = {name: {} for name in dependencies}
+    manager.dependencies = dependencies
+    manager_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        manager.resolve_dependencies()
+        manager.topological_sort()
+        manager_times.append(time.perf_counter() - start)
+
+    return {
+        "plugins": size,
+        "edges": edges,
+        "levels": len(graph.levels),
+        "graph_seconds": min(graph_times),
+        "manager_seconds": min(manager_times),
+    }
+
+
+@click.command()
+@click.option("--sizes", default="1000,10000,50000", help="Comma separated plugin counts")
+@click.option("--density", default=5, help="Maximum number of dependencies per plugin")
+@click.option("--repeat", default=3, help="Number of runs per size, the fastest is reported")
+def main(sizes, density, repeat):
+    """Benchmark dependency resolution for growing plugin counts and print JSON results."""
+    results = [bench(int(size), density, repeat) for size in sizes.split(",")]
+    click.echo(json.dumps({"benchmark": "graph", "density": density, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
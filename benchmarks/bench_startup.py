@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""Startup benchmark for the discover, load, register and resolve pipeline."""
+
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import click
+
+from codetiming import Timer
+
+from benchmarks.generate import generate_tree
+from src.lib.hooks import HookManager
+from src.lib.index import DiscoveryIndex
+from src.lib.plugins import PluginManager
+
+
+PHASES = [
+    "hooks.discover",
+    "hooks.register",
+    "plugins.discover",
+    "plugins.load",
+    "plugins.register",
+    "plugins.get_dependencies",
+    "plugins.resolve",
+    "plugins.sort",
+]
+
+
+def import_time():
+    """
+    Measure the time to import the framework in a fresh interpreter.
+
+    Returns:
+        float: The import time in seconds.
+    """
+    code = "import time; s = time.perf_counter(); import src.lib.handler; print(time.perf_counter() - s)"
+    output = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True)
+    return float(output.stdout.strip())
+
+
+def git_commit():
+    """
+    Return the current git commit, if any.
+
+    Returns:
+        str or None: The commit hash.
+    """
+    try:
+        output = subprocess.run(["git", "rev-parse", "HEAD"], check=True, capture_output=True, text=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.stdout.strip()
+
+
+def purge_modules(package):
+    """Remove the modules of a generated tree so the next run imports them again."""
+    for name in [name for name in sys.modules if name == package or name.startswith(package + ".")]:
+        del sys.modules[name]
+
+
+def run_pipeline(paths, lazy=False, index=None, trace_memory=False):
+    """
+    Run the startup pipeline once, timing each phase.
+
+    Args:
+        paths (dict): The ``plugins`` and ``hooks`` directories.
+        lazy (bool, optional): Use lazy loading.
+        index (DiscoveryIndex, optional): The discovery index to use.
+        trace_memory (bool, optional): Record the peak allocated memory of each phase, ``tracemalloc``
+            must be tracing. The durations are then inflated by the tracing.
+
+    Returns:
+        dict: The duration in seconds and the peak allocated memory in bytes, or None, of each phase.
+    """
+    logger = logging.getLogger("benchmarks")
+    phases = {}
+
+    def phase(name, function, *args):
+        if trace_memory:
+            tracemalloc.reset_peak()
+            start = tracemalloc.get_traced_memory()[0]
+        with Timer(name=name, logger=None) as timer:
+            result = function(*args)
+        peak = tracemalloc.get_traced_memory()[1] - start if trace_memory else None
+        phases[name] = {"seconds": timer.last, "peak_bytes": peak}
+        return result
+
+    hook_manager = HookManager(logger, index, lazy)
+    phase("hooks.discover", hook_manager.discover, paths["hooks"])
+    hooks = phase("hooks.register", hook_manager.register)
+
+    plugin_manager = PluginManager(logger, hooks, index, lazy)
+    phase("plugins.discover", plugin_manager.discover, paths["plugins"])
+    phase("plugins.load", plugin_manager.load)
+    phase("plugins.register", plugin_manager.register)
+    phase("plugins.get_dependencies", plugin_manager.get_dependencies)
+    phase("plugins.resolve", plugin_manager.resolve_dependencies)
+    phase("plugins.sort", plugin_manager.topological_sort)
+
+    phases["plugins.registered"] = len(plugin_manager.registered_plugins)
+    return phases
+
+
+def summarize(runs, traced):
+    """
+    Reduce repeated runs to the fastest time and largest peak of each phase.
+
+    Args:
+        runs (list): The results of ``run_pipeline`` without memory tracing, for the durations.
+        traced (list): The results of ``run_pipeline`` with memory tracing, for the peaks.
+
+    Returns:
+        dict: The summary of each phase and of the whole pipeline.
+    """
+    summary = {}
+    for name in PHASES:
+        summary[name] = {
+            "seconds": min(run[name]["seconds"] for run in runs),
+            "peak_bytes": max(run[name]["peak_bytes"] for run in traced),
+        }
+    summary["total"] = {
+        "seconds": min(sum(run[name]["seconds"] for name in PHASES) for run in runs),
+        "peak_bytes": max(summary[name]["peak_bytes"] for name in PHASES),
+    }
+    return summary
+
+
+@click.command()
+@click.option("--plugins", default=500, help="Number of plugins")
+@click.option("--hooks", default=5, help="Number of hooks")
+@click.option("--depth", default=1, help="Directory levels above each plugin")
+@click.option("--density", default=3, help="Maximum number of dependencies per plugin")
+@click.option("--ignored", default=0.0, help="Fraction of plugins with an IGNORE file")
+@click.option("--repeat", default=3, help="Number of timed runs, the fastest is reported")
+@click.option("--lazy", is_flag=True, help="Use lazy loading")
+@click.option("--index", "use_index", is_flag=True, help="Use a discovery index, warmed by a first run")
+@click.option("--output", default=None, help="Write the JSON results to this file instead of stdout")
+def main(plugins, hooks, depth, density, ignored, repeat, lazy, use_index, output):
+    """Benchmark each startup phase on a synthetic plugin tree and emit JSON results."""
+    package = "bench_tree"
+    with tempfile.TemporaryDirectory() as root:
+        paths = generate_tree(root, package, plugins, hooks, depth, density, ignored)
+        sys.path.insert(0, root)
+        index = (
+            DiscoveryIndex(logging.getLogger("benchmarks"), os.path.join(root, "index.json")) if use_index else None
+        )
+        if index is not None:
+            list(index.walk(paths["plugins"]))
+            list(index.walk(paths["hooks"]))
+
+        runs = []
+        traced = []
+        try:
+            for _ in range(repeat):
+                purge_modules(package)
+                runs.append(run_pipeline(paths, lazy, index))
+            # Peak memory in a separate pass, tracemalloc slows down every allocation
+            tracemalloc.start()
+            try:
+                purge_modules(package)
+                traced.append(run_pipeline(paths, lazy, index, trace_memory=True))
+            finally:
+                tracemalloc.stop()
+        finally:
+            sys.path.remove(root)
+
+    results = {
+        "benchmark": "startup",
+        "commit": git_commit(),
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "parameters": {
+            "plugins": plugins,
+            "hooks": hooks,
+            "depth": depth,
+            "density": density,
+            "ignored": ignored,
+            "repeat": repeat,
+            "lazy": lazy,
+            "index": use_index,
+        },
+        "registered": runs[-1]["plugins.registered"],
+        "import_seconds": import_time(),
+        "phases": summarize(runs, traced),
+    }
+
+    text = json.dumps(results, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(text)
+    else:
+        click.echo(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""Compare two startup benchmark results and report regressions."""
+
+import json
+import sys
+
+import click
+
+
+def compare(baseline, candidate, threshold):
+    """
+    Compare the phase timings of two benchmark results.
+
+    Args:
+        baseline (dict): The reference results.
+        candidate (dict): The results to check.
+        threshold (float): The relative slowdown reported as a regression.
+
+    Returns:
+        list: ``(phase, baseline seconds, candidate seconds, ratio, regressed)`` tuples.
+    """
+    rows = []
+    for name, base in baseline["phases"].items():
+        if name not in candidate["phases"]:
+            continue
+        new = candidate["phases"][name]
+        ratio = new["seconds"] / base["seconds"] if base["seconds"] else 1.0
+        rows.append((name, base["seconds"], new["seconds"], ratio, ratio > 1 + threshold))
+    return rows
+
+
+@click.command()
+@click.argument("baseline", type=click.File("r"))
+@click.argument("candidate", type=click.File("r"))
+@click.option("--threshold", default=0.1, help="Relative slowdown reported as a regression")
+def main(baseline, candidate, threshold):
+    """Compare the CANDIDATE benchmark results against BASELINE, exit 1 on regressions."""
+    rows = compare(json.load(baseline), json.load(candidate), threshold)
+    regressed = False
+    for name, base, new, ratio, is_regression in rows:
+        regressed = regressed or is_regression
+        flag = "REGRESSION" if is_regression else ""
+        click.echo(f"{name:28} {base:10.4f}s {new:10.4f}s {ratio:6.2f}x {flag}")
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""Synthetic plugin and hook tree generator for the benchmarks."""
+
+import os
+import random
+
+import click
+
+
+PLUGIN_TEMPLATE = """# -*- coding: utf-8 -*-
+class {class_name}:
+    def __init__(self, logger, hooks=None, **kwargs):
+        self.logger = logger
+        self.hooks = hooks
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+    def execute(self):
+        self.logger.debug("Executing {class_name}")
+
+    def process_results(self):
+        self.logger.debug("Processing results for {class_name}")
+"""
+
+HOOK_TEMPLATE = """# -*- coding: utf-8 -*-
+class {class_name}:
+    def __init__(self, logger, **kwargs):
+        self.logger = logger
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+    def trigger(self, *events):
+        self.logger.debug("Executing {class_name} hook")
+"""
+
+INIT_TEMPLATE = """# -*- coding: utf-8 -*-
+import os
+
+from {module}.{file_name} import {class_name}
+
+
+def get_version():
+    with open(os.path.join(os.path.abspath(os.path.dirname(__file__)), "./VERSION")) as f:
+        return f.read().strip()
+
+
+__version__ = get_version()
+
+
+__all__ = ["__version__", "{class_name}"]
+"""
+
+
+def write(path, content):
+    """Write a file, creating its parent directories."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def generate_tree(root, package="bench_tree", plugins=100, hooks=5, depth=1, density=3, ignored=0.0, seed=0):
+    """
+    Generate a synthetic plugin and hook tree.
+
+    Plugins are importable as ``<package>.plugins...`` once ``root`` is on ``sys.path``, following
+    the layout of the bundled plugins (``__init__.py``, ``plugin.py``, ``VERSION``, ``DEPENDENCY``).
+
+    Args:
+        root (str): The directory to generate the tree in.
+        package (str, optional): The name of the top level package.
+        plugins (int, optional): The number of plugins.
+        hooks (int, optional): The number of hooks.
+        depth (int, optional): The number of directory levels above each plugin.
+        density (int, optional): The maximum number of dependencies of a plugin.
+        ignored (float, optional): The fraction of plugins marked with an IGNORE file.
+        seed (int, optional): The random seed.
+
+    Returns:
+        dict: The ``plugins`` and ``hooks`` directories of the generated tree.
+    """
+    rng = random.Random(seed)
+    package_dir = os.path.join(root, package)
+    plugins_dir = os.path.join(package_dir, "plugins")
+    hooks_dir = os.path.join(package_dir, "hooks")
+    for directory in (package_dir, plugins_dir, hooks_dir):
+        write(os.path.join(directory, "__init__.py"), "")
+
+    active = []
+    for i in range(plugins):
+        groups = [f"group{(i // (10**level)) % 10}" for level in range(depth - 1, 0, -1)]
+        relative = os.path.join(*groups, f"plugin{i}") if groups else f"plugin{i}"
+        plugin_dir = os.path.join(plugins_dir, relative)
+        module = ".".join([package, "plugins"] + groups + [f"plugin{i}"])
+        class_name = f"Plugin{i}"
+
+        for level in range(1, len(groups) + 1):
+            group_init = os.path.join(plugins_dir, *groups[:level], "__init__.py")
+            if not os.path.exists(group_init):
+                write(group_init, "")
+
+        write(os.path.join(plugin_dir, "plugin.py"), PLUGIN_TEMPLATE.format(class_name=class_name))
+        write(
+            os.path.join(plugin_dir, "__init__.py"),
+            INIT_TEMPLATE.format(module=module, file_name="plugin", class_name=class_name),
+        )
+        write(os.path.join(plugin_dir, "VERSION"), "1.0.0\n")
+        deps = rng.sample(active, min(len(active), rng.randint(0, density)))
+        write(os.path.join(plugin_dir, "DEPENDENCY"), "\n".join(deps) + ("\n" if deps else ""))
+
+        if rng.random() < ignored:
+            write(os.path.join(plugin_dir, "IGNORE"), "")
+        else:
+            active.append(class_name)
+
+    for i in range(hooks):
+        hook_dir = os.path.join(hooks_dir, f"hook{i}")
+        class_name = f"Hook{i}"
+        write(os.path.join(hook_dir, "hook.py"), HOOK_TEMPLATE.format(class_name=class_name))
+        write(
+            os.path.join(hook_dir, "__init__.py"),
+            INIT_TEMPLATE.format(module=f"{package}.hooks.hook{i}", file_name="hook", class_name=class_name),
+        )
+        write(os.path.join(hook_dir, "VERSION"), "1.0.0\n")
+
+    return {"plugins": plugins_dir, "hooks": hooks_dir}
+
+
+@click.command()
+@click.argument("root")
+@click.option("--package", default="bench_tree", help="Name of the top level package")
+@click.option("--plugins", default=100, help="Number of plugins")
+@click.option("--hooks", default=5, help="Number of hooks")
+@click.option("--depth", default=1, help="Directory levels above each plugin")
+@click.option("--density", default=3, help="Maximum number of dependencies per plugin")
+@click.option("--ignored", default=0.0, help="Fraction of plugins with an IGNORE file")
+@click.option("--seed", default=0, help="Random seed")
+def main(root, package, plugins, hooks, depth, density, ignored, seed):
+    """Generate a synthetic plugin and hook tree in ROOT."""
+    paths = generate_tree(root, package, plugins, hooks, depth, density, ignored, seed)
+    click.echo(f"Plugins: {paths['plugins']}")
+    click.echo(f"Hooks: {paths['hooks']}")
+
+
+if __name__ == "__main__":
+    main()
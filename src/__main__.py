@@ -1,31 +1,65 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import json
+import os
+import sys
+
 import click
 
 from src import __version__
-from src.lib import config
-from src.lib.handler import HookHandler, PluginHandler
+from src.lib import archive, bytecode, config
+from src.lib.cache import ResultCache
+from src.lib.cluster import Coordinator, get_authkey, run_workers
+from src.lib.daemon import PluginDaemon, request
+from src.lib.exceptions import PluginManifestError
+from src.lib.handler import HookHandler, PipelineHandler, PluginHandler
+from src.lib.history import RuntimeHistory
+from src.lib.hooks import HookManager, close_hooks
+from src.lib.index import DiscoveryIndex
 from src.lib.logger import setup_logger
-@click.command()
+from src.lib.manifest import ManifestCache, get_manifest, plan_manifests
+from src.lib.plugins import PluginManager
+from src.lib.profiler import Profiler
+from src.lib.scheduler import AsyncDagScheduler, DagScheduler
+from src.lib.state import RunState
+from src.lib.workers import WorkerPool
+
+
+@click.group(invoke_without_command=True)
 @click.option(
     "--conf",
     required=False,
     default="./src/configuration.yml",
     help="Configuration file to use",
 )
+@click.option(
+    "--full",
+    is_flag=True,
+    default=False,
+    help="Run every plugin, even the ones an incremental run would replay",
+)
 @click.pass_context
-def main(ctx, conf):
-    """Main entry point for the application."""
-    # Parsing the configuration file
-    configuration = config.yaml_parser(conf)
+def main(ctx, conf, full):
+    """Main entry point for the application, runs every plugin once when no command is given."""
+    # Parsing and validating the configuration file, compiled once per version of the file
+    configuration = config.load_config(conf)
+    if configuration is None:
+        raise click.ClickException(f"Cannot load the configuration file {conf}")
 
     # setup logging
     #   read the logger format from yml file
     #   if not defined default to something
     #   use the lib/log.py file for this
-    loglevel = configuration["app"]["logger"]["level"]
-    logformat = configuration["app"]["logger"]["format"]
-    logger = setup_logger(loglevel, logformat)
+    logger_conf = configuration["app"]["logger"]
+    logger = setup_logger(
+        level=logger_conf["level"],
+        format=logger_conf["format"],
+        queued=logger_conf.get("queued", False),
+        batch_size=logger_conf.get("batch_size", 100),
+        json_file=logger_conf.get("json", False),
+        rate_limit=logger_conf.get("rate_limit"),
+        rate_period=logger_conf.get("rate_period", 1.0),
+    )
     app_name = configuration["app"]["name"]
     logger.info("Running %s version %s", app_name, __version__)
     logger.info("Using configuration file: %s", conf)
@@ -34,18 +68,465 @@ def main(ctx, conf):
     args_dict = ctx.params
     logger.debug("Args: %s", args_dict)
 
+    ctx.obj = {"configuration": configuration, "logger": logger, "full": full}
+    if ctx.invoked_subcommand is None:
+        run(configuration, logger, full)
+
+
+def build_index(logger, app):
+    """Load the discovery index if one is configured."""
+    if "index" not in app:
+        return None
+    return DiscoveryIndex(logger, app["index"]["path"])
+
+
+def build_manifests(logger, app):
+    """Load the compiled manifests cache if one is configured."""
+    if "manifests" not in app:
+        return None
+    return ManifestCache(logger, app["manifests"]["path"])
+
+
+def build_history(logger, app):
+    """Load the runtime history if one is configured."""
+    history_conf = app.get("history")
+    if history_conf is None:
+        return None
+    try:
+        return RuntimeHistory(logger, history_conf["path"], history_conf.get("alpha", 0.3))
+    except ValueError as err:
+        raise click.ClickException(str(err))
+
+
+# The scheduler class of each executor, and the configuration keys it accepts besides executor
+SCHEDULERS = {
+    "thread": (DagScheduler, ("max_workers", "on_failure")),
+    "process": (DagScheduler, ("max_workers", "on_failure")),
+    "asyncio": (AsyncDagScheduler, ("max_workers", "max_concurrency", "on_failure")),
+    "remote": (
+        Coordinator,
+        ("address", "authkey", "lease_timeout", "heartbeat", "max_attempts", "worker_timeout", "on_failure"),
+    ),
+}
+
+
+def build_scheduler(logger, app):
+    """Run independent plugins concurrently if a scheduler is configured."""
+    if "scheduler" not in app:
+        return None
+    executor = app["scheduler"].get("executor", "thread")
+    scheduler_class, keys = SCHEDULERS[executor]
+    ignored = sorted(set(app["scheduler"]) - set(keys) - {"executor"})
+    if ignored:
+        logger.warning("Ignoring scheduler options not used by the %s executor: %s", executor, ignored)
+    scheduler_conf = {key: value for key, value in app["scheduler"].items() if key in keys}
+    if "on_failure" in app:
+        scheduler_conf.setdefault("on_failure", app["on_failure"])
+    try:
+        return scheduler_class(logger, executor, history=build_history(logger, app), **scheduler_conf)
+    except ValueError as err:
+        raise click.ClickException(str(err))
+
+
+def build_profiler(app):
+    """Record timings of every phase, plugin and hook if profiling is configured."""
+    profiler_conf = app.get("profiler")
+    if profiler_conf is None:
+        return None
+    return Profiler(profiler_conf.get("memory", False))
+
+
+def build_workers(logger, app):
+    """Run isolated plugins in worker processes if isolation is configured."""
+    if "isolation" not in app:
+        return None
+    return WorkerPool(logger, **app["isolation"])
+
+
+def build_cache(logger, app):
+    """Skip plugins whose result is cached if a result cache is configured."""
+    cache_conf = app.get("cache")
+    if not cache_conf or not cache_conf.get("enabled", True):
+        return None
+    return ResultCache(
+        logger,
+        cache_conf.get("path", "./.cache/results"),
+        cache_conf.get("max_bytes", 256 * 1024 * 1024),
+        cache_conf.get("exclude"),
+    )
+
+
+def build_state(logger, app, full=False):
+    """Only run the plugins downstream of a change if incremental runs are configured."""
+    incremental_conf = app.get("incremental")
+    if not incremental_conf or not incremental_conf.get("enabled", True):
+        return None
+    return RunState(
+        logger,
+        incremental_conf.get("path", "./.cache/state.pickle"),
+        incremental_conf.get("exclude"),
+        full,
+    )
+
+
+def build_bytecode(logger, app):
+    """Import plugins and hooks from the bytecode bundle if one is configured."""
+    bytecode_conf = app.get("bytecode")
+    if not bytecode_conf:
+        return None
+    try:
+        bundle = bytecode.BytecodeBundle(logger, bytecode_conf.get("path", "./.cache/bytecode.zip"))
+    except (OSError, ValueError) as err:
+        logger.warning("Not using the bytecode bundle: %s", err)
+        return None
+    return bytecode.install(bundle, list(plugin_directories(app).values()) + [app["hooks"]["directory"]])
+
+
+def plugin_directories(app):
+    """Return the core and users plugin directories, keyed by plugin type."""
+    return {
+        "core": app["core"]["directory"],
+        "users": app["users"]["directory"],
+    }
+
+
+def report_profile(logger, profiler, profiler_conf):
+    """Log the slowest plugin steps and write the configured profile files."""
+    for name, wall in profiler.slowest():
+        logger.info("Plugin step %s took %.3fs", name, wall)
+    if profiler_conf.get("json"):
+        profiler.dump_json(profiler_conf["json"])
+    if profiler_conf.get("chrome_trace"):
+        profiler.dump_chrome_trace(profiler_conf["chrome_trace"])
+
+
+def run(configuration, logger, full=False):
+    """Run every plugin once."""
+    app = configuration["app"]
+    finder = build_bytecode(logger, app)
+    index = build_index(logger, app)
+    manifests = build_manifests(logger, app)
+
+    # Import plugins and hooks on first use instead of up front
+    lazy = app.get("lazy", False)
+    scheduler = build_scheduler(logger, app)
+    profiler = build_profiler(app)
+    workers = build_workers(logger, app)
+    cache = build_cache(logger, app)
+    state = build_state(logger, app, full)
+
     # Process hooks
-    hooks_dir = configuration["app"]["hooks"]["directory"]
-    hooks = HookHandler(logger, hooks_dir)
+    hooks_dir = app["hooks"]["directory"]
+    hooks_batch = app["hooks"].get("batch")
+    hooks_options = app["hooks"].get("options")
+    hooks_buffers = app["hooks"].get("buffers", False)
+    hooks = HookHandler(logger, hooks_dir, index, lazy, profiler, hooks_batch, hooks_options, hooks_buffers, manifests)
+
+    # Keyword arguments passed to each plugin, keyed by plugin name
+    plugin_options = app.get("plugins")
+    # Skip or degrade the plugins depending on a failed plugin
+    on_failure = app.get("on_failure", "skip")
+
+    if app.get("pipeline", False):
+        # Processing core and users plugins in a single pass, users plugins may depend on core plugins
+        PipelineHandler(
+            logger,
+            plugin_directories(app),
+            hooks,
+            index,
+            lazy,
+            scheduler,
+            profiler,
+            workers,
+            cache,
+            state,
+            manifests,
+            plugin_options,
+            on_failure,
+        )
+    else:
+        # Processing core and users plugins
+        for type, path in plugin_directories(app).items():
+            PluginHandler(
+                logger,
+                type,
+                path,
+                hooks,
+                index,
+                lazy,
+                scheduler,
+                profiler,
+                workers,
+                cache,
+                state,
+                manifests,
+                plugin_options,
+                on_failure,
+            )
+
+    # Deliver queued hook events and release hook resources
+    close_hooks(hooks)
+
+    if workers is not None:
+        workers.close()
 
-    plugins = {
-        "core": configuration["app"]["core"]["directory"],
-        "users": configuration["app"]["users"]["directory"],
+    # Stop the workers of a coordinator
+    if hasattr(scheduler, "close"):
+        scheduler.close()
+
+    if cache is not None:
+        logger.info("Result cache: %d hits, %d misses", cache.hits, cache.misses)
+
+    if state is not None:
+        state.save()
+
+    if getattr(scheduler, "history", None) is not None:
+        scheduler.history.save()
+
+    if index is not None:
+        index.save()
+
+    if manifests is not None:
+        manifests.save()
+
+    if finder is not None:
+        logger.info("Bytecode bundle: %d hits, %d misses", finder.bundle.hits, finder.bundle.misses)
+
+    if profiler is not None:
+        report_profile(logger, profiler, app["profiler"])
+        profiler.close()
+
+
+@main.command()
+@click.option("--socket", "socket_path", default=None, help="Unix socket to listen on")
+@click.pass_obj
+def serve(obj, socket_path):
+    """Keep plugins loaded and run them on request, reloading changed plugins."""
+    logger = obj["logger"]
+    app = obj["configuration"]["app"]
+    daemon_conf = app.get("daemon", {})
+    build_bytecode(logger, app)
+    profiler = build_profiler(app)
+    workers = build_workers(logger, app)
+    daemon = PluginDaemon(
+        logger,
+        plugin_directories(app),
+        app["hooks"]["directory"],
+        socket_path or daemon_conf.get("socket", "./.cache/pluginizer.sock"),
+        build_index(logger, app),
+        app.get("lazy", False),
+        build_scheduler(logger, app),
+        profiler,
+        app["hooks"].get("batch"),
+        app["hooks"].get("options"),
+        daemon_conf.get("interval", 1.0),
+        workers,
+        app["hooks"].get("buffers", False),
+        build_cache(logger, app),
+        build_state(logger, app, obj["full"]),
+        build_manifests(logger, app),
+        app.get("plugins"),
+        app.get("pipeline", False),
+        app.get("on_failure", "skip"),
+    )
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Interrupted")
+    except FileExistsError as err:
+        raise click.ClickException(str(err))
+    finally:
+        if workers is not None:
+            workers.close()
+    if profiler is not None:
+        report_profile(logger, profiler, app["profiler"])
+        profiler.close()
+
+
+@main.command("worker")
+@click.option("--connect", "address", default=None, help="Address of the coordinator, host:port or a Unix socket")
+@click.option("--processes", type=int, default=None, help="Number of worker processes, defaults to the number of CPUs")
+@click.option("--authkey", default=None, help="Secret shared with the coordinator, defaults to PLUGINIZER_AUTHKEY")
+@click.pass_obj
+def worker(obj, address, processes, authkey):
+    """Run the plugins leased by a coordinator until it stops."""
+    scheduler_conf = obj["configuration"]["app"].get("scheduler", {})
+    address = address or scheduler_conf.get("address", "127.0.0.1:7700")
+    try:
+        authkey = get_authkey(authkey or scheduler_conf.get("authkey"))
+    except ValueError as err:
+        raise click.ClickException(str(err))
+    build_bytecode(obj["logger"], obj["configuration"]["app"])
+    run_workers(obj["logger"], address, authkey, processes)
+
+
+@main.command("request")
+@click.argument("command", type=click.Choice(["run", "reload", "status", "stop"]))
+@click.option("--socket", "socket_path", default=None, help="Unix socket of the daemon")
+@click.option("--type", "types", multiple=True, help="Only run the plugins of this type, can be repeated")
+@click.pass_obj
+def send_request(obj, command, socket_path, types):
+    """Send a command to a running daemon and print its response."""
+    daemon_conf = obj["configuration"]["app"].get("daemon", {})
+    params = {"types": list(types)} if types else {}
+    response = request(socket_path or daemon_conf.get("socket", "./.cache/pluginizer.sock"), command, **params)
+    click.echo(json.dumps(response, indent=2))
+    if response.get("status") != "ok":
+        sys.exit(1)
+
+
+@main.command("compile")
+@click.option("--output", default=None, help="Bundle file to write, defaults to the configured bytecode path")
+@click.pass_obj
+def compile_bundle(obj, output):
+    """Precompile the plugins and hooks into a bytecode bundle."""
+    app = obj["configuration"]["app"]
+    path = output or app.get("bytecode", {}).get("path", "./.cache/bytecode.zip")
+    directories = list(plugin_directories(app).values()) + [app["hooks"]["directory"]]
+    count = bytecode.compile_tree(obj["logger"], directories, path)
+    click.echo(f"Compiled {count} files into {path} ({os.path.getsize(path)} bytes)")
+
+
+@main.command("pack")
+@click.argument("source", type=click.Path(exists=True, file_okay=False))
+@click.argument("output", type=click.Path(dir_okay=False))
+@click.pass_obj
+def pack_plugins(obj, source, output):
+    """Pack the plugins of SOURCE into the OUTPUT plugin archive (.ppz)."""
+    if not output.endswith(archive.ARCHIVE_SUFFIX):
+        raise click.BadParameter(f"The archive name must end with {archive.ARCHIVE_SUFFIX}", param_hint="OUTPUT")
+    packed = archive.pack(obj["logger"], source, output)
+    click.echo(f"Packed {len(packed)} plugins into {output}")
+
+
+def read_manifests(logger, app, index, manifests):
+    """
+    Read the manifests of the plugins of every type and of the hooks, without importing them.
+
+    Returns:
+        tuple: The plugin manifests keyed by type then module name, the hook names, and the
+        manifests that could not be read, as ``(type, module name, error)`` tuples.
+    """
+    errors = []
+    hook_manager = HookManager(logger, index)
+    hooks = sorted(hook_manager.discover(app["hooks"]["directory"]) or {})
+    plugins = {}
+    for plugin_type, path in plugin_directories(app).items():
+        plugins[plugin_type] = {}
+        for module_name, module_path in PluginManager(logger, index=index).discover(path).items():
+            try:
+                plugins[plugin_type][module_name] = get_manifest(module_path, "plugin", manifests)
+            except (PluginManifestError, OSError, SyntaxError) as err:
+                errors.append((plugin_type, module_name, str(err)))
+    for hook, hook_path in hook_manager.discovered_hooks.items():
+        try:
+            get_manifest(hook_path, "hook", manifests)
+        except (PluginManifestError, OSError, SyntaxError) as err:
+            errors.append(("hooks", hook, str(err)))
+    if index is not None:
+        index.save()
+    if manifests is not None:
+        manifests.save()
+    return plugins, hooks, errors
+
+
+def plan_groups(app, plugins):
+    """
+    Group the manifests of the plugins planned together, like they are run.
+
+    Returns:
+        dict: The manifests of each group of plugin types, keyed by module name, or by
+        ``type/module name`` when the plugins of every type run in one graph.
+    """
+    if not app.get("pipeline", False):
+        return plugins
+    return {
+        "+".join(plugins): {
+            f"{plugin_type}/{module_name}": manifest
+            for plugin_type, manifests in plugins.items()
+            for module_name, manifest in manifests.items()
+        }
     }
 
-    # Processing core and users plugins
-    for type, path in plugins.items():
-        PluginHandler(logger, type, path, hooks)
+
+@main.group("plugins")
+@click.pass_obj
+def plugins_group(obj):
+    """List, plan and validate plugins from their manifests, without importing them."""
+    app = obj["configuration"]["app"]
+    logger = obj["logger"]
+    obj["manifests"] = read_manifests(logger, app, build_index(logger, app), build_manifests(logger, app))
+
+
+@plugins_group.command("list")
+@click.pass_obj
+def plugins_list(obj):
+    """Print the manifest of every plugin."""
+    plugins, _hooks, errors = obj["manifests"]
+    click.echo(json.dumps(plugins, indent=2))
+    for plugin_type, module_name, error in errors:
+        click.echo(f"{plugin_type}/{module_name}: {error}", err=True)
+
+
+@plugins_group.command("plan")
+@click.pass_obj
+def plugins_plan(obj):
+    """Print the execution levels of the plugins of every type."""
+    plugins, _hooks, _errors = obj["manifests"]
+    for plugin_type, manifests in plan_groups(obj["configuration"]["app"], plugins).items():
+        levels, _problems = plan_manifests(manifests)
+        click.echo(f"{plugin_type}:")
+        for position, level in enumerate(levels):
+            click.echo(f"  {position}: {', '.join(level)}")
+
+
+@plugins_group.command("validate")
+@click.pass_obj
+def plugins_validate(obj):
+    """Check the manifests, dependencies and hooks of every plugin."""
+    plugins, hooks, errors = obj["manifests"]
+    problems = [f"{plugin_type}/{module_name}: {error}" for plugin_type, module_name, error in errors]
+    for plugin_type, manifests in plan_groups(obj["configuration"]["app"], plugins).items():
+        _levels, type_problems = plan_manifests(manifests, hooks)
+        problems.extend(f"{plugin_type}/{problem}" for problem in type_problems)
+    for problem in problems:
+        click.echo(problem)
+    if problems:
+        sys.exit(1)
+    click.echo("All plugins are valid")
+
+
+@main.group("cache")
+@click.pass_obj
+def cache_group(obj):
+    """Inspect and invalidate the result cache."""
+    cache = build_cache(obj["logger"], obj["configuration"]["app"])
+    if cache is None:
+        raise click.ClickException("No result cache is configured")
+    obj["cache"] = cache
+
+
+@cache_group.command("info")
+@click.pass_obj
+def cache_info(obj):
+    """Print the number and size of the cached results."""
+    click.echo(json.dumps(obj["cache"].info(), indent=2))
+
+
+@cache_group.command("clear")
+@click.pass_obj
+def cache_clear(obj):
+    """Remove every cached result."""
+    click.echo(f"Removed {obj['cache'].clear()} cached results")
+
+
+@cache_group.command("invalidate")
+@click.argument("plugins", nargs=-1, required=True)
+@click.pass_obj
+def cache_invalidate(obj, plugins):
+    """Remove the cached results of PLUGINS."""
+    for plugin in plugins:
+        click.echo(f"Removed {obj['cache'].invalidate(plugin)} cached results of {plugin}")
 
 
 if __name__ == "__main__":
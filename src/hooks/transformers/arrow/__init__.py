@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+import os
+
+from src.hooks.transformers.arrow.hook import ArrowExporter
+
+
+def get_version():
+    with open(os.path.join(os.path.abspath(os.path.dirname(__file__)), "./VERSION")) as f:
+        return f.read().strip()
+
+
+__version__ = get_version()
+
+
+__all__ = ["__version__", "ArrowExporter"]
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+import os
+import threading
+
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+class ArrowExporter:
+    """
+    Writes plugin results to a columnar Arrow IPC stream or Parquet file.
+
+    Results must be flat mappings. They are buffered up to ``batch_rows`` rows and written as
+    one record batch, or one Parquet row group, so memory use is bounded by the batch size.
+    The schema is inferred from the first batch. Requires pyarrow, the export is disabled if
+    it is not installed.
+    """
+
+    FORMATS = ("ipc", "parquet")
+
+    def __init__(self, logger, **kwargs):
+        self.logger = logger
+        self.path = None
+        self.format = "parquet"
+        self.compression = None
+        self.batch_rows = 10000
+        # Assign each value from kwargs to an instance variable
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+        self.rows = []
+        self.schema = None
+        self.writer = None
+        self.lock = threading.Lock()
+        self.records = 0
+
+        if self.path is not None and pyarrow is None:
+            self.logger.error("ArrowExporter export disabled: pyarrow is not installed")
+            self.path = None
+        elif self.path is not None and self.format not in self.FORMATS:
+            self.logger.error("ArrowExporter export disabled: unknown format %s", self.format)
+            self.path = None
+
+    def trigger(self, event=None):
+        if event is None:
+            self.logger.info("Executing ArrowExporter hook...")
+            return
+        self.write([event])
+
+    def trigger_batch(self, events):
+        self.logger.info("Executing ArrowExporter hook for %d events...", len(events))
+        self.write([event for event in events if event is not None])
+
+    def write(self, events):
+        """
+        Buffer results, writing a record batch once ``batch_rows`` rows are buffered.
+
+        Args:
+            events (list): The results to write, as flat mappings.
+        """
+        if not events or self.path is None:
+            return
+        with self.lock:
+            self.rows.extend(events)
+            if len(self.rows) >= self.batch_rows:
+                self.write_batch()
+
+    def write_batch(self):
+        """Write the buffered rows as one record batch, the lock must be held."""
+        if not self.rows:
+            return
+        table = pyarrow.Table.from_pylist(self.rows, schema=self.schema)
+        if self.writer is None:
+            self.schema = table.schema
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            if self.format == "parquet":
+                self.writer = pyarrow.parquet.ParquetWriter(
+                    self.path, self.schema, compression=self.compression or "snappy"
+                )
+            else:
+                options = pyarrow.ipc.IpcWriteOptions(compression=self.compression)
+                self.writer = pyarrow.ipc.new_stream(self.path, self.schema, options=options)
+            self.logger.info("Exporting results to %s", self.path)
+        self.writer.write_table(table)
+        self.records += len(self.rows)
+        self.rows = []
+
+    def flush(self):
+        """Write the buffered rows."""
+        with self.lock:
+            self.write_batch()
+
+    def close(self):
+        """Write the buffered rows and close the output file."""
+        with self.lock:
+            self.write_batch()
+            if self.writer is None:
+                return
+            self.writer.close()
+            self.writer = None
+            self.logger.info("Exported %d results to %s", self.records, self.path)
@@ -1,10 +1,33 @@
 # -*- coding: utf-8 -*-
-class JsonExporter:
+from src.lib.export import StreamExporter
+from src.lib.serializers import get_serializer
+
+
+class JsonExporter(StreamExporter):
+    """
+    Streams plugin results to a JSON Lines file.
+
+    Results are encoded with the fastest installed JSON library (orjson, msgspec, then the
+    standard library), unless the ``serializer`` option names one.
+    """
+
     def __init__(self, logger, **kwargs):
-        self.logger = logger
-        # Assign each value from kwargs to an instance variable
-        for key, value in kwargs.items():
-            setattr(self, key, value)
+        self.serializer = None
+        super().__init__(logger, **kwargs)
+        try:
+            self.serializer = get_serializer("json", self.serializer)
+        except ImportError as err:
+            self.disable(str(err))
+
+    def trigger(self, event=None):
+        if event is None:
+            self.logger.info("Executing JsonExporter hook...")
+            return
+        self.write([event])
+
+    def trigger_batch(self, events):
+        self.logger.info("Executing JsonExporter hook for %d events...", len(events))
+        self.write([event for event in events if event is not None])
 
-    def trigger(self):
-        self.logger.info("Executing JsonExporter hook...")
+    def encode(self, event):
+        return self.serializer.dumps(event) + b"\n"
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from src.lib.export import StreamExporter
+from src.lib.serializers import get_serializer
+
+
+class MsgpackExporter(StreamExporter):
+    """
+    Streams plugin results to a file of concatenated MessagePack objects.
+
+    Requires msgspec or msgpack, the export is disabled if neither is installed. The file can
+    be read back incrementally with ``msgpack.Unpacker``.
+    """
+
+    def __init__(self, logger, **kwargs):
+        self.serializer = None
+        super().__init__(logger, **kwargs)
+        try:
+            self.serializer = get_serializer("msgpack", self.serializer)
+        except ImportError as err:
+            self.disable(str(err))
+
+    def trigger(self, event=None):
+        if event is None:
+            self.logger.info("Executing MsgpackExporter hook...")
+            return
+        self.write([event])
+
+    def trigger_batch(self, events):
+        self.logger.info("Executing MsgpackExporter hook for %d events...", len(events))
+        self.write([event for event in events if event is not None])
+
+    def encode(self, event):
+        return self.serializer.dumps(event)
@@ -0,0 +1,347 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import importlib
+import importlib.abc
+import importlib.util
+import mmap
+import os
+import struct
+import sys
+import threading
+import types
+import zipfile
+import zlib
+
+from src.lib import bytecode
+from src.lib.manifest import read_manifest
+
+
+# Extension of plugin archives, found in the plugin directories
+ARCHIVE_SUFFIX = ".ppz"
+
+# Package under which the modules of archived plugins are imported
+PACKAGE_PREFIX = "_pluginizer_archives"
+
+# Open archives, keyed by absolute path
+OPEN_ARCHIVES = {}
+
+# Open archives, keyed by package name
+PACKAGES = {}
+
+LOCK = threading.Lock()
+
+
+def open_archive(logger, path):
+    """
+    Open a plugin archive, reusing the open archive until its file changes.
+
+    Args:
+        logger (Logger): The logger to use for logging.
+        path (str): The archive file.
+
+    Returns:
+        PluginArchive: The open archive.
+
+    Raises:
+        OSError: If the archive cannot be read.
+        ValueError: If the file is not a plugin archive.
+    """
+    key = os.path.abspath(path)
+    st = os.stat(key)
+    signature = (st.st_ino, st.st_mtime_ns, st.st_size)
+    with LOCK:
+        archive = OPEN_ARCHIVES.get(key)
+        if archive is not None and archive.signature == signature:
+            return archive
+        if archive is not None:
+            archive.close()
+        archive = PluginArchive(logger, key, signature)
+        OPEN_ARCHIVES[key] = archive
+        PACKAGES[archive.package] = archive
+        return archive
+
+
+def find_archive(path):
+    """
+    Find the open archive a path points into.
+
+    Args:
+        path (str): A path like ``plugins/bundle.ppz/plugin1/__init__.py``.
+
+    Returns:
+        tuple: The archive and the member path inside it, or None if the path is not in an open archive.
+    """
+    path = os.path.abspath(path)
+    for key, archive in list(OPEN_ARCHIVES.items()):
+        if path.startswith(key + os.sep):
+            return archive, path[len(key) + 1 :].replace(os.sep, "/")
+    return None
+
+
+def pack(logger, plugin_folder, path):
+    """
+    Pack the plugins of a folder into an archive.
+
+    Args:
+        logger (Logger): The logger to use for logging.
+        plugin_folder (str): The folder containing the plugins.
+        path (str): The archive file to write.
+
+    Returns:
+        list: The names of the packed plugins.
+    """
+    packed = []
+    tmp_path = path + ".tmp"
+    # Stored uncompressed, members are read straight from the mapped file
+    with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_STORED) as archive:
+        for module_path, dirs, files in os.walk(plugin_folder):
+            dirs[:] = sorted(name for name in dirs if name != "__pycache__")
+            if "plugin.py" not in files or "IGNORE" in files:
+                continue
+            for root, subdirs, subfiles in os.walk(module_path):
+                subdirs[:] = sorted(name for name in subdirs if name != "__pycache__")
+                for file_name in sorted(subfiles):
+                    if file_name.endswith(".pyc"):
+                        continue
+                    file_path = os.path.join(root, file_name)
+                    archive.write(file_path, os.path.relpath(file_path, plugin_folder).replace(os.sep, "/"))
+            packed.append(os.path.basename(module_path))
+            # Plugins do not contain other plugins
+            dirs[:] = []
+    os.replace(tmp_path, path)
+    logger.info("Packed %d plugins into %s", len(packed), path)
+    return packed
+
+
+class PluginArchive:
+    """
+    A single file holding many plugins, opened once and memory mapped.
+
+    The archive is a zip file of plugin directories. Plugins are discovered from its central
+    index and imported from the mapped file, so they cost no file system access once it is
+    open. The ``__init__.py`` of archived plugins is not run: their version and classes come
+    from their manifest, and their modules are imported under a package of the archive.
+    """
+
+    def __init__(self, logger, path, signature=None):
+        """
+        Initialize the PluginArchive instance.
+
+        Args:
+            logger (Logger): The logger to use for logging.
+            path (str): The absolute path of the archive file.
+            signature (tuple, optional): The inode, modification time and size of the file.
+
+        Raises:
+            OSError: If the archive cannot be read.
+            ValueError: If the file is not a plugin archive.
+        """
+        self.logger = logger
+        self.path = path
+        self.signature = signature
+        self.package = f"{PACKAGE_PREFIX}.a{hashlib.sha1(path.encode('utf-8')).hexdigest()[:12]}"
+        self.manifests = {}
+        self.file = open(path, "rb")
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            # Only the central index is read, members are sliced from the mapping
+            with zipfile.ZipFile(self.map) as index:
+                self.members = {info.filename: info for info in index.infolist()}
+        except (ValueError, zipfile.BadZipFile) as err:
+            self.file.close()
+            raise ValueError(f"{path} is not a plugin archive: {err}") from err
+        self.plugins = {}
+        for name in self.members:
+            directory, _sep, file_name = name.rpartition("/")
+            if file_name == "plugin.py" and directory and directory + "/IGNORE" not in self.members:
+                self.plugins[directory.rpartition("/")[2]] = directory
+        self.logger.debug("Opened plugin archive %s with %d plugins", path, len(self.plugins))
+
+    def directory(self, module_name):
+        """Return the path of an archived plugin directory, under the archive path."""
+        return os.path.join(self.path, *self.plugins[module_name].split("/"))
+
+    def read(self, member):
+        """
+        Read a member of the archive.
+
+        Args:
+            member (str): The member path, like ``plugin1/plugin.py``.
+
+        Returns:
+            bytes: The content of the member, or None if it does not exist.
+
+        Raises:
+            ValueError: If the member is compressed with another method than deflate.
+        """
+        info = self.members.get(member)
+        if info is None:
+            return None
+        # The data follows the local header, whose file name and extra field lengths may
+        # differ from the central index
+        offset = info.header_offset
+        name_length, extra_length = struct.unpack("<HH", self.map[offset + 26 : offset + 30])
+        start = offset + 30 + name_length + extra_length
+        data = self.map[start : start + info.compress_size]
+        if info.compress_type == zipfile.ZIP_DEFLATED:
+            return zlib.decompress(data, -zlib.MAX_WBITS)
+        if info.compress_type != zipfile.ZIP_STORED:
+            raise ValueError(f"{self.path}: unsupported compression of {member}")
+        return data
+
+    def reader(self, directory):
+        """Build a function reading the files of an archived directory, see ``manifest.file_reader``."""
+
+        def read(file_name):
+            data = self.read(f"{directory}/{file_name}")
+            return data.decode("utf-8") if data is not None else None
+
+        return read
+
+    def files(self, directory):
+        """
+        List the files of an archived directory.
+
+        Args:
+            directory (str): The member path of the directory.
+
+        Returns:
+            tuple: The sorted ``(relative path, CRC, size)`` tuples, like ``cache.tree_signature``.
+        """
+        prefix = directory.rstrip("/") + "/"
+        return tuple(
+            sorted(
+                (name[len(prefix) :], info.CRC, info.file_size)
+                for name, info in self.members.items()
+                if name.startswith(prefix) and not name.endswith("/")
+            )
+        )
+
+    def manifest(self, directory):
+        """
+        Return the manifest of an archived plugin, compiled once.
+
+        Args:
+            directory (str): The member path of the plugin directory.
+
+        Returns:
+            dict: The manifest, see ``manifest.read_manifest``.
+        """
+        if directory not in self.manifests:
+            path = os.path.join(self.path, *directory.split("/"))
+            self.manifests[directory] = read_manifest(path, "plugin", self.reader(directory), ["plugin.py"])
+        return self.manifests[directory]
+
+    def load(self, module_name):
+        """
+        Import an archived plugin.
+
+        Args:
+            module_name (str): The name of the plugin module.
+
+        Returns:
+            module: The plugin package, with its ``__version__`` and the classes listed in its manifest.
+        """
+        fullname = f"{self.package}.{module_name}"
+        module = sys.modules.get(fullname)
+        if module is not None:
+            return module
+        install()
+        for parent in (PACKAGE_PREFIX, self.package):
+            if parent not in sys.modules:
+                package = types.ModuleType(parent)
+                package.__path__ = []
+                sys.modules[parent] = package
+        return importlib.import_module(fullname)
+
+    def close(self):
+        """Close the archive, its modules are imported again from the new file."""
+        PACKAGES.pop(self.package, None)
+        for name in [name for name in sys.modules if name.startswith(self.package + ".")]:
+            del sys.modules[name]
+        self.map.close()
+        self.file.close()
+
+
+class ArchiveLoader(importlib.abc.InspectLoader):
+    """Imports a module from a plugin archive."""
+
+    def __init__(self, archive, member, plugin_directory=None):
+        """
+        Initialize the ArchiveLoader instance.
+
+        Args:
+            archive (PluginArchive): The archive holding the module.
+            member (str): The member path of the module source, or of the ``__init__.py`` of a package.
+            plugin_directory (str, optional): The member path of the plugin directory, for the
+                package of a plugin, whose ``__init__.py`` is replaced by its manifest.
+        """
+        self.archive = archive
+        self.member = member
+        self.plugin_directory = plugin_directory
+
+    def is_package(self, fullname):
+        return self.plugin_directory is not None or self.member.endswith("/__init__.py")
+
+    def get_source(self, fullname):
+        data = self.archive.read(self.member)
+        return data.decode("utf-8") if data is not None else None
+
+    def get_code(self, fullname):
+        if self.plugin_directory is not None:
+            return None
+        source = self.archive.read(self.member)
+        origin = os.path.join(self.archive.path, *self.member.split("/"))
+        if bytecode.BUNDLE is not None:
+            code = bytecode.BUNDLE.bundle.code(source, origin)
+            if code is not None:
+                return code
+        return compile(source, origin, "exec", dont_inherit=True)
+
+    def exec_module(self, module):
+        if self.plugin_directory is None:
+            exec(self.get_code(module.__name__), module.__dict__)
+            return
+        manifest = self.archive.manifest(self.plugin_directory)
+        module.__version__ = manifest["version"]
+        plugin = importlib.import_module(module.__name__ + ".plugin")
+        for class_name in manifest["classes"]:
+            setattr(module, class_name, getattr(plugin, class_name))
+
+
+class ArchiveFinder:
+    """A meta path finder importing the modules of the open plugin archives."""
+
+    @staticmethod
+    def find_spec(fullname, path=None, target=None):
+        if not fullname.startswith(PACKAGE_PREFIX + "."):
+            return None
+        parts = fullname.split(".")
+        archive = PACKAGES.get(".".join(parts[:2]))
+        if archive is None or len(parts) < 3 or parts[2] not in archive.plugins:
+            return None
+        directory = archive.plugins[parts[2]]
+        if len(parts) == 3:
+            loader = ArchiveLoader(archive, f"{directory}/__init__.py", directory)
+            member = loader.member
+        else:
+            member = "/".join([directory] + parts[3:])
+            if f"{member}/__init__.py" in archive.members:
+                member = f"{member}/__init__.py"
+            elif f"{member}.py" in archive.members:
+                member = f"{member}.py"
+            else:
+                return None
+            loader = ArchiveLoader(archive, member)
+        origin = os.path.join(archive.path, *member.split("/"))
+        spec = importlib.util.spec_from_loader(fullname, loader, origin=origin)
+        spec.has_location = True
+        if loader.is_package(fullname):
+            spec.submodule_search_locations = [os.path.dirname(origin)]
+        return spec
+
+
+def install():
+    """Add the archive finder to the import system, once."""
+    if ArchiveFinder not in sys.meta_path:
+        sys.meta_path.insert(0, ArchiveFinder)
@@ -0,0 +1,400 @@
+# -*- coding: utf-8 -*-
+import itertools
+import os
+import sys
+import threading
+
+from multiprocessing import resource_tracker, shared_memory
+
+
+# Name of the hooks entry holding the result buffers
+BUFFERS_HOOK = "buffers"
+
+# Numbers the segments created by this process
+SEGMENT_COUNTER = itertools.count()
+
+
+def attach(segment):
+    """
+    Attach to an existing shared memory segment without tracking it.
+
+    The segment is owned by the process that created it. Before Python 3.13 attaching
+    registers the segment with the resource tracker again, which is harmless as long as
+    worker processes share the tracker of their parent, see ``share_tracker``.
+
+    Args:
+        segment (str): The name of the segment.
+
+    Returns:
+        SharedMemory: The attached segment.
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(segment, track=False)
+    return shared_memory.SharedMemory(segment)
+
+
+def share_tracker():
+    """Start the resource tracker, so worker processes started afterwards share it."""
+    resource_tracker.ensure_running()
+
+
+def release_views(views):
+    """
+    Release memoryviews of a segment, so its mapping can be closed.
+
+    Returns:
+        bool: True if every view was released, False if one is still exported (by a NumPy
+        array for instance) and the mapping must stay open.
+    """
+    released = True
+    for view in views:
+        try:
+            view.release()
+        except BufferError:
+            released = False
+    return released
+
+
+class BufferRef:
+    """A reference to a named result buffer, sent between processes instead of its content."""
+
+    def __init__(self, name):
+        """
+        Initialize the BufferRef instance.
+
+        Args:
+            name (str): The name of the buffer.
+        """
+        self.name = name
+
+    def __repr__(self):
+        return f"<BufferRef {self.name}>"
+
+
+class Segment:
+    """A shared memory segment holding one published buffer."""
+
+    def __init__(self, name, shm, size):
+        self.name = name
+        self.shm = shm
+        self.size = size
+        self.refs = 1
+        self.views = []
+
+
+class ResultBuffers:
+    """
+    Named shared memory buffers passed between plugins and hooks without copying.
+
+    A plugin publishes a buffer under a name, dependents and hooks open it by name and get
+    a ``memoryview`` of the same memory, in this process or in an isolated worker process.
+    Each buffer is reference counted: the publisher holds a reference until the end of the
+    run and each ``open`` holds one until the matching ``release``. The segment is freed when
+    the last reference is dropped, and at the latest at the end of the run. It is injected in
+    the hooks of every plugin as ``buffers``.
+    """
+
+    def __init__(self, logger):
+        """
+        Initialize the ResultBuffers instance.
+
+        Args:
+            logger (Logger): The logger to use for logging.
+        """
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.segments = {}
+        self.names = {}
+        self.opened = {}
+        self.held = []
+
+    def create(self, name, size):
+        """
+        Create the segment of a buffer, replacing a previous buffer with the same name.
+
+        Args:
+            name (str): The name of the buffer.
+            size (int): The size of the buffer in bytes.
+
+        Returns:
+            str: The name of the shared memory segment.
+        """
+        # Short segment names, macOS limits them to 31 characters
+        segment_name = f"ppz_{os.getpid()}_{next(SEGMENT_COUNTER)}"
+        shm = shared_memory.SharedMemory(segment_name, create=True, size=max(size, 1))
+        with self.lock:
+            previous = self.names.get(name)
+            self.segments[segment_name] = Segment(name, shm, size)
+            self.names[name] = segment_name
+        if previous is not None:
+            self.drop(previous)
+        self.logger.debug("Published buffer %s (%d bytes)", name, size)
+        return segment_name
+
+    def publish(self, name, data=None, size=None):
+        """
+        Publish a buffer.
+
+        Args:
+            name (str): The name of the buffer.
+            data (bytes-like, optional): The content of the buffer, copied once into shared memory.
+            size (int, optional): The size of the buffer, to fill it in place instead of passing ``data``.
+
+        Returns:
+            memoryview: A writable view of the buffer.
+        """
+        if data is not None:
+            data = memoryview(data).cast("B")
+            size = data.nbytes
+        segment_name = self.create(name, size or 0)
+        with self.lock:
+            segment = self.segments[segment_name]
+            view = segment.shm.buf[: segment.size]
+            segment.views.append(view)
+        if data is not None:
+            view[:] = data
+        return view
+
+    def acquire(self, name):
+        """
+        Take a reference to a buffer.
+
+        Args:
+            name (str): The name of the buffer.
+
+        Returns:
+            tuple: The name of its shared memory segment and its size.
+
+        Raises:
+            KeyError: If no buffer is published under this name.
+        """
+        with self.lock:
+            segment_name = self.names[name]
+            segment = self.segments[segment_name]
+            segment.refs += 1
+            return segment_name, segment.size
+
+    def open(self, name):
+        """
+        Open a published buffer, call ``release`` once done with it.
+
+        Args:
+            name (str): The name of the buffer.
+
+        Returns:
+            memoryview: A read-only view of the buffer.
+
+        Raises:
+            KeyError: If no buffer is published under this name.
+        """
+        segment_name, size = self.acquire(name)
+        with self.lock:
+            self.opened.setdefault(name, []).append(segment_name)
+        return self.view(segment_name, size)
+
+    def view(self, segment_name, size):
+        """Return a read-only view of a segment, released when the segment is freed."""
+        with self.lock:
+            segment = self.segments[segment_name]
+            view = segment.shm.buf[:size].toreadonly()
+            segment.views.append(view)
+        return view
+
+    def release(self, name):
+        """
+        Drop a reference taken by ``open``, to the oldest segment opened under this name.
+
+        The buffer may have been published again since it was opened, the reference is kept
+        on the segment opened rather than on the current one.
+
+        Args:
+            name (str): The name of the buffer.
+        """
+        with self.lock:
+            opened = self.opened.get(name)
+            if not opened:
+                return
+            segment_name = opened.pop(0)
+            if not opened:
+                del self.opened[name]
+        self.drop(segment_name)
+
+    def drop(self, segment_name):
+        """Drop a reference to a segment, and free it once unreferenced."""
+        with self.lock:
+            segment = self.segments.get(segment_name)
+            if segment is None:
+                return
+            segment.refs -= 1
+            if segment.refs > 0:
+                return
+            del self.segments[segment_name]
+            if self.names.get(segment.name) == segment_name:
+                del self.names[segment.name]
+        self.free(segment)
+
+    def free(self, segment):
+        """Unmap and unlink a segment."""
+        self.logger.debug("Freeing buffer %s", segment.name)
+        if release_views(segment.views):
+            segment.shm.close()
+        else:
+            self.logger.warning("Buffer %s is still in use, its memory is freed at exit", segment.name)
+        segment.shm.unlink()
+
+    def hold(self, name):
+        """
+        Open a buffer until the end of the run, for a hook triggered on behalf of an isolated plugin.
+
+        Args:
+            name (str): The name of the buffer.
+
+        Returns:
+            memoryview: A read-only view of the buffer.
+        """
+        segment_name, size = self.acquire(name)
+        with self.lock:
+            self.held.append(segment_name)
+        return self.view(segment_name, size)
+
+    def resolve(self, value):
+        """Replace a buffer reference by a view of the buffer, held until the end of the run."""
+        if isinstance(value, BufferRef):
+            return self.hold(value.name)
+        return value
+
+    def exists(self, name):
+        """
+        Tell if a buffer is published under a name.
+
+        Args:
+            name (str): The name of the buffer.
+
+        Returns:
+            bool: True if the buffer exists.
+        """
+        with self.lock:
+            return name in self.names
+
+    def close(self):
+        """
+        End the run: free every segment, including the buffers still opened.
+
+        Their views are released, and a later ``release`` does nothing.
+        """
+        with self.lock:
+            segments = list(self.segments.values())
+            self.segments = {}
+            self.names = {}
+            self.opened = {}
+            self.held = []
+        for segment in segments:
+            self.free(segment)
+
+
+# Methods of ResultBuffers that worker processes may call
+REMOTE_METHODS = ("create", "acquire", "drop", "exists")
+
+
+class RemoteBuffers:
+    """
+    The result buffers of an isolated plugin, in a worker process.
+
+    Segments are created and reference counted by the ``ResultBuffers`` of the pool process,
+    and mapped into the worker so their content is never copied through the pipe. Each
+    segment is mapped once, for as long as it is published or opened by the plugin. Views
+    passed to hook triggers are sent as ``BufferRef``.
+    """
+
+    def __init__(self, call):
+        """
+        Initialize the RemoteBuffers instance.
+
+        Args:
+            call (callable): Calls a method of the ``ResultBuffers`` of the pool process and
+                returns its result, as ``call(method, *args)``.
+        """
+        self.call = call
+        self.mapped = {}
+        self.published = {}
+        self.opened = {}
+
+    def map(self, name, segment_name, size, readonly):
+        """Map a segment into this process, or take another reference to its mapping."""
+        mapped = self.mapped.get(segment_name)
+        if mapped is None:
+            mapped = self.mapped[segment_name] = [name, attach(segment_name), [], 0]
+        _name, shm, views, _refs = mapped
+        view = shm.buf[:size]
+        if readonly:
+            view = view.toreadonly()
+        views.append(view)
+        mapped[3] += 1
+        return view
+
+    def publish(self, name, data=None, size=None):
+        """Publish a buffer, see ``ResultBuffers.publish``."""
+        if data is not None:
+            data = memoryview(data).cast("B")
+            size = data.nbytes
+        size = size or 0
+        segment_name = self.call("create", name, size)
+        previous = self.published.pop(name, None)
+        if previous is not None:
+            self.unmap(previous)
+        self.published[name] = segment_name
+        view = self.map(name, segment_name, size, False)
+        if data is not None:
+            view[:] = data
+        return view
+
+    def open(self, name):
+        """Open a published buffer, see ``ResultBuffers.open``."""
+        segment_name, size = self.call("acquire", name)
+        self.opened.setdefault(name, []).append(segment_name)
+        return self.map(name, segment_name, size, True)
+
+    def release(self, name):
+        """Drop a reference taken by ``open``, see ``ResultBuffers.release``."""
+        opened = self.opened.get(name)
+        if not opened:
+            return
+        segment_name = opened.pop(0)
+        if not opened:
+            del self.opened[name]
+        self.unmap(segment_name)
+        self.call("drop", segment_name)
+
+    def unmap(self, segment_name):
+        """Drop a reference to the mapping of a segment, and unmap it once unreferenced."""
+        mapped = self.mapped.get(segment_name)
+        if mapped is None:
+            return
+        mapped[3] -= 1
+        if mapped[3] > 0:
+            return
+        del self.mapped[segment_name]
+        _name, shm, views, _refs = mapped
+        if release_views(views):
+            shm.close()
+
+    def ref(self, value):
+        """Replace a view of a mapped buffer by a reference to it."""
+        if isinstance(value, memoryview):
+            for name, shm, _views, _refs in self.mapped.values():
+                if value.obj is shm.buf.obj:
+                    return BufferRef(name)
+        return value
+
+    def exists(self, name):
+        """Tell if a buffer is published under a name."""
+        return self.call("exists", name)
+
+    def close(self):
+        """Unmap every segment, at the end of a task."""
+        for _name, shm, views, _refs in self.mapped.values():
+            if release_views(views):
+                shm.close()
+        self.mapped = {}
+        self.published = {}
+        self.opened = {}
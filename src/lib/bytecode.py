@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import importlib.machinery
+import importlib.util
+import marshal
+import os
+import sys
+import threading
+import types
+import zipfile
+
+
+# Entry of a bundle holding the bytecode magic number of the python that built it
+MAGIC_ENTRY = "MAGIC"
+
+# The installed bundle, see ``install``
+BUNDLE = None
+
+
+def compile_tree(logger, directories, path):
+    """
+    Compile every python file of directory trees into a bytecode bundle.
+
+    The bundle is a zip file holding the marshalled code of each source file, keyed by the
+    SHA-256 of the source. It does not depend on where the sources are, so it can be built
+    once and shipped with them to read-only or containerized deployments.
+
+    Args:
+        logger (Logger): The logger to use for logging.
+        directories (list): The directories to compile.
+        path (str): The bundle file to write.
+
+    Returns:
+        int: The number of files compiled.
+    """
+    entries = {}
+    for directory in directories:
+        for root, dirs, files in os.walk(directory):
+            dirs[:] = sorted(name for name in dirs if name != "__pycache__")
+            for file_name in sorted(files):
+                if not file_name.endswith(".py"):
+                    continue
+                file_path = os.path.join(root, file_name)
+                with open(file_path, "rb") as f:
+                    source = f.read()
+                try:
+                    code = compile(source, file_path, "exec", dont_inherit=True)
+                except SyntaxError as err:
+                    logger.error("Cannot compile %s: %s", file_path, err)
+                    continue
+                entries[hashlib.sha256(source).hexdigest()] = marshal.dumps(code)
+                logger.debug("Compiled %s", file_path)
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + ".tmp"
+    # Stored uncompressed, entries are read without inflating them
+    with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_STORED) as bundle:
+        bundle.writestr(MAGIC_ENTRY, importlib.util.MAGIC_NUMBER)
+        for key in sorted(entries):
+            bundle.writestr(key, entries[key])
+    os.replace(tmp_path, path)
+    logger.info("Compiled %d files into %s", len(entries), path)
+    return len(entries)
+
+
+def with_filename(code, path):
+    """
+    Set the file name of a code object and of the functions and classes it defines.
+
+    Args:
+        code (code): The code object.
+        path (str): The file name.
+
+    Returns:
+        code: A copy of the code object.
+    """
+    consts = tuple(
+        with_filename(const, path) if isinstance(const, types.CodeType) else const for const in code.co_consts
+    )
+    return code.replace(co_filename=path, co_consts=consts)
+
+
+class BytecodeBundle:
+    """A bytecode bundle written by ``compile_tree``, read to import modules without compiling them."""
+
+    def __init__(self, logger, path):
+        """
+        Initialize the BytecodeBundle instance.
+
+        Args:
+            logger (Logger): The logger to use for logging.
+            path (str): The bundle file.
+
+        Raises:
+            OSError: If the bundle cannot be read.
+            ValueError: If the bundle is not a zip file or was built by another python version.
+        """
+        self.logger = logger
+        self.path = path
+        self.lock = threading.Lock()
+        try:
+            self.zip = zipfile.ZipFile(path)
+        except zipfile.BadZipFile as err:
+            raise ValueError(f"{path} is not a bytecode bundle: {err}") from err
+        self.keys = set(self.zip.namelist())
+        if MAGIC_ENTRY not in self.keys or self.zip.read(MAGIC_ENTRY) != importlib.util.MAGIC_NUMBER:
+            self.zip.close()
+            raise ValueError(f"{path} was built by another python version")
+        self.hits = 0
+        self.misses = 0
+
+    def code(self, source, path):
+        """
+        Return the compiled code of a source file.
+
+        Args:
+            source (bytes): The content of the source file.
+            path (str): The path of the source file, set as the file name of the code.
+
+        Returns:
+            code: The code object, or None if the source is not in the bundle.
+        """
+        key = hashlib.sha256(source).hexdigest()
+        if key not in self.keys:
+            self.misses += 1
+            self.logger.debug("%s is not in the bytecode bundle", path)
+            return None
+        with self.lock:
+            data = self.zip.read(key)
+        code = marshal.loads(data)
+        # Tracebacks point to the source, wherever the bundle was built
+        code = with_filename(code, path)
+        self.hits += 1
+        return code
+
+    def close(self):
+        """Close the bundle file."""
+        self.zip.close()
+
+
+class BundleLoader(importlib.machinery.SourceFileLoader):
+    """A source file loader taking the code from a bytecode bundle when the source is in it."""
+
+    def __init__(self, fullname, path, bundle):
+        super().__init__(fullname, path)
+        self.bundle = bundle
+
+    def get_code(self, fullname):
+        path = self.get_filename(fullname)
+        code = self.bundle.code(self.get_data(path), path)
+        if code is None:
+            return super().get_code(fullname)
+        return code
+
+
+class BundleFinder:
+    """
+    A meta path finder importing the modules of the bundled directories with a ``BundleLoader``.
+
+    It sits right before the path finder and returns its specs, only replacing their loader.
+    """
+
+    def __init__(self, bundle, roots):
+        """
+        Initialize the BundleFinder instance.
+
+        Args:
+            bundle (BytecodeBundle): The bundle to take the code from.
+            roots (list): The directories whose modules are taken from the bundle.
+        """
+        self.bundle = bundle
+        self.roots = tuple(os.path.abspath(root) + os.sep for root in roots)
+
+    def covers(self, path):
+        """Tell if a source file is in one of the bundled directories."""
+        return path.endswith(".py") and os.path.abspath(path).startswith(self.roots)
+
+    def find_spec(self, fullname, path=None, target=None):
+        spec = importlib.machinery.PathFinder.find_spec(fullname, path, target)
+        if (
+            spec is not None
+            and spec.origin is not None
+            and type(spec.loader) is importlib.machinery.SourceFileLoader
+            and self.covers(spec.origin)
+        ):
+            spec.loader = BundleLoader(fullname, spec.origin, self.bundle)
+        return spec
+
+
+def install(bundle, roots):
+    """
+    Import the modules of directories from a bytecode bundle.
+
+    Worker processes forked afterwards use the bundle too.
+
+    Args:
+        bundle (BytecodeBundle): The bundle to take the code from.
+        roots (list): The plugin and hook directories to import from the bundle.
+
+    Returns:
+        BundleFinder: The installed finder.
+    """
+    global BUNDLE
+    uninstall()
+    finder = BundleFinder(bundle, roots)
+    position = next(
+        (i for i, entry in enumerate(sys.meta_path) if entry is importlib.machinery.PathFinder),
+        len(sys.meta_path),
+    )
+    sys.meta_path.insert(position, finder)
+    BUNDLE = finder
+    return finder
+
+
+def uninstall():
+    """Stop importing modules from the installed bytecode bundle."""
+    global BUNDLE
+    if BUNDLE is None:
+        return
+    if BUNDLE in sys.meta_path:
+        sys.meta_path.remove(BUNDLE)
+    BUNDLE.bundle.close()
+    BUNDLE = None
+
+
+def file_spec(name, path):
+    """
+    Build the spec of a module imported from a file, like ``importlib.util.spec_from_file_location``.
+
+    The code is taken from the installed bytecode bundle when the file is in it.
+
+    Args:
+        name (str): The module name.
+        path (str): The module file.
+
+    Returns:
+        ModuleSpec: The spec, or None if the file cannot be imported.
+    """
+    if BUNDLE is not None and BUNDLE.covers(path):
+        return importlib.util.spec_from_file_location(name, path, loader=BundleLoader(name, path, BUNDLE.bundle))
+    return importlib.util.spec_from_file_location(name, path)
@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import threading
+
+from src.lib.archive import find_archive
+
+
+IGNORED_DIRECTORIES = ("__pycache__",)
+
+
+def tree_signature(directory):
+    """
+    Return the name, modification time and size of every file of a directory tree.
+
+    Args:
+        directory (str): The root of the tree.
+
+    Returns:
+        tuple: The sorted ``(relative path, mtime, size)`` tuples, with the CRC instead of the
+        modification time for a directory of a plugin archive.
+    """
+    archived = find_archive(directory)
+    if archived is not None:
+        return archived[0].files(archived[1])
+    signature = []
+    for path, dirs, files in os.walk(directory):
+        dirs[:] = [name for name in dirs if name not in IGNORED_DIRECTORIES]
+        for file_name in files:
+            file_path = os.path.join(path, file_name)
+            stat = os.stat(file_path)
+            signature.append((os.path.relpath(file_path, directory), stat.st_mtime_ns, stat.st_size))
+    return tuple(sorted(signature))
+
+
+def tree_digest(directory, signature=None):
+    """
+    Hash the names and contents of the files of a directory tree.
+
+    Args:
+        directory (str): The root of the tree.
+        signature (tuple, optional): Its ``tree_signature``, computed if not provided.
+
+    Returns:
+        str: The hexadecimal SHA-256 digest.
+    """
+    if signature is None:
+        signature = tree_signature(directory)
+    archived = find_archive(directory)
+    digest = hashlib.sha256()
+    for relative_path, _mtime, _size in signature:
+        digest.update(relative_path.encode("utf-8") + b"\0")
+        if archived is not None:
+            digest.update(archived[0].read(f"{archived[1]}/{relative_path}"))
+        else:
+            with open(os.path.join(directory, relative_path), "rb") as f:
+                digest.update(f.read())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def canonical(value):
+    """
+    Encode a value the same way in every process, to hash it.
+
+    Unlike pickle, the items of sets and dictionaries are sorted, so equal values get the
+    same encoding whatever the hash seed of the process.
+
+    Args:
+        value: The value, made of None, booleans, numbers, strings, bytes, lists, tuples, sets and dictionaries.
+
+    Returns:
+        str: The JSON encoding of the value, with its containers tagged with their type.
+
+    Raises:
+        TypeError: If the value holds an object of another type.
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return json.dumps(value)
+    if isinstance(value, (bytes, bytearray)):
+        parts = ['"bytes"', json.dumps(value.hex())]
+    elif isinstance(value, (list, tuple)):
+        parts = ['"tuple"' if isinstance(value, tuple) else '"list"'] + [canonical(item) for item in value]
+    elif isinstance(value, (set, frozenset)):
+        parts = ['"set"'] + sorted(canonical(item) for item in value)
+    elif isinstance(value, dict):
+        parts = ['"dict"'] + sorted(f"[{canonical(key)},{canonical(item)}]" for key, item in value.items())
+    else:
+        raise TypeError(f"{type(value).__name__} has no canonical encoding")
+    return "[" + ",".join(parts) + "]"
+
+
+class ResultCache:
+    """
+    An on-disk cache of plugin results, keyed by the content of everything they depend on.
+
+    The key of a result is a SHA-256 of the plugin source tree (including its ``VERSION``),
+    and of the ``canonical`` encoding of the keyword arguments it was registered with and of
+    the results of its dependencies. Results
+    are pickled under a directory per plugin. Once the cache grows over ``max_bytes``, the
+    least recently used results are evicted.
+    """
+
+    def __init__(self, logger, path, max_bytes=256 * 1024 * 1024, exclude=None):
+        """
+        Initialize the ResultCache instance.
+
+        Args:
+            logger (Logger): The logger to use for logging.
+            path (str): The directory of the cache.
+            max_bytes (int, optional): The maximum total size of the cached results.
+            exclude (list, optional): The names of the plugins never cached.
+        """
+        self.logger = logger
+        self.path = path
+        self.max_bytes = max_bytes
+        self.exclude = set(exclude or [])
+        self.lock = threading.Lock()
+        self.digests = {}
+        self.entries = None
+        self.hits = 0
+        self.misses = 0
+
+    def source_digest(self, directory):
+        """
+        Hash the files of a plugin directory, rehashing only when a file changed.
+
+        Args:
+            directory (str): The plugin directory.
+
+        Returns:
+            str: The hexadecimal digest.
+        """
+        signature = tree_signature(directory)
+        cached = self.digests.get(directory)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        self.digests[directory] = (signature, tree_digest(directory, signature))
+        return self.digests[directory][1]
+
+    def key(self, name, directory, kwargs=None, inputs=None):
+        """
+        Compute the cache key of a plugin run.
+
+        Args:
+            name (str): The name of the plugin.
+            directory (str): The plugin directory.
+            kwargs (dict, optional): The keyword arguments the plugin was registered with.
+            inputs (dict, optional): The results of its dependencies.
+
+        Returns:
+            str: The key, or None if the plugin is excluded or its kwargs or inputs have no
+            ``canonical`` encoding.
+        """
+        if name in self.exclude:
+            return None
+        try:
+            payload = canonical((name, kwargs or {}, inputs or {}))
+            source = self.source_digest(directory)
+        except (TypeError, RecursionError, OSError) as err:
+            self.logger.debug("Plugin %s is not cacheable: %s", name, err)
+            return None
+        return hashlib.sha256((source + payload).encode("utf-8")).hexdigest()
+
+    def entry_path(self, name, key):
+        """Return the path of a cached result."""
+        return os.path.join(self.path, name, key + ".pkl")
+
+    def scan(self):
+        """Index the cached results by path, with their size and last access time, on first use."""
+        if self.entries is not None:
+            return
+        self.entries = {}
+        if not os.path.isdir(self.path):
+            return
+        for name in os.listdir(self.path):
+            directory = os.path.join(self.path, name)
+            if not os.path.isdir(directory):
+                continue
+            for entry in os.scandir(directory):
+                if entry.name.endswith(".pkl"):
+                    stat = entry.stat()
+                    self.entries[entry.path] = (stat.st_size, stat.st_mtime_ns)
+
+    def get(self, name, key):
+        """
+        Load a cached result.
+
+        Args:
+            name (str): The name of the plugin.
+            key (str): The cache key of the run.
+
+        Returns:
+            tuple: ``(True, result)`` on a hit, ``(False, None)`` on a miss.
+        """
+        path = self.entry_path(name, key)
+        try:
+            with open(path, "rb") as f:
+                result = pickle.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return False, None
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError) as err:
+            self.logger.warning("Cannot read cached result of plugin %s: %s", name, err)
+            self.misses += 1
+            return False, None
+        # The modification time records the last access, for eviction
+        os.utime(path)
+        with self.lock:
+            self.scan()
+            if path in self.entries:
+                self.entries[path] = (self.entries[path][0], os.stat(path).st_mtime_ns)
+        self.hits += 1
+        return True, result
+
+    def set(self, name, key, result):
+        """
+        Store a result, then evict the least recently used results if the cache is full.
+
+        Args:
+            name (str): The name of the plugin.
+            key (str): The cache key of the run.
+            result: The value returned by the plugin.
+        """
+        try:
+            data = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError) as err:
+            self.logger.debug("Result of plugin %s is not cacheable: %s", name, err)
+            return
+        if len(data) > self.max_bytes:
+            self.logger.debug("Result of plugin %s is larger than the cache", name)
+            return
+        path = self.entry_path(name, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary_path, "wb") as f:
+            f.write(data)
+        os.replace(temporary_path, path)
+        with self.lock:
+            self.scan()
+            self.entries[path] = (len(data), os.stat(path).st_mtime_ns)
+            self.evict()
+
+    def evict(self):
+        """Remove the least recently used results until the cache fits in ``max_bytes``, the lock must be held."""
+        total = sum(size for size, _atime in self.entries.values())
+        if total <= self.max_bytes:
+            return
+        for path, (size, _atime) in sorted(self.entries.items(), key=lambda item: item[1][1]):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            del self.entries[path]
+            total -= size
+            self.logger.debug("Evicted cached result %s", path)
+            if total <= self.max_bytes:
+                break
+
+    def invalidate(self, name):
+        """
+        Remove the cached results of a plugin.
+
+        Args:
+            name (str): The name of the plugin.
+
+        Returns:
+            int: The number of results removed.
+        """
+        directory = os.path.join(self.path, name)
+        with self.lock:
+            self.scan()
+            removed = [path for path in self.entries if os.path.dirname(path) == directory]
+            for path in removed:
+                del self.entries[path]
+            shutil.rmtree(directory, ignore_errors=True)
+        self.logger.info("Invalidated %d cached results of plugin %s", len(removed), name)
+        return len(removed)
+
+    def clear(self):
+        """
+        Remove every cached result.
+
+        Returns:
+            int: The number of results removed.
+        """
+        with self.lock:
+            self.scan()
+            count = len(self.entries)
+            self.entries = {}
+            shutil.rmtree(self.path, ignore_errors=True)
+        self.logger.info("Cleared %d cached results", count)
+        return count
+
+    def info(self):
+        """
+        Describe the content of the cache.
+
+        Returns:
+            dict: The number of results and their total size, overall and by plugin.
+        """
+        with self.lock:
+            self.scan()
+            plugins = {}
+            for path, (size, _atime) in self.entries.items():
+                entry = plugins.setdefault(os.path.basename(os.path.dirname(path)), {"results": 0, "bytes": 0})
+                entry["results"] += 1
+                entry["bytes"] += size
+        return {
+            "results": sum(entry["results"] for entry in plugins.values()),
+            "bytes": sum(entry["bytes"] for entry in plugins.values()),
+            "max_bytes": self.max_bytes,
+            "plugins": plugins,
+        }
@@ -0,0 +1,457 @@
+# -*- coding: utf-8 -*-
+import collections
+import multiprocessing
+import os
+import pickle
+import queue
+import socket
+import threading
+import time
+import traceback
+
+from multiprocessing.connection import Client, Listener, wait
+
+from src.lib.buffers import BUFFERS_HOOK
+from src.lib.exceptions import PluginExecutionError
+from src.lib.hooks import RecordingHook
+from src.lib.scheduler import DagScheduler, run_plugin_recording
+from src.lib.workers import import_plugin
+
+
+# Environment variable holding the shared secret of the coordinator and its workers
+AUTHKEY_VARIABLE = "PLUGINIZER_AUTHKEY"
+
+
+def parse_address(address):
+    """
+    Parse the address of a coordinator.
+
+    Args:
+        address (str or tuple): ``host:port`` for TCP, or the path of a Unix socket.
+
+    Returns:
+        tuple or str: The address, as expected by ``multiprocessing.connection``.
+    """
+    if isinstance(address, (tuple, list)):
+        return tuple(address)
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit() and os.sep not in address:
+        return host or "0.0.0.0", int(port)
+    return address
+
+
+def get_authkey(authkey=None):
+    """
+    Return the shared secret authenticating the coordinator and its workers.
+
+    Args:
+        authkey (str or bytes, optional): The secret, read from ``PLUGINIZER_AUTHKEY`` if not provided.
+
+    Returns:
+        bytes: The secret.
+
+    Raises:
+        ValueError: If no secret is provided.
+    """
+    authkey = authkey or os.environ.get(AUTHKEY_VARIABLE)
+    if not authkey:
+        raise ValueError(f"Distributed runs need an authkey, in the configuration or {AUTHKEY_VARIABLE}")
+    return authkey.encode("utf-8") if isinstance(authkey, str) else authkey
+
+
+class Coordinator(DagScheduler):
+    """
+    A scheduler leasing plugins to worker processes connected over TCP or a Unix socket.
+
+    Workers may run on other hosts, with the plugins at the same paths. A plugin is leased
+    to an idle worker as soon as its dependencies have completed. The worker sends heartbeats
+    while it runs the plugin, then its result and the hook triggers it recorded, which are
+    replayed on the hooks of the coordinator. A lease whose worker disconnects or stops
+    sending heartbeats is lost, and the plugin is leased again to another worker.
+    """
+
+    def __init__(
+        self,
+        logger,
+        executor="remote",
+        address="127.0.0.1:7700",
+        authkey=None,
+        lease_timeout=30.0,
+        heartbeat=5.0,
+        max_attempts=3,
+        worker_timeout=300.0,
+        max_workers=None,
+        history=None,
+        on_failure="skip",
+    ):
+        """
+        Initialize the Coordinator instance.
+
+        Args:
+            logger (Logger): The logger to use for logging.
+            executor (str, optional): Always ``remote``.
+            address (str, optional): ``host:port`` to listen on, or the path of a Unix socket.
+            authkey (str, optional): The secret shared with the workers, see ``get_authkey``.
+            lease_timeout (float, optional): Seconds without a heartbeat after which a lease is lost.
+            heartbeat (float, optional): Seconds between the heartbeats of a worker running a plugin.
+            max_attempts (int, optional): The number of leases of a plugin before it fails.
+            worker_timeout (float, optional): Seconds to wait for a worker while no worker is connected,
+                after which the plugins left fail.
+            max_workers (int, optional): Ignored, the number of workers is the number connected.
+            history (RuntimeHistory, optional): The durations of previous runs, see ``DagScheduler``.
+            on_failure (str, optional): ``skip`` or ``degrade`` the plugins depending on a failed plugin.
+
+        Raises:
+            ValueError: If no authkey is provided, or the failure handling is unknown.
+        """
+        super().__init__(logger, history=history, on_failure=on_failure)
+        self.executor = executor
+        self.address = parse_address(address)
+        self.authkey = get_authkey(authkey)
+        self.lease_timeout = lease_timeout
+        self.heartbeat = heartbeat
+        self.max_attempts = max_attempts
+        self.worker_timeout = worker_timeout
+        self.listener = None
+        self.joined = queue.Queue()
+        self.idle = collections.deque()
+        self.names = {}
+        self.seen = {}
+        self.leases = {}
+        self.attempts = collections.Counter()
+
+    def start(self):
+        """Listen for workers, if not listening yet."""
+        if self.listener is not None:
+            return
+        self.listener = Listener(self.address, authkey=self.authkey)
+        self.logger.info("Coordinator listening on %s", self.listener.address)
+        threading.Thread(target=self.accept, name="coordinator-accept", daemon=True).start()
+
+    def accept(self):
+        """Accept the workers connecting until the listener is closed."""
+        listener = self.listener
+        while True:
+            try:
+                conn = listener.accept()
+            except multiprocessing.AuthenticationError as err:
+                self.logger.warning("Rejected worker: %s", err)
+                continue
+            except OSError:
+                return
+            try:
+                if not conn.poll(self.lease_timeout):
+                    raise EOFError("no greeting")
+                _hello, host, pid = conn.recv()
+                conn.send(("welcome", self.heartbeat))
+            except (EOFError, OSError, ValueError, pickle.UnpicklingError) as err:
+                self.logger.warning("Rejected worker: %s", err)
+                conn.close()
+                continue
+            self.joined.put((conn, f"{host}:{pid}"))
+
+    def task(self, plugin, name, profiler=None):
+        """
+        Build the task leasing a plugin to a worker.
+
+        Args:
+            plugin (dict): The registered plugin, with its ``module_name``, ``module_path`` and ``kwargs``.
+            name (str): The name of the plugin, which is also the name of its class.
+            profiler (Profiler, optional): Not supported, workers do not share the profiler.
+
+        Returns:
+            tuple: The ``(module_name, module_path, class_name, kwargs)`` of the plugin.
+        """
+        return plugin["module_name"], plugin["module_path"], name, plugin.get("kwargs") or {}
+
+    def run(self, tasks, dependencies, hooks=None, store=None, priorities=None, types=None):
+        """
+        Lease tasks to the workers once their dependencies have completed.
+
+        Args:
+            tasks (dict): An ordered mapping of plugin names to tasks built with ``task``.
+            dependencies (dict): A mapping of plugin names to the names they depend on.
+            hooks (dict, optional): The registered hooks, triggered with the triggers recorded by the workers.
+            store (ResultStore, optional): Pass the results of the dependencies of each task as its
+                ``inputs``, and store its result instead of returning it.
+            priorities (dict, optional): The priority hint of each plugin, higher first.
+            types (dict, optional): The type of each plugin, keying its durations in the runtime history.
+
+        Returns:
+            dict: A mapping of plugin names to the values returned by their task, without a store.
+
+        Raises:
+            PluginExecutionError: If one or more plugins failed.
+        """
+        self.start()
+        ready = collections.deque(self.cached(self.prepare(tasks, dependencies, store, priorities, types)))
+        self.logger.info("Scheduling %d plugins on the workers of %s", len(tasks), self.listener.address)
+        hook_names = sorted(name for name in (hooks or {}) if name != BUFFERS_HOOK)
+        self.attempts = collections.Counter()
+        originals = self.wrap_hooks(hooks)
+        try:
+            waiting = starved = time.monotonic()
+            while ready or self.leases:
+                self.join()
+                while ready and self.idle:
+                    name = ready.popleft()
+                    if not self.lease(name, tasks[name], hook_names):
+                        ready.appendleft(name)
+                if not ready or self.idle or self.leases:
+                    starved = time.monotonic()
+                elif time.monotonic() - starved > self.worker_timeout:
+                    self.abandon(ready)
+                    break
+                elif time.monotonic() - waiting > self.lease_timeout:
+                    waiting = time.monotonic()
+                    self.logger.warning("Waiting for workers to run %d plugins", len(ready))
+                for conn in wait(list(self.leases), timeout=min(self.heartbeat, 0.5)):
+                    for name in self.receive(conn, hooks):
+                        if name not in ready and name not in self.skipped:
+                            ready.append(name)
+                for conn, (name, _started) in list(self.leases.items()):
+                    if time.monotonic() - self.seen[conn] > self.lease_timeout:
+                        self.drop(conn, "no heartbeat")
+                        ready.extend(self.retry(name))
+                ready = collections.deque(sorted(ready, key=self.order.get))
+        finally:
+            self.unwrap_hooks(hooks, originals)
+
+        return self.finish()
+
+    def abandon(self, ready):
+        """
+        Fail the plugins left when no worker joined in time.
+
+        Args:
+            ready (deque): The plugins ready to be leased, emptied.
+        """
+        err = PluginExecutionError(f"No worker joined {self.listener.address} in {self.worker_timeout}s")
+        while ready:
+            ready.extend(self.cached(self.fail(ready.popleft(), err)))
+
+    def join(self):
+        """Make the workers that connected since the last call available."""
+        while True:
+            try:
+                conn, name = self.joined.get_nowait()
+            except queue.Empty:
+                return
+            self.logger.info("Worker %s joined", name)
+            self.names[conn] = name
+            self.seen[conn] = time.monotonic()
+            self.idle.append(conn)
+
+    def lease(self, name, task, hook_names):
+        """
+        Send a plugin to an idle worker.
+
+        Returns:
+            bool: True if the plugin was sent, False if the worker was gone.
+        """
+        conn = self.idle.popleft()
+        module_name, module_path, class_name, kwargs = task
+        inputs = self.inputs(name).get("inputs")
+        try:
+            conn.send(("task", module_name, module_path, class_name, kwargs, hook_names, inputs))
+        except (OSError, EOFError):
+            self.drop(conn, "connection lost")
+            return False
+        self.attempts[name] += 1
+        self.seen[conn] = time.monotonic()
+        self.leases[conn] = (name, time.monotonic())
+        self.logger.debug("Leased plugin %s to worker %s (attempt %d)", name, self.names[conn], self.attempts[name])
+        return True
+
+    def receive(self, conn, hooks):
+        """
+        Handle a message of a worker running a plugin.
+
+        Returns:
+            list: The plugins that became ready to be leased.
+        """
+        name, started = self.leases[conn]
+        try:
+            message = conn.recv()
+        except (EOFError, OSError, pickle.UnpicklingError) as err:
+            self.drop(conn, str(err) or "connection lost")
+            return self.retry(name)
+        self.seen[conn] = time.monotonic()
+        if message[0] == "heartbeat":
+            return []
+        del self.leases[conn]
+        self.idle.append(conn)
+        if message[0] == "error":
+            self.logger.debug("Plugin %s failed on worker %s:\n%s", name, self.names[conn], message[2])
+            return self.cached(self.fail(name, PluginExecutionError(message[1])))
+        _kind, result, triggers = message
+        duration = time.monotonic() - started
+        self.logger.debug("Plugin %s completed on worker %s in %.3fs", name, self.names[conn], duration)
+        self.measured(name, duration)
+        self.replay(name, triggers, hooks)
+        return self.cached(self.complete(name, result))
+
+    def retry(self, name):
+        """
+        Lease a plugin again after its lease was lost, unless it was leased too many times.
+
+        Returns:
+            list: The plugin to lease again, or the degraded dependents that became ready if it failed.
+        """
+        if self.attempts[name] >= self.max_attempts:
+            err = PluginExecutionError(f"Plugin {name} lost its worker {self.attempts[name]} times")
+            return self.cached(self.fail(name, err))
+        self.logger.warning("Lease of plugin %s lost, leasing it again", name)
+        return [name]
+
+    def drop(self, conn, reason):
+        """Forget a worker which disconnected or stopped sending heartbeats."""
+        self.logger.warning("Lost worker %s: %s", self.names.get(conn), reason)
+        self.leases.pop(conn, None)
+        self.names.pop(conn, None)
+        self.seen.pop(conn, None)
+        if conn in self.idle:
+            self.idle.remove(conn)
+        conn.close()
+
+    def close(self):
+        """Stop the idle workers and stop listening."""
+        for conn in list(self.idle):
+            try:
+                conn.send(("stop",))
+            except (OSError, EOFError):
+                pass
+            conn.close()
+        self.idle.clear()
+        if self.listener is not None:
+            self.listener.close()
+            self.listener = None
+
+
+def connect(logger, address, authkey, timeout=30.0):
+    """
+    Connect to a coordinator, waiting for it to listen.
+
+    Args:
+        logger (Logger): The logger to use for logging.
+        address (str or tuple): The address of the coordinator, see ``parse_address``.
+        authkey (bytes): The secret shared with the coordinator.
+        timeout (float, optional): The maximum time to wait for the coordinator in seconds.
+
+    Returns:
+        tuple: The connection and the interval between heartbeats asked by the coordinator.
+
+    Raises:
+        OSError: If the coordinator cannot be reached in time.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            conn = Client(parse_address(address), authkey=authkey)
+            break
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            logger.debug("Coordinator %s not reachable, retrying", address)
+            time.sleep(0.2)
+    conn.send(("hello", socket.gethostname(), os.getpid()))
+    _welcome, heartbeat = conn.recv()
+    return conn, heartbeat
+
+
+def run_worker(logger, address, authkey, timeout=30.0):
+    """
+    Run the plugins leased by a coordinator until it stops the worker or goes away.
+
+    Plugin modules and instances are cached, restart the workers after changing plugins.
+
+    Args:
+        logger (Logger): The logger to use for logging, also passed to the plugins.
+        address (str or tuple): The address of the coordinator, see ``parse_address``.
+        authkey (bytes): The secret shared with the coordinator.
+        timeout (float, optional): The maximum time to wait for the coordinator in seconds.
+
+    Returns:
+        int: The number of plugins run.
+    """
+    conn, heartbeat = connect(logger, address, authkey, timeout)
+    logger.info("Worker %d connected to coordinator %s", os.getpid(), address)
+    lock = threading.Lock()
+    busy = threading.Event()
+    stopped = threading.Event()
+
+    def beat():
+        # Only while running a plugin, the coordinator does not read from idle workers
+        while not stopped.wait(heartbeat):
+            if busy.is_set():
+                with lock:
+                    try:
+                        conn.send(("heartbeat",))
+                    except OSError:
+                        return
+
+    threading.Thread(target=beat, name="worker-heartbeat", daemon=True).start()
+    modules = {}
+    instances = {}
+    runs = 0
+    try:
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                break
+            if message[0] == "stop":
+                break
+            _task, module_name, module_path, class_name, kwargs, hook_names, inputs = message
+            busy.set()
+            try:
+                key = (module_path, class_name)
+                if key not in instances:
+                    if module_path not in modules:
+                        modules[module_path] = import_plugin(module_name, module_path)
+                    hooks = {name: RecordingHook(name) for name in hook_names}
+                    instances[key] = getattr(modules[module_path], class_name)(logger, hooks, **kwargs)
+                result, triggers = run_plugin_recording(instances[key], class_name, inputs)
+                reply = ("result", result, triggers)
+            except Exception as err:
+                reply = ("error", f"{type(err).__name__}: {err}", traceback.format_exc())
+            finally:
+                busy.clear()
+            runs += 1
+            with lock:
+                try:
+                    conn.send(reply)
+                except (pickle.PicklingError, TypeError, AttributeError) as err:
+                    conn.send(("error", f"Cannot send the result of {class_name}: {err}", ""))
+                except OSError:
+                    break
+    finally:
+        stopped.set()
+        conn.close()
+    logger.info("Worker %d stopped after %d plugins", os.getpid(), runs)
+    return runs
+
+
+def run_workers(logger, address, authkey, processes=None, timeout=30.0):
+    """
+    Run worker processes on this host until the coordinator stops them.
+
+    Args:
+        logger (Logger): The logger to use for logging, also passed to the plugins.
+        address (str or tuple): The address of the coordinator, see ``parse_address``.
+        authkey (bytes): The secret shared with the coordinator.
+        processes (int, optional): The number of worker processes, defaults to the number of CPUs.
+        timeout (float, optional): The maximum time to wait for the coordinator in seconds.
+
+    Returns:
+        list: The exit codes of the worker processes.
+    """
+    workers = [
+        multiprocessing.Process(target=run_worker, args=(logger, address, authkey, timeout), daemon=True)
+        for _ in range(processes or os.cpu_count() or 1)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return [worker.exitcode for worker in workers]
@@ -1,5 +1,8 @@
 # -*- coding: utf-8 -*-
+import hashlib
 import logging
+import marshal
+import os
 
 import yaml
 
@@ -52,4 +55,301 @@ def yaml_parser(file_path: str):
             "Error: An I/O error occurred while accessing the YAML file %s: ",
             file_path,
         )
-        return None    
+        return None
+
+
+# The libyaml loader when PyYAML was built with it, it parses several times faster
+Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# Compiled configuration snapshots, keyed by the hash of the configuration file
+SNAPSHOT_PATH = "./.cache/configuration.marshal"
+
+# Bumped when the snapshot format changes, a change of the schema invalidates the snapshots too
+SNAPSHOT_VERSION = 2
+
+NUMBER = (int, float)
+
+DIRECTORY = {"type": dict, "required": True, "keys": {"directory": {"type": str, "required": True}}}
+
+PATH = {"type": dict, "keys": {"path": {"type": str}, "enabled": {"type": bool}}}
+
+# The expected keys of the configuration file, with their type, whether they are required,
+# their default value, their allowed values and the schema of their keys or values
+SCHEMA = {
+    "type": dict,
+    "keys": {
+        "app": {
+            "type": dict,
+            "required": True,
+            "keys": {
+                "name": {"type": str, "required": True},
+                "description": {"type": str},
+                "logger": {
+                    "type": dict,
+                    "default": {},
+                    "keys": {
+                        "level": {
+                            "type": str,
+                            "default": "INFO",
+                            "choices": ["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
+                        },
+                        "format": {"type": str, "default": "%(asctime)s - %(levelname)s - %(message)s"},
+                        "queued": {"type": bool},
+                        "batch_size": {"type": int},
+                        "json": {"type": bool},
+                        "rate_limit": {"type": int},
+                        "rate_period": {"type": NUMBER},
+                    },
+                },
+                "lazy": {"type": bool},
+                "pipeline": {"type": bool},
+                "on_failure": {"type": str, "choices": ["skip", "degrade"]},
+                "scheduler": {
+                    "type": dict,
+                    "keys": {
+                        "executor": {"type": str, "choices": ["thread", "process", "asyncio", "remote"]},
+                        "max_workers": {"type": int},
+                        "max_concurrency": {"type": int},
+                        "address": {"type": str},
+                        "authkey": {"type": str},
+                        "lease_timeout": {"type": NUMBER},
+                        "worker_timeout": {"type": NUMBER},
+                        "heartbeat": {"type": NUMBER},
+                        "max_attempts": {"type": int},
+                        "on_failure": {"type": str, "choices": ["skip", "degrade"]},
+                    },
+                },
+                "isolation": {
+                    "type": dict,
+                    "keys": {
+                        "processes": {"type": int},
+                        "max_tasks": {"type": int},
+                        "timeout": {"type": NUMBER},
+                        "memory": {"type": int},
+                        "cpu": {"type": NUMBER},
+                        "types": {"type": list, "items": {"type": str}},
+                        "plugins": {"type": dict, "values": {"type": dict}},
+                        "start_method": {"type": str},
+                    },
+                },
+                "core": DIRECTORY,
+                "users": DIRECTORY,
+                "plugins": {"type": dict, "values": {"type": dict}},
+                "hooks": {
+                    "type": dict,
+                    "required": True,
+                    "keys": {
+                        "directory": {"type": str, "required": True},
+                        "buffers": {"type": bool},
+                        "batch": {"type": dict, "keys": {"size": {"type": int}, "interval": {"type": NUMBER}}},
+                        "options": {"type": dict, "values": {"type": dict}},
+                    },
+                },
+                "index": {"type": dict, "keys": {"path": {"type": str, "required": True}}},
+                "cache": {
+                    "type": dict,
+                    "keys": dict(
+                        PATH["keys"],
+                        max_bytes={"type": int},
+                        exclude={"type": list, "items": {"type": str}},
+                    ),
+                },
+                "incremental": {
+                    "type": dict,
+                    "keys": dict(PATH["keys"], exclude={"type": list, "items": {"type": str}}),
+                },
+                "bytecode": PATH,
+                "manifests": {"type": dict, "keys": {"path": {"type": str, "required": True}}},
+                "history": {
+                    "type": dict,
+                    "keys": {"path": {"type": str, "required": True}, "alpha": {"type": NUMBER}},
+                },
+                "daemon": {"type": dict, "keys": {"socket": {"type": str}, "interval": {"type": NUMBER}}},
+                "profiler": {
+                    "type": dict,
+                    "keys": {"memory": {"type": bool}, "json": {"type": str}, "chrome_trace": {"type": str}},
+                },
+            },
+        },
+    },
+}
+
+# The hash of the schema, so snapshots validated against another schema are not used
+SCHEMA_DIGEST = hashlib.sha256(repr(SCHEMA).encode("utf-8")).hexdigest()
+
+
+def parse_yaml(text, file_path):
+    """Parse YAML data with the fastest available loader.
+
+    Args:
+        text (bytes): The content of the YAML file.
+        file_path (str): The path to the YAML file, for error messages.
+
+    Returns:
+        dict or None: The parsed YAML data if successful, None otherwise.
+    """
+    try:
+        return yaml.load(text, Loader=Loader)
+    except yaml.YAMLError as e:
+        mark = getattr(e, "problem_mark", None) or getattr(e, "context_mark", None)
+        if isinstance(mark, yaml.Mark):
+            logger.error(
+                "Error: An error occurred while parsing the YAML file %s at line: %s, column: %s: %s",
+                file_path,
+                mark.line + 1,
+                mark.column + 1,
+                getattr(e, "problem", e),
+            )
+        else:
+            logger.error("Error: An error occurred while parsing the YAML file %s: %s", file_path, e)
+        return None
+
+
+def validate(data, schema=SCHEMA, path="configuration"):
+    """Check configuration data against a schema, filling in the defaults.
+
+    Keys set to null are treated as missing, keys unknown to the schema are kept and reported.
+
+    Args:
+        data: The configuration data.
+        schema (dict, optional): The schema of the data, see ``SCHEMA``.
+        path (str, optional): The path of the data in the configuration, for messages.
+
+    Returns:
+        tuple: The configuration with its defaults, a list of errors and a list of warnings.
+    """
+    errors, warnings = [], []
+    types = schema["type"] if isinstance(schema["type"], tuple) else (schema["type"],)
+    # bool is an int, but a flag is never a valid number
+    if not isinstance(data, types) or (isinstance(data, bool) and bool not in types):
+        names = " or ".join(t.__name__ for t in types)
+        errors.append(f"{path}: expected {names}, got {type(data).__name__}")
+        return data, errors, warnings
+    if "choices" in schema and data not in schema["choices"]:
+        errors.append(f"{path}: {data!r} is not one of {schema['choices']}")
+    if isinstance(data, list) and "items" in schema:
+        checked = []
+        for i, item in enumerate(data):
+            item, item_errors, item_warnings = validate(item, schema["items"], f"{path}[{i}]")
+            checked.append(item)
+            errors.extend(item_errors)
+            warnings.extend(item_warnings)
+        data = checked
+    if isinstance(data, dict):
+        data = dict(data)
+        if "values" in schema:
+            for key, value in data.items():
+                if value is None:
+                    continue
+                data[key], value_errors, value_warnings = validate(value, schema["values"], f"{path}.{key}")
+                errors.extend(value_errors)
+                warnings.extend(value_warnings)
+        for key, key_schema in schema.get("keys", {}).items():
+            if data.get(key) is None:
+                if key_schema.get("required"):
+                    errors.append(f"{path}.{key}: required")
+                    continue
+                if "default" not in key_schema:
+                    continue
+                data[key] = key_schema["default"]
+            data[key], key_errors, key_warnings = validate(data[key], key_schema, f"{path}.{key}")
+            errors.extend(key_errors)
+            warnings.extend(key_warnings)
+        if "keys" in schema:
+            warnings.extend(f"{path}.{key}: unknown key" for key in data if key not in schema["keys"])
+    return data, errors, warnings
+
+
+def read_snapshot(snapshot_path, digest):
+    """Return the compiled configuration of a snapshot if it was compiled from the same file.
+
+    Args:
+        snapshot_path (str): The snapshot file.
+        digest (str): The hash of the configuration file.
+
+    Returns:
+        dict or None: The compiled configuration, or None if the snapshot is missing or stale.
+    """
+    try:
+        with open(snapshot_path, "rb") as f:
+            snapshot = marshal.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, EOFError, ValueError, TypeError) as e:
+        logger.warning("Cannot read configuration snapshot %s: %s", snapshot_path, e)
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get("key") != (SNAPSHOT_VERSION, SCHEMA_DIGEST, digest):
+        return None
+    return snapshot["configuration"]
+
+
+def write_snapshot(snapshot_path, digest, configuration):
+    """Write the compiled configuration to a snapshot.
+
+    Args:
+        snapshot_path (str): The snapshot file.
+        digest (str): The hash of the configuration file.
+        configuration (dict): The compiled configuration.
+
+    Returns:
+        bool: True if the snapshot was written, False otherwise.
+    """
+    tmp_path = snapshot_path + ".tmp"
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(snapshot_path)), exist_ok=True)
+        # Values YAML parses to types marshal cannot write, like dates, leave the file unsnapshotted
+        data = marshal.dumps({"key": (SNAPSHOT_VERSION, SCHEMA_DIGEST, digest), "configuration": configuration})
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, snapshot_path)
+    except (OSError, ValueError) as e:
+        logger.warning("Cannot write configuration snapshot %s: %s", snapshot_path, e)
+        return False
+    return True
+
+
+def load_config(file_path, snapshot_path=SNAPSHOT_PATH):
+    """Load the configuration file, parsed and validated once per version of the file.
+
+    The compiled configuration is kept in a snapshot keyed by the hash of the file, so later
+    loads of an unchanged file only hash it and load the snapshot.
+
+    Args:
+        file_path (str): The path to the configuration file.
+        snapshot_path (str, optional): The snapshot file, None to always parse the file.
+
+    Returns:
+        dict or None: The validated configuration with its defaults if successful, None otherwise.
+    """
+    try:
+        with open(file_path, "rb") as file:
+            text = file.read()
+    except FileNotFoundError:
+        logger.error("File %s not found.", file_path)
+        return None
+    except PermissionError:
+        logger.error("You do not have permission to open the file %s.", file_path)
+        return None
+    except IOError:
+        logger.error("Error: An I/O error occurred while accessing the YAML file %s: ", file_path)
+        return None
+
+    digest = hashlib.sha256(text).hexdigest()
+    if snapshot_path is not None:
+        configuration = read_snapshot(snapshot_path, digest)
+        if configuration is not None:
+            return configuration
+
+    data = parse_yaml(text, file_path)
+    if data is None:
+        return None
+    configuration, errors, warnings = validate(data)
+    for warning in warnings:
+        logger.warning("Configuration %s: %s", file_path, warning)
+    if errors:
+        for error in errors:
+            logger.error("Invalid configuration %s: %s", file_path, error)
+        return None
+    if snapshot_path is not None:
+        write_snapshot(snapshot_path, digest, configuration)
+    return configuration
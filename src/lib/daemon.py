@@ -0,0 +1,396 @@
+# -*- coding: utf-8 -*-
+import contextlib
+import os
+import socket
+import socketserver
+import threading
+import time
+
+from src.lib.handler import HookHandler, prepare_pipeline, prepare_plugins, run_plugins
+from src.lib.hooks import close_hooks
+from src.lib.serializers import get_serializer
+from src.lib.watcher import Watcher
+
+
+SERIALIZER = get_serializer("json")
+# Seconds to wait for a daemon already listening on the socket to answer
+PROBE_TIMEOUT = 5.0
+
+
+def request(socket_path, command, timeout=None, **params):
+    """
+    Send a request to a running daemon and wait for its response.
+
+    Args:
+        socket_path (str): The path of the daemon socket.
+        command (str): The command to send (``run``, ``reload``, ``status`` or ``stop``).
+        timeout (float, optional): The maximum time to wait for the response in seconds.
+        **params: The parameters of the command.
+
+    Returns:
+        dict: The response of the daemon.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(timeout)
+        client.connect(socket_path)
+        client.sendall(SERIALIZER.dumps(dict(params, command=command)) + b"\n")
+        with client.makefile("rb") as f:
+            return SERIALIZER.loads(f.readline())
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """Handles one request per connection, both encoded as a line of JSON."""
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            message = SERIALIZER.loads(line)
+            response = self.server.daemon.handle(message)
+        except Exception as err:
+            self.server.daemon.logger.exception("Failed to handle request: ")
+            response = {"status": "error", "error": repr(err)}
+        self.wfile.write(SERIALIZER.dumps(response) + b"\n")
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """A Unix socket server handling each connection in a thread."""
+
+    daemon_threads = True
+
+
+class PluginDaemon:
+    """
+    A resident service keeping plugins and hooks loaded between runs.
+
+    Plugins are discovered, loaded and registered once, then run on each request received
+    over a Unix socket. A background thread watches the plugin directories and reloads only
+    the plugins whose files changed, and every plugin and hook when a hook changed. Runs and
+    reloads are serialized, requests arriving during a run wait for it to complete.
+    """
+
+    def __init__(
+        self,
+        logger,
+        plugins,
+        hooks_dir=None,
+        socket_path="./.cache/pluginizer.sock",
+        index=None,
+        lazy=False,
+        scheduler=None,
+        profiler=None,
+        hooks_batch=None,
+        hooks_options=None,
+        interval=1.0,
+        workers=None,
+        buffers=False,
+        cache=None,
+        state=None,
+        manifests=None,
+        options=None,
+        pipeline=False,
+        on_failure="skip",
+    ):
+        """
+        Initialize the PluginDaemon instance.
+
+        Args:
+            logger (Logger): The logger to use for logging.
+            plugins (dict): The plugin directories, keyed by plugin type.
+            hooks_dir (str, optional): The directory containing the hooks.
+            socket_path (str, optional): The path of the Unix socket to listen on.
+            index (DiscoveryIndex, optional): The discovery index used to speed up discovery.
+            lazy (bool, optional): Import plugins and hooks the first time they are used.
+            scheduler (DagScheduler, optional): Run independent plugins concurrently.
+            profiler (Profiler, optional): Record the duration of each phase, plugin step and hook.
+            hooks_batch (dict, optional): The batching settings of the hooks.
+            hooks_options (dict, optional): Keyword arguments passed to each hook, keyed by hook name.
+            interval (float, optional): The interval in seconds between checks for changed files.
+            workers (WorkerPool, optional): Run the plugins it isolates in worker processes.
+            buffers (bool, optional): Add shared memory result buffers to the hooks.
+            cache (ResultCache, optional): Skip the plugins whose result is cached.
+            state (RunState, optional): Only run the plugins downstream of a change since the previous run.
+            manifests (ManifestCache, optional): The cache of compiled plugin and hook manifests.
+            options (dict, optional): Keyword arguments passed to each plugin, keyed by plugin name.
+            pipeline (bool, optional): Prepare and run the plugins of every type in one dependency
+                graph, under the ``core+users`` type, like ``PipelineHandler``.
+            on_failure (str, optional): ``skip`` or ``degrade`` the plugins depending on a failed plugin,
+                when plugins run serially.
+        """
+        self.logger = logger
+        self.plugins = plugins
+        self.hooks_dir = hooks_dir
+        self.socket_path = socket_path
+        self.index = index
+        self.lazy = lazy
+        self.scheduler = scheduler
+        self.profiler = profiler
+        self.hooks_batch = hooks_batch
+        self.hooks_options = hooks_options
+        self.interval = interval
+        self.workers = workers
+        self.buffers = buffers
+        self.cache = cache
+        self.state = state
+        self.manifests = manifests
+        self.options = options
+        self.pipeline = pipeline
+        self.on_failure = on_failure
+        self.hooks = None
+        self.managers = {}
+        self.lock = threading.RLock()
+        self.watcher = None
+        self.watch_thread = None
+        self.server = None
+        self.started = None
+        self.runs = 0
+
+    def load(self):
+        """Load the hooks and prepare the plugins of every type, or the pipeline of all of them."""
+        with self.lock:
+            close_hooks(self.hooks)
+            self.hooks = HookHandler(
+                self.logger,
+                self.hooks_dir,
+                self.index,
+                self.lazy,
+                self.profiler,
+                self.hooks_batch,
+                self.hooks_options,
+                self.buffers,
+                self.manifests,
+            )
+            self.managers = {}
+            if self.pipeline:
+                pipeline = prepare_pipeline(
+                    self.logger,
+                    self.plugins,
+                    self.hooks,
+                    self.index,
+                    self.lazy,
+                    self.profiler,
+                    self.manifests,
+                    self.options,
+                )
+                self.managers[pipeline.name] = pipeline
+            else:
+                for plugin_type, path in self.plugins.items():
+                    try:
+                        self.managers[plugin_type] = prepare_plugins(
+                            self.logger,
+                            plugin_type,
+                            path,
+                            self.hooks,
+                            self.index,
+                            self.lazy,
+                            self.profiler,
+                            self.manifests,
+                            self.options,
+                        )
+                    except Exception:
+                        self.logger.exception("An error occurred while loading %s plugins: ", plugin_type)
+            if self.index is not None:
+                self.index.save()
+            if self.manifests is not None:
+                self.manifests.save()
+
+    def refresh(self):
+        """
+        Reload the plugins whose files changed since the previous check.
+
+        Returns:
+            list: The names of the reloaded plugin modules, or of every module if a hook changed.
+        """
+        changed = self.watcher.changes()
+        if not changed:
+            return []
+        with self.lock:
+            hooks_dir = os.path.abspath(self.hooks_dir) if self.hooks_dir else None
+            if hooks_dir and any(path == hooks_dir or path.startswith(hooks_dir + os.sep) for path in changed):
+                self.logger.info("Hooks changed, reloading every plugin and hook")
+                self.load()
+                if self.workers is not None:
+                    self.workers.recycle()
+                return sorted(
+                    plugin["module_name"] for manager in self.managers.values() for plugin in manager.plugins.values()
+                )
+
+            reloaded = []
+            for plugin_type, manager in self.managers.items():
+                # A pipeline reloads the plugins of every type
+                modules = manager.reload(self.plugins if self.pipeline else self.plugins[plugin_type], changed)
+                if modules:
+                    manager.resolve_dependencies()
+                    manager.topological_sort()
+                    reloaded.extend(sorted(modules))
+            if self.index is not None:
+                self.index.save()
+            if self.manifests is not None:
+                self.manifests.save()
+            if reloaded and self.workers is not None:
+                # Workers cache the plugins they imported
+                self.workers.recycle()
+            return reloaded
+
+    def run(self, types=None):
+        """
+        Run the prepared plugins, then flush the hooks.
+
+        Args:
+            types (list, optional): Only run the plugins of these types, in this order. The plugins
+                of a pipeline run together, under the ``core+users`` type.
+
+        Returns:
+            dict: The response, with the plugins run and the errors of each type.
+        """
+        with self.lock:
+            start = time.perf_counter()
+            plugins = {}
+            errors = {}
+            for plugin_type in types or list(self.managers):
+                manager = self.managers.get(plugin_type)
+                if manager is None:
+                    errors[plugin_type] = "Unknown plugin type"
+                    continue
+                try:
+                    plugins[plugin_type] = run_plugins(
+                        manager,
+                        self.scheduler,
+                        self.profiler,
+                        self.workers,
+                        plugin_type,
+                        self.cache,
+                        self.state,
+                        self.on_failure,
+                    )
+                except Exception as err:
+                    self.logger.exception("An error occurred while processing %s plugins: ", plugin_type)
+                    errors[plugin_type] = repr(err)
+            # Deliver queued hook events, exporters reopen their file on the next run
+            close_hooks(self.hooks)
+            if self.state is not None:
+                self.state.save()
+            if getattr(self.scheduler, "history", None) is not None:
+                self.scheduler.history.save()
+            self.runs += 1
+            return {
+                "status": "error" if errors else "ok",
+                "plugins": plugins,
+                "errors": errors,
+                "elapsed": time.perf_counter() - start,
+            }
+
+    def status(self):
+        """
+        Describe the state of the daemon.
+
+        Returns:
+            dict: The plugins of each type, the hooks, the number of runs and the uptime.
+        """
+        with self.lock:
+            return {
+                "status": "ok",
+                "plugins": {plugin_type: manager.sorted_plugins for plugin_type, manager in self.managers.items()},
+                "hooks": sorted(self.hooks or {}),
+                "runs": self.runs,
+                "uptime": time.monotonic() - self.started if self.started is not None else 0.0,
+            }
+
+    def handle(self, message):
+        """
+        Handle a request.
+
+        Args:
+            message (dict): The request, with a ``command`` key and the parameters of the command.
+
+        Returns:
+            dict: The response.
+        """
+        command = message.get("command")
+        self.logger.debug("Received request: %s", message)
+        if command == "run":
+            return self.run(message.get("types"))
+        if command == "reload":
+            return {"status": "ok", "reloaded": self.refresh()}
+        if command == "status":
+            return self.status()
+        if command == "stop":
+            threading.Thread(target=self.stop, daemon=True).start()
+            return {"status": "ok"}
+        return {"status": "error", "error": f"Unknown command: {command}"}
+
+    def watch(self):
+        """Reload changed plugins until the daemon stops."""
+        while self.watcher.wait():
+            try:
+                reloaded = self.refresh()
+            except Exception:
+                self.logger.exception("Failed to reload plugins: ")
+                continue
+            if reloaded:
+                self.logger.info("Reloaded plugins: %s", reloaded)
+        self.watcher.close()
+
+    def start(self):
+        """
+        Load the plugins, start watching their directories and listen on the socket.
+
+        Raises:
+            FileExistsError: If another daemon is listening on the socket.
+        """
+        if os.path.exists(self.socket_path):
+            try:
+                request(self.socket_path, "status", timeout=PROBE_TIMEOUT)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Left over by a daemon that did not stop cleanly
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(self.socket_path)
+            except OSError as err:
+                raise FileExistsError(f"{self.socket_path} is in use: {err}") from err
+            else:
+                raise FileExistsError(f"A daemon is already listening on {self.socket_path}")
+        self.load()
+        directories = list(self.plugins.values()) + [self.hooks_dir]
+        self.watcher = Watcher(self.logger, directories, self.interval)
+        self.watch_thread = threading.Thread(target=self.watch, name="plugin-watcher", daemon=True)
+        self.watch_thread.start()
+
+        directory = os.path.dirname(os.path.abspath(self.socket_path))
+        os.makedirs(directory, exist_ok=True)
+        self.server = Server(self.socket_path, RequestHandler)
+        os.chmod(self.socket_path, 0o600)
+        self.server.daemon = self
+        self.started = time.monotonic()
+        self.logger.info("Listening on %s", self.socket_path)
+
+    def serve_forever(self):
+        """Start the daemon and handle requests until it is stopped."""
+        self.start()
+        try:
+            self.server.serve_forever()
+        finally:
+            self.close()
+
+    def stop(self):
+        """Stop handling requests, ``serve_forever`` returns once the current requests are handled."""
+        if self.server is not None:
+            self.server.shutdown()
+
+    def close(self):
+        """Stop watching, close the socket and the hooks."""
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watch_thread.join()
+        if self.server is not None:
+            self.server.server_close()
+            self.server = None
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+        with self.lock:
+            close_hooks(self.hooks)
+        if self.index is not None:
+            self.index.save()
+        if self.manifests is not None:
+            self.manifests.save()
+        self.logger.info("Daemon stopped")
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import functools
+import inspect
+import threading
+
+
+# Deliveries scheduled on a running event loop, referenced until they complete
+PENDING_DELIVERIES = set()
+
+
+def deliver(hook, events, logger):
+    """
+    Deliver a batch of events to a hook.
+
+    Hooks implementing ``trigger_batch`` receive the whole batch in one call, as long as
+    every event was triggered with a single argument or none, other hooks are triggered
+    once per event with its arguments. Async hooks are run to completion, or scheduled
+    when delivered from a running event loop.
+
+    Args:
+        hook: The hook instance.
+        events (list): The ``(args, kwargs)`` of each trigger.
+        logger (Logger): Logs the failures of the scheduled deliveries.
+    """
+    trigger_batch = getattr(hook, "trigger_batch", None)
+    if trigger_batch is not None and all(len(args) <= 1 and not kwargs for args, kwargs in events):
+        results = [trigger_batch([args[0] if args else None for args, _kwargs in events])]
+    else:
+        results = [hook.trigger(*args, **kwargs) for args, kwargs in events]
+
+    for result in results:
+        if not inspect.isawaitable(result):
+            continue
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            asyncio.run(result)
+        else:
+            task = asyncio.ensure_future(result)
+            PENDING_DELIVERIES.add(task)
+            task.add_done_callback(functools.partial(delivered, logger))
+
+
+def delivered(logger, task):
+    """Forget a scheduled delivery once it completed, logging its failure."""
+    PENDING_DELIVERIES.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Failed to deliver events to an async hook", exc_info=task.exception())
+
+
+def restore(hook):
+    """Return the hook unchanged, used to send batched hooks to worker processes unwrapped."""
+    return hook
+
+
+class HookDispatcher:
+    """
+    An event queue delivering hook events in batches.
+
+    Events are queued per hook and delivered when a hook queue reaches ``batch_size`` events
+    or every ``interval`` seconds, whichever comes first. Batches of a hook are delivered in
+    order and never concurrently. Closing the dispatcher at the end of a run delivers every
+    queued event, the background thread starts again with the first event of the next run.
+    """
+
+    def __init__(self, logger, batch_size=100, interval=1.0):
+        """
+        Initialize the HookDispatcher instance.
+
+        Args:
+            logger (Logger): The logger to use for logging.
+            batch_size (int, optional): The number of queued events triggering a delivery.
+            interval (float, optional): The maximum time in seconds an event stays queued.
+                Disables time based deliveries if None or 0.
+        """
+        self.logger = logger
+        self.batch_size = batch_size
+        self.interval = interval
+        self.queues = {}
+        self.hooks = {}
+        self.lock = threading.Lock()
+        self.delivery_locks = {}
+        self.stopped = None
+        self.thread = None
+
+    def start(self):
+        """Start the background thread delivering queued events every ``interval`` seconds."""
+        with self.lock:
+            if not self.interval or self.thread is not None:
+                return
+            self.stopped = threading.Event()
+            self.thread = threading.Thread(target=self.run, args=(self.stopped,), name="hook-dispatcher", daemon=True)
+            self.thread.start()
+
+    def run(self, stopped):
+        """Deliver queued events periodically until the dispatcher is closed."""
+        while not stopped.wait(self.interval):
+            self.flush()
+
+    def register(self, name, hook):
+        """
+        Register a hook to dispatch events to.
+
+        Args:
+            name (str): The name of the hook.
+            hook: The hook instance.
+        """
+        with self.lock:
+            self.hooks[name] = hook
+            self.queues[name] = []
+            self.delivery_locks[name] = threading.Lock()
+
+    def emit(self, name, args=(), kwargs=None):
+        """
+        Queue an event for a hook, starting the background thread again if the dispatcher was closed.
+
+        Args:
+            name (str): The name of the hook.
+            args (tuple, optional): The positional arguments of the trigger.
+            kwargs (dict, optional): The keyword arguments of the trigger.
+        """
+        if self.thread is None:
+            self.start()
+        with self.lock:
+            queue = self.queues[name]
+            queue.append((args, kwargs or {}))
+            full = len(queue) >= self.batch_size
+        if full:
+            self.flush(name)
+
+    def flush(self, name=None):
+        """
+        Deliver the queued events.
+
+        Args:
+            name (str, optional): Only deliver the events of this hook.
+        """
+        names = [name] if name is not None else list(self.queues)
+        for hook_name in names:
+            with self.delivery_locks[hook_name]:
+                with self.lock:
+                    events = self.queues[hook_name]
+                    self.queues[hook_name] = []
+                if not events:
+                    continue
+                self.logger.debug("Delivering %d events to hook %s", len(events), hook_name)
+                try:
+                    deliver(self.hooks[hook_name], events, self.logger)
+                except Exception:
+                    self.logger.exception("Failed to deliver %d events to hook %s", len(events), hook_name)
+
+    def close(self):
+        """Stop the background thread and deliver the remaining events."""
+        with self.lock:
+            thread, stopped = self.thread, self.stopped
+            self.thread = None
+        if thread is not None:
+            stopped.set()
+            thread.join()
+        self.flush()
+
+
+class BatchedHook:
+    """A wrapper queuing the triggers of a hook in a dispatcher instead of calling it directly."""
+
+    def __init__(self, hook, dispatcher, name):
+        """
+        Initialize the BatchedHook instance.
+
+        Args:
+            hook: The hook instance to wrap.
+            dispatcher (HookDispatcher): The dispatcher delivering the events.
+            name (str): The name of the hook.
+        """
+        self.hook = hook
+        self.dispatcher = dispatcher
+        self.name = name
+        dispatcher.register(name, hook)
+
+    def trigger(self, *args, **kwargs):
+        """
+        Queue a trigger of the wrapped hook.
+
+        Args:
+            *args: The positional arguments passed to the hook.
+            **kwargs: The keyword arguments passed to the hook.
+        """
+        self.dispatcher.emit(self.name, args, kwargs)
+
+    def flush(self):
+        """Deliver the queued events of the wrapped hook."""
+        self.dispatcher.flush(self.name)
+
+    def close(self):
+        """Close the dispatcher, delivering the queued events, and close the wrapped hook if it supports it."""
+        self.dispatcher.close()
+        close = getattr(self.hook, "close", None)
+        if close is not None:
+            close()
+
+    def __reduce__(self):
+        # Worker processes cannot share the queue and trigger the hook directly
+        return restore, (self.hook,)
+
+    def __getattr__(self, name):
+        if name in ("hook", "dispatcher", "name"):
+            raise AttributeError(name)
+        return getattr(self.hook, name)
@@ -21,3 +21,15 @@ class PluginExecutionError(PluginError):
     """Error raised when a plugin execution fails."""
 
     pass
+
+
+class PluginManifestError(PluginError):
+    """Error raised when a plugin or hook manifest is invalid."""
+
+    pass
+
+
+class PluginBudgetError(PluginExecutionError):
+    """Error raised when a plugin exceeds its wall time, memory or CPU time budget."""
+
+    pass
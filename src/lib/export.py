@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+import gzip
+import os
+import threading
+
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+COMPRESSIONS = (None, "gzip", "zstd")
+
+
+class StreamExporter:
+    """
+    Base class for hooks streaming plugin results to a file.
+
+    Results are encoded one by one with ``encode`` and written through a buffered writer that
+    is flushed every ``flush_records`` results or ``flush_bytes`` bytes, so memory use does not
+    grow with the number of results. The file is opened on the first result and can be
+    compressed with gzip, or zstd when the ``zstandard`` package is installed.
+    """
+
+    def __init__(self, logger, **kwargs):
+        """
+        Initialize the StreamExporter instance.
+
+        Args:
+            logger (Logger): The logger to use for logging.
+            **kwargs: Overrides of the ``path``, ``compression``, ``buffer_size``,
+                ``flush_records`` and ``flush_bytes`` settings.
+        """
+        self.logger = logger
+        self.path = None
+        self.compression = None
+        self.buffer_size = 64 * 1024
+        self.flush_records = 1000
+        self.flush_bytes = 1024 * 1024
+        # Assign each value from kwargs to an instance variable
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+        self.file = None
+        self.raw = None
+        self.lock = threading.Lock()
+        self.records = 0
+        self.pending_records = 0
+        self.pending_bytes = 0
+
+        if self.compression not in COMPRESSIONS:
+            self.disable("unknown compression %s" % self.compression)
+        elif self.compression == "zstd" and zstandard is None:
+            self.disable("zstd compression requires the zstandard package")
+
+    def disable(self, reason):
+        """
+        Disable the export, logging why.
+
+        Args:
+            reason (str): Why the export is disabled.
+        """
+        if self.path is not None:
+            self.logger.error("%s export disabled: %s", type(self).__name__, reason)
+        self.path = None
+
+    def encode(self, event):
+        """
+        Encode one result.
+
+        Args:
+            event: The result to encode.
+
+        Returns:
+            bytes: The encoded result.
+        """
+        raise NotImplementedError
+
+    def open(self):
+        """Open the output file for appending, with the configured compression."""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self.raw = open(self.path, "ab", buffering=self.buffer_size)
+        if self.compression == "gzip":
+            self.file = gzip.GzipFile(fileobj=self.raw, mode="ab")
+        elif self.compression == "zstd":
+            self.file = zstandard.ZstdCompressor().stream_writer(self.raw)
+        else:
+            self.file = self.raw
+        self.logger.info("Exporting results to %s", self.path)
+
+    def write(self, events):
+        """
+        Encode and write results, flushing once a threshold is reached.
+
+        Args:
+            events (list): The results to write.
+        """
+        if not events or self.path is None:
+            return
+        with self.lock:
+            if self.file is None:
+                self.open()
+            for event in events:
+                data = self.encode(event)
+                self.file.write(data)
+                self.records += 1
+                self.pending_records += 1
+                self.pending_bytes += len(data)
+            if self.pending_records >= self.flush_records or self.pending_bytes >= self.flush_bytes:
+                self.flush_file()
+
+    def flush_file(self):
+        """Flush the buffered results to disk, the lock must be held."""
+        if self.file is None:
+            return
+        self.file.flush()
+        if self.file is not self.raw:
+            self.raw.flush()
+        self.pending_records = 0
+        self.pending_bytes = 0
+
+    def flush(self):
+        """Flush the buffered results to disk."""
+        with self.lock:
+            self.flush_file()
+
+    def close(self):
+        """Flush and close the output file."""
+        with self.lock:
+            if self.file is None:
+                return
+            self.flush_file()
+            self.file.close()
+            if self.file is not self.raw:
+                self.raw.close()
+            self.file = None
+            self.raw = None
+            self.logger.info("Exported %d results to %s", self.records, self.path)
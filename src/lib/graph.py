@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+from collections import deque
+
+
+class DependencyGraph:
+    """
+    An adjacency index of plugin dependencies resolved in linear time.
+
+    The graph is built once from the ``DEPENDENCY`` entries of the plugins and sorted with
+    Kahn's algorithm. Missing dependencies and dependency cycles are found in the same pass.
+    """
+
+    def __init__(self, dependencies, known=None):
+        """
+        Initialize the DependencyGraph instance.
+
+        Args:
+            dependencies (dict): A mapping of plugin names to the names they depend on.
+            known (iterable, optional): The registered plugin names. Dependencies outside of
+                this set are reported as missing. All dependencies are known if not provided.
+        """
+        known = set(known) if known is not None else None
+        self.nodes = {}
+        self.dependents = {}
+        self.missing = {}
+
+        for name, deps in dependencies.items():
+            self.nodes.setdefault(name, [])
+            self.dependents.setdefault(name, [])
+            for dep in deps:
+                dep = dep.strip() if dep else dep
+                if not dep:
+                    continue
+                if known is not None and dep not in known:
+                    self.missing.setdefault(name, []).append(dep)
+                    continue
+                self.nodes[name].append(dep)
+                self.nodes.setdefault(dep, [])
+                self.dependents.setdefault(dep, []).append(name)
+
+        self.levels = []
+        self.blocked = []
+        self.cycle = []
+        self.sort()
+
+    def sort(self):
+        """
+        Group the plugins into execution levels.
+
+        Every plugin of a level only depends on plugins of earlier levels, so the plugins of a
+        level can run concurrently. Plugins with missing dependencies, in a cycle, or depending
+        on either are left out of the levels and listed in ``blocked``.
+
+        Returns:
+            list: The execution levels, each a list of plugin names.
+        """
+        in_degree = {name: len(deps) for name, deps in self.nodes.items()}
+        unusable = deque(self.missing)
+        excluded = set(self.missing)
+        while unusable:
+            for dependent in self.dependents[unusable.popleft()]:
+                if dependent not in excluded:
+                    excluded.add(dependent)
+                    unusable.append(dependent)
+
+        level = [name for name, degree in in_degree.items() if degree == 0 and name not in excluded]
+        self.levels = []
+        sorted_count = 0
+        while level:
+            self.levels.append(level)
+            sorted_count += len(level)
+            next_level = []
+            for name in level:
+                for dependent in self.dependents[name]:
+                    in_degree[dependent] -= 1
+                    if in_degree[dependent] == 0 and dependent not in excluded:
+                        next_level.append(dependent)
+            level = next_level
+
+        placed = {name for level in self.levels for name in level}
+        self.blocked = [name for name in self.nodes if name not in placed]
+        if sorted_count + len(excluded) < len(self.nodes):
+            self.cycle = self.find_cycle(placed | excluded)
+        else:
+            self.cycle = []
+        return self.levels
+
+    def find_cycle(self, acyclic):
+        """
+        Find the exact plugins forming one dependency cycle.
+
+        Args:
+            acyclic (set): Plugins known not to be part of a cycle.
+
+        Returns:
+            list: The plugin names of the cycle in dependency order, empty if there is none.
+        """
+        # Every remaining plugin has a dependency left, so following them must loop
+        remaining = [name for name in self.nodes if name not in acyclic]
+        if not remaining:
+            return []
+        path = {}
+        name = remaining[0]
+        while name not in path:
+            path[name] = len(path)
+            name = next(dep for dep in self.nodes[name] if dep not in acyclic)
+        return list(path)[path[name] :]
+
+    def order(self):
+        """
+        Return the plugins in a valid execution order.
+
+        Returns:
+            list: The plugin names, each after all of its dependencies.
+        """
+        return [name for level in self.levels for name in level]
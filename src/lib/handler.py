@@ -1,25 +1,76 @@
 # -*- coding: utf-8 -*-
+from concurrent.futures import ThreadPoolExecutor
+
+from src.lib.buffers import BUFFERS_HOOK, ResultBuffers
 from src.lib.hooks import HookManager
+from src.lib.pipeline import PluginPipeline
 from src.lib.plugins import PluginManager
+from src.lib.profiler import ProfiledHook, measure
+from src.lib.results import ResultStore
+from src.lib.scheduler import DagScheduler, run_plugin
 
 
-def HookHandler(logger, hook_dir=None):
+def HookHandler(
+    logger,
+    hook_dir=None,
+    index=None,
+    lazy=False,
+    profiler=None,
+    batch=None,
+    options=None,
+    buffers=False,
+    manifests=None,
+):
     """
     Process hooks of the specified type.
 
     Args:
         logger: The logger object for logging messages.
         hook_dir (str, optional): The directory containing the hooks. If not provided, the current directory is used.
+        index (DiscoveryIndex, optional): The discovery index used to speed up hook discovery.
+        lazy (bool, optional): Import hooks the first time they are triggered instead of up front.
+        profiler (Profiler, optional): Record the duration of each phase and of every hook trigger.
+        batch (dict, optional): Queue hook triggers and deliver them in batches, with the ``size``
+            and ``interval`` keys of ``HookManager.batch``. Close the hooks with ``close_hooks``.
+        options (dict, optional): Keyword arguments passed to each hook, keyed by hook name.
+        buffers (bool, optional): Add shared memory result buffers to the hooks, as ``buffers``.
+        manifests (ManifestCache, optional): The cache of compiled hook manifests.
     """
 
     # Create an instance of the PluginManager
-    hook_manager = HookManager(logger)
+    hook_manager = HookManager(logger, index, lazy, options, manifests)
     # Discover hooks in the specified directory
-    hook_manager.discover(hook_dir)
-    return hook_manager.register() or None
+    with measure(profiler, "phase", "hooks.discover"):
+        hook_manager.discover(hook_dir)
+    with measure(profiler, "phase", "hooks.register"):
+        hooks = hook_manager.register()
+    if profiler is not None:
+        hooks = {name: ProfiledHook(hook, profiler, name) for name, hook in hooks.items()}
+    if batch is not None and hooks:
+        hooks = hook_manager.batch(hooks, **batch)
+    if buffers:
+        # Last, so hooks are closed before the buffers they were given
+        hooks = dict(hooks or {})
+        hooks[BUFFERS_HOOK] = ResultBuffers(logger)
+    return hooks or None
 
 
-def PluginHandler(logger, plugin_type, plugins_dir=None, hooks=None):
+def PluginHandler(
+    logger,
+    plugin_type,
+    plugins_dir=None,
+    hooks=None,
+    index=None,
+    lazy=False,
+    scheduler=None,
+    profiler=None,
+    workers=None,
+    cache=None,
+    state=None,
+    manifests=None,
+    options=None,
+    on_failure="skip",
+):
     """
     Process plugins of the specified type.
 
@@ -27,35 +78,27 @@ def PluginHandler(logger, plugin_type, plugins_dir=None, hooks=None):
         plugin_type (str): The type of plugins to process (e.g., 'core_plugins', 'scanners').
         logger: An instance of the logger to log messages.
         configuration (dict): The configuration settings for the application.
+        index (DiscoveryIndex, optional): The discovery index used to speed up plugin discovery.
+        lazy (bool, optional): Import plugins the first time they are executed instead of up front.
+        scheduler (DagScheduler, optional): Run independent plugins concurrently. Plugins run serially if not provided.
+        profiler (Profiler, optional): Record the duration of each phase and of every plugin step.
+        workers (WorkerPool, optional): Run the plugins it isolates in worker processes.
+        cache (ResultCache, optional): Skip the plugins whose result is cached.
+        state (RunState, optional): Only run the plugins downstream of a change since the previous run.
+        manifests (ManifestCache, optional): The cache of compiled plugin manifests.
+        options (dict, optional): Keyword arguments passed to each plugin, keyed by plugin name.
+        on_failure (str, optional): ``skip`` or ``degrade`` the plugins depending on a failed plugin,
+            when plugins run serially.
 
     Returns:
         bool: True if processing completes successfully, False otherwise.
     """
     try:
         logger.info("Processing %s plugins...", plugin_type)
-        # Create an instance of the PluginManager
-        plugin_manager = PluginManager(logger, hooks)
-
-        # Discover plugins in the specified directory
-        plugin_manager.discover(plugins_dir)
-
-        # Load plugins
-        plugin_manager.load()
-
-        # Register plugins with the PluginManager
-        plugin_manager.register()
-
-        # Get dependencies for each registered plugin
-        plugin_manager.get_dependencies()
-
-        # Resolve dependencies
-        plugin_manager.resolve_dependencies()
-
-        # Iterate over sorted plugins and execute them
-        for plugin_name in plugin_manager.topological_sort():
-            plugin_instance = plugin_manager.registered_plugins[plugin_name]
-            plugin_instance.execute()
-            plugin_instance.process_results()
+        plugin_manager = prepare_plugins(
+            logger, plugin_type, plugins_dir, hooks, index, lazy, profiler, manifests, options
+        )
+        run_plugins(plugin_manager, scheduler, profiler, workers, plugin_type, cache, state, on_failure)
 
         logger.info("Processing %s plugins successfully...", plugin_type)
         return True  # Processing completes successfully
@@ -68,3 +111,285 @@ def PluginHandler(logger, plugin_type, plugins_dir=None, hooks=None):
     except Exception:
         logger.exception("An error occurred while processing %s plugins: ", plugin_type)
         return False
+
+
+def PipelineHandler(
+    logger,
+    plugin_dirs,
+    hooks=None,
+    index=None,
+    lazy=False,
+    scheduler=None,
+    profiler=None,
+    workers=None,
+    cache=None,
+    state=None,
+    manifests=None,
+    options=None,
+    on_failure="skip",
+):
+    """
+    Process the plugins of every type in a single pass.
+
+    Plugins may depend on plugins of other types, and a plugin starts as soon as its own
+    dependencies have completed instead of after every plugin of the types before its own.
+
+    Args:
+        logger: An instance of the logger to log messages.
+        plugin_dirs (dict): The directories containing the plugins, keyed by plugin type.
+        See ``PluginHandler`` for the other arguments.
+
+    Returns:
+        bool: True if processing completes successfully, False otherwise.
+    """
+    try:
+        logger.info("Processing %s plugins...", "+".join(plugin_dirs))
+        pipeline = prepare_pipeline(logger, plugin_dirs, hooks, index, lazy, profiler, manifests, options)
+        run_plugins(pipeline, scheduler, profiler, workers, pipeline.name, cache, state, on_failure)
+
+        logger.info("Processing %s plugins successfully...", pipeline.name)
+        return True  # Processing completes successfully
+    except Exception:
+        logger.exception("An error occurred while processing %s plugins: ", "+".join(plugin_dirs))
+        return False
+
+
+def prepare_plugins(
+    logger,
+    plugin_type,
+    plugins_dir=None,
+    hooks=None,
+    index=None,
+    lazy=False,
+    profiler=None,
+    manifests=None,
+    options=None,
+):
+    """
+    Discover, load and register plugins of the specified type, and sort them by dependencies.
+
+    Args:
+        logger: An instance of the logger to log messages.
+        plugin_type (str): The type of plugins to process (e.g., 'core_plugins', 'scanners').
+        plugins_dir (str, optional): The directory containing the plugins.
+        hooks (dict, optional): The hooks passed to each plugin.
+        index (DiscoveryIndex, optional): The discovery index used to speed up plugin discovery.
+        lazy (bool, optional): Import plugins the first time they are executed instead of up front.
+        profiler (Profiler, optional): Record the duration of each phase.
+        manifests (ManifestCache, optional): The cache of compiled plugin manifests.
+        options (dict, optional): Keyword arguments passed to each plugin, keyed by plugin name.
+
+    Returns:
+        PluginManager: The plugin manager, ready to run its sorted plugins.
+    """
+    plugin_manager = register_plugins(
+        logger, plugin_type, plugins_dir, hooks, index, lazy, profiler, manifests, options
+    )
+
+    # Resolve dependencies
+    with measure(profiler, "phase", f"{plugin_type}.resolve"):
+        plugin_manager.resolve_dependencies()
+
+    with measure(profiler, "phase", f"{plugin_type}.sort"):
+        plugin_manager.topological_sort()
+
+    return plugin_manager
+
+
+def register_plugins(
+    logger,
+    plugin_type,
+    plugins_dir=None,
+    hooks=None,
+    index=None,
+    lazy=False,
+    profiler=None,
+    manifests=None,
+    options=None,
+):
+    """
+    Discover, load and register plugins of the specified type, and read their dependencies.
+
+    Args:
+        See ``prepare_plugins``.
+
+    Returns:
+        PluginManager: The plugin manager, with its registered plugins and their dependencies.
+    """
+    # Create an instance of the PluginManager
+    plugin_manager = PluginManager(logger, hooks, index, lazy, manifests, options)
+
+    # Discover plugins in the specified directory
+    with measure(profiler, "phase", f"{plugin_type}.discover"):
+        plugin_manager.discover(plugins_dir)
+
+    # Load plugins
+    with measure(profiler, "phase", f"{plugin_type}.load"):
+        plugin_manager.load()
+
+    # Register plugins with the PluginManager
+    with measure(profiler, "phase", f"{plugin_type}.register"):
+        plugin_manager.register()
+
+    # Get dependencies for each registered plugin
+    with measure(profiler, "phase", f"{plugin_type}.get_dependencies"):
+        plugin_manager.get_dependencies()
+
+    return plugin_manager
+
+
+def prepare_pipeline(
+    logger, plugin_dirs, hooks=None, index=None, lazy=False, profiler=None, manifests=None, options=None
+):
+    """
+    Register the plugins of every type concurrently, and sort them together by dependencies.
+
+    Args:
+        logger: An instance of the logger to log messages.
+        plugin_dirs (dict): The directories containing the plugins, keyed by plugin type. Plugins
+            of the first types take precedence over plugins of the same name of later types.
+        hooks (dict, optional): The hooks passed to each plugin.
+        index (DiscoveryIndex, optional): The discovery index used to speed up plugin discovery.
+        lazy (bool, optional): Import plugins the first time they are executed instead of up front.
+        profiler (Profiler, optional): Record the duration of each phase.
+        manifests (ManifestCache, optional): The cache of compiled plugin manifests.
+        options (dict, optional): Keyword arguments passed to each plugin, keyed by plugin name.
+
+    Returns:
+        PluginPipeline: The plugins of every type, ready to run in a single pass.
+    """
+    pipeline = PluginPipeline(logger, hooks)
+    with ThreadPoolExecutor(max_workers=max(len(plugin_dirs), 1)) as executor:
+        futures = {
+            plugin_type: executor.submit(
+                register_plugins, logger, plugin_type, path, hooks, index, lazy, profiler, manifests, options
+            )
+            for plugin_type, path in plugin_dirs.items()
+        }
+    for plugin_type, future in futures.items():
+        try:
+            pipeline.add(plugin_type, future.result())
+        except Exception:
+            logger.exception("An error occurred while loading %s plugins: ", plugin_type)
+
+    with measure(profiler, "phase", "pipeline.resolve"):
+        pipeline.resolve_dependencies()
+
+    with measure(profiler, "phase", "pipeline.sort"):
+        pipeline.topological_sort()
+
+    return pipeline
+
+
+def run_plugins(
+    plugin_manager,
+    scheduler=None,
+    profiler=None,
+    workers=None,
+    plugin_type=None,
+    cache=None,
+    state=None,
+    on_failure="skip",
+):
+    """
+    Run the sorted plugins of a plugin manager.
+
+    Each plugin gets the values returned by the ``execute`` step of its dependencies in its
+    ``inputs`` attribute, a dictionary keyed by dependency name. With a cache, a plugin whose
+    source, keyword arguments and inputs are unchanged since a cached run is not run at all:
+    neither its ``execute`` nor its ``process_results`` step is called, its cached result
+    is passed to its dependents and the hook triggers of the cached run are replayed. With a
+    run state, the plugins unchanged since the previous run, and not downstream of a changed
+    plugin, are replayed the same way.
+
+    Args:
+        plugin_manager (PluginManager): The plugin manager, prepared with ``prepare_plugins``.
+        scheduler (DagScheduler, optional): Run independent plugins concurrently. Plugins run serially if not provided.
+        profiler (Profiler, optional): Record the duration of every plugin step.
+        workers (WorkerPool, optional): Run the plugins it isolates in worker processes. Ignored
+            by the process and remote executors, which already run every plugin in a worker process.
+        plugin_type (str, optional): The type of the plugins, to find the isolated ones and to
+            keep the state of an incremental run.
+        cache (ResultCache, optional): The cache of the results of previous runs.
+        state (RunState, optional): The state of the previous run, for an incremental run.
+        on_failure (str, optional): ``skip`` the plugins depending on a failed plugin, or
+            ``degrade`` to run them without its result, when plugins run serially. A scheduler
+            uses its own ``on_failure``.
+
+    Returns:
+        list: The names of the plugins run, in order.
+
+    Raises:
+        PluginExecutionError: If one or more plugins failed, once the others have run.
+    """
+    sorted_plugins = plugin_manager.sorted_plugins
+    hooks = plugin_manager.hooks
+    executor = getattr(scheduler, "executor", None)
+    if executor in ("process", "remote"):
+        workers = None
+    # The plugins of a pipeline have their own types
+    types = getattr(plugin_manager, "types", {})
+    isolated = {
+        name for name in sorted_plugins if workers is not None and workers.isolates(types.get(name, plugin_type), name)
+    }
+    # Pass the results of each plugin to the plugins depending on it
+    sources = None
+    plan = None
+    if cache is not None or state is not None:
+        sources = {
+            name: (plugin["module_directory"], plugin.get("kwargs"))
+            for name, plugin in plugin_manager.plugins.items()
+            if name in sorted_plugins
+        }
+    if state is not None:
+        plan = state.plan(plugin_type, sorted_plugins, plugin_manager.dependencies, sources)
+    store = ResultStore(plugin_manager.logger, plugin_manager.dependencies, sorted_plugins, cache, sources, plan)
+    # Store the hook triggers of each plugin with its result, to replay them when its result is reused
+    originals = store.record_hooks(hooks)
+    try:
+        if scheduler is not None:
+            # Dispatch plugins as soon as their dependencies have completed
+            tasks = {}
+            for plugin_name in sorted_plugins:
+                if plugin_name in isolated:
+                    plugin = plugin_manager.plugins[plugin_name]
+                    tasks[plugin_name] = workers.task(plugin, plugin_name, hooks, scheduler, profiler)
+                elif executor == "remote":
+                    # The workers of a coordinator import the plugins themselves
+                    tasks[plugin_name] = scheduler.task(plugin_manager.plugins[plugin_name], plugin_name, profiler)
+                else:
+                    plugin_instance = plugin_manager.registered_plugins[plugin_name]
+                    tasks[plugin_name] = scheduler.task(plugin_instance, plugin_name, profiler)
+            priorities = plugin_manager.get_priorities()
+            plugin_types = {name: types.get(name, plugin_type) for name in sorted_plugins}
+            scheduler.run(tasks, plugin_manager.dependencies, hooks, store, priorities, plugin_types)
+        else:
+            # Iterate over sorted plugins and execute them, a failure skips or degrades its dependents
+            tracker = DagScheduler(plugin_manager.logger, on_failure=on_failure)
+            tracker.prepare(dict.fromkeys(sorted_plugins), plugin_manager.dependencies, store)
+            for plugin_name in sorted_plugins:
+                if plugin_name in tracker.skipped:
+                    continue
+                hit, result = store.lookup(plugin_name)
+                if hit:
+                    tracker.complete(plugin_name, result)
+                    continue
+                inputs = store.inputs(plugin_name)
+                try:
+                    if plugin_name in isolated:
+                        plugin = plugin_manager.plugins[plugin_name]
+                        function, args = workers.task(plugin, plugin_name, hooks, None, profiler)
+                        result = function(*args, inputs=inputs)
+                    else:
+                        result = run_plugin(
+                            plugin_manager.registered_plugins[plugin_name], plugin_name, profiler, inputs
+                        )
+                except Exception as err:
+                    tracker.fail(plugin_name, err)
+                    continue
+                tracker.complete(plugin_name, result)
+            tracker.finish()
+    finally:
+        store.restore_hooks(hooks, originals)
+    plugin_manager.logger.debug("Peak number of stored results: %d", store.peak)
+    return sorted_plugins
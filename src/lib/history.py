@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import threading
+
+
+class RuntimeHistory:
+    """
+    A persistent history of the durations of the plugins, to estimate the next ones.
+
+    The estimate of a plugin is an exponential moving average of its durations, so it follows
+    a plugin getting slower or faster over a few runs without being thrown off by one outlier.
+    Plugins are keyed by ``type:name``, see ``DagScheduler.history_key``.
+    """
+
+    FORMAT_VERSION = 2
+
+    def __init__(self, logger, path, alpha=0.3):
+        """
+        Initialize the RuntimeHistory instance.
+
+        Args:
+            logger (Logger): The logger to use for logging.
+            path (str): The path of the on-disk history file.
+            alpha (float, optional): The weight of the last duration in the estimate, between 0 and 1.
+
+        Raises:
+            ValueError: If alpha is not between 0 and 1.
+        """
+        if not 0 < alpha <= 1:
+            raise ValueError(f"The history alpha must be between 0 and 1, got {alpha}")
+        self.logger = logger
+        self.path = path
+        self.alpha = alpha
+        self.entries = {}
+        self.dirty = False
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """
+        Load the history from disk, a missing, unreadable or incompatible file results in an empty history.
+
+        Returns:
+            dict: The ``[estimate, runs]`` of each plugin, keyed by ``type:name``.
+        """
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            self.logger.debug("Runtime history %s not found, starting empty", self.path)
+            return self.entries
+        except (OSError, ValueError) as err:
+            self.logger.warning("Cannot read runtime history %s: %s", self.path, err)
+            return self.entries
+        if not isinstance(data, dict) or data.get("version") != self.FORMAT_VERSION:
+            self.logger.info("Runtime history %s is outdated, starting empty", self.path)
+            return self.entries
+        self.entries = data.get("entries", {})
+        return self.entries
+
+    def save(self):
+        """
+        Write the history to disk if it changed since it was loaded.
+
+        Returns:
+            bool: True if the history was written, False otherwise.
+        """
+        with self.lock:
+            if not self.dirty:
+                return False
+            entries = dict(self.entries)
+            self.dirty = False
+        tmp_path = self.path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(tmp_path, "w") as f:
+                json.dump({"version": self.FORMAT_VERSION, "entries": entries}, f)
+            os.replace(tmp_path, self.path)
+        except OSError as err:
+            self.logger.warning("Cannot write runtime history %s: %s", self.path, err)
+            return False
+        return True
+
+    def record(self, name, duration):
+        """
+        Record the duration of a plugin run.
+
+        Args:
+            name (str): The key of the plugin, ``type:name``.
+            duration (float): The duration of the run in seconds.
+        """
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is None:
+                self.entries[name] = [duration, 1]
+            else:
+                estimate, runs = entry
+                self.entries[name] = [estimate + self.alpha * (duration - estimate), runs + 1]
+            self.dirty = True
+
+    def estimate(self, name, default=None):
+        """
+        Return the estimated duration of a plugin.
+
+        Args:
+            name (str): The key of the plugin, ``type:name``.
+            default (float, optional): The estimate of a plugin which never ran.
+
+        Returns:
+            float: The estimated duration in seconds.
+        """
+        entry = self.entries.get(name)
+        if entry is None:
+            return default
+        return entry[0]
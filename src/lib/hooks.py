@@ -1,21 +1,75 @@
 # -*- coding: utf-8 -*-
+import asyncio
+import contextlib
+import contextvars
 import importlib.util
+import inspect
 import os
 
+from src.lib.bytecode import file_spec
+from src.lib.dispatch import BatchedHook, HookDispatcher
+from src.lib.exceptions import PluginManifestError
+from src.lib.lazy import LazyInstance, LazyModule
+from src.lib.manifest import get_manifest
+
+
+# Hook triggers recorded by the plugin running in this worker process
+RECORDED_TRIGGERS = []
+
+# The name of the plugin running in the current thread or task, its hook triggers are attributed to it
+RUNNING_PLUGIN = contextvars.ContextVar("running_plugin", default=None)
+
+
+@contextlib.contextmanager
+def running_plugin(name):
+    """
+    Attribute the hook triggers of the current thread or task to a plugin, see ``RUNNING_PLUGIN``.
+
+    Args:
+        name (str): The name of the plugin.
+    """
+    token = RUNNING_PLUGIN.set(name)
+    try:
+        yield
+    finally:
+        RUNNING_PLUGIN.reset(token)
+
+
+def close_hooks(hooks):
+    """
+    Flush and close every hook supporting it, at the end of a run.
+
+    Args:
+        hooks (dict): The registered hooks, may be None.
+    """
+    for hook in (hooks or {}).values():
+        close = getattr(hook, "close", None)
+        if close is not None:
+            close()
+
 
 class HookManager:
     """
     A class for managing hooks and triggering associated functions.
     """
 
-    def __init__(self, logger):
+    def __init__(self, logger, index=None, lazy=False, options=None, manifests=None):
         """
         Initialize the Hook instance.
 
         Args:
             logger (Logger): The logger to use for logging.
+            index (DiscoveryIndex, optional): A discovery index used instead of walking the hook folder.
+            lazy (bool, optional): Register hooks as proxies that are imported the first time they are used.
+            options (dict, optional): Keyword arguments passed to each hook, keyed by hook name.
+            manifests (ManifestCache, optional): The cache of compiled hook manifests.
         """
         self.logger = logger
+        self.index = index
+        self.lazy = lazy
+        self.options = options or {}
+        self.manifests = manifests
+        self.dispatcher = None
         self.discovered_hooks = {}
         self.registered_hooks = {}
 
@@ -33,7 +87,8 @@ class HookManager:
             self.logger.info("No hooks to discover.")
             return None
         self.logger.info("Discovering hooks in %s...", hook_folder)
-        for module_path, _dirs, files in os.walk(hook_folder):
+        walker = self.index.walk if self.index is not None else os.walk
+        for module_path, _dirs, files in walker(hook_folder):
             for file_name in files:
                 if file_name.endswith(".py") and file_name != "__init__.py":
                     relative_module_name = os.path.basename(module_path)
@@ -47,13 +102,15 @@ class HookManager:
         """
         Register function to be called when the specified hook is triggered.
         """
+        if self.lazy:
+            return self.register_lazy()
         for hook, hook_path in self.discovered_hooks.items():
             try:
                 if not os.path.exists(hook_path):
                     self.logger.error(f"Failed to import hook {hook}: {hook_path} path not found")
                     continue
-                self.logger.debug(f"Importing hook {hook}: {hook_path}")
-                spec = importlib.util.spec_from_file_location(hook, os.path.join(hook_path, "__init__.py"))
+                self.logger.debug("Importing hook %s: %s", hook, hook_path)
+                spec = file_spec(hook, os.path.join(hook_path, "__init__.py"))
                 if spec is None:
                     self.logger.error(f"Failed to import hook {hook}: {hook_path} not found")
                     continue
@@ -65,12 +122,18 @@ class HookManager:
                     module.__name__,
                     module.__version__,
                 )
-                for attr_name in dir(module):
-                    attr = getattr(module, attr_name)
-                    if type(attr) is type:
-                        self.logger.info("Registering class %s to hook %s", attr_name, hook)
-                        hook_instance = attr(self.logger)
-                        self.registered_hooks[hook] = hook_instance
+                manifest = self.hook_manifest(hook, hook_path)
+                class_name = self.hook_class(hook, hook_path, manifest)
+                if class_name is None:
+                    continue
+                hook_class = getattr(module, class_name, None)
+                if hook_class is None:
+                    self.logger.error(
+                        "Failed to register hook %s: %s is not exported by %s", hook, class_name, hook_path
+                    )
+                    continue
+                self.logger.info("Registering class %s to hook %s", class_name, hook)
+                self.registered_hooks[hook] = hook_class(self.logger, **self.options.get(hook, {}))
 
             except ImportError as err:
                 self.logger.error("Failed to import hook %s: %s", hook, err)
@@ -80,3 +143,173 @@ class HookManager:
         self.logger.debug("Registered hooks: %s", self.registered_hooks)
 
         return self.registered_hooks
+
+    def register_lazy(self):
+        """
+        Register hooks from their manifest only, deferring the module import to first use.
+        """
+        for hook, hook_path in self.discovered_hooks.items():
+            manifest = self.hook_manifest(hook, hook_path)
+            class_name = self.hook_class(hook, hook_path, manifest)
+            if class_name is None:
+                continue
+
+            module = LazyModule(self.logger, hook, os.path.join(hook_path, "__init__.py"), manifest["version"])
+            self.logger.info("Loading hook: %s version %s (lazy)", hook, module.__version__)
+            self.logger.info("Registering class %s to hook %s", class_name, hook)
+            self.registered_hooks[hook] = LazyInstance(module, class_name, self.logger, **self.options.get(hook, {}))
+
+        self.logger.debug("Registered hooks: %s", self.registered_hooks)
+
+        return self.registered_hooks
+
+    def hook_manifest(self, hook, hook_path):
+        """
+        Read the manifest of a hook.
+
+        Args:
+            hook (str): The name of the hook.
+            hook_path (str): The hook directory.
+
+        Returns:
+            dict: The manifest, see ``manifest.read_manifest``, or None if its files cannot be read.
+        """
+        try:
+            return get_manifest(hook_path, "hook", self.manifests)
+        except (PluginManifestError, OSError, SyntaxError) as err:
+            self.logger.error("Failed to read hook %s: %s", hook, err)
+            return None
+
+    def hook_class(self, hook, hook_path, manifest):
+        """
+        Return the class registered to a hook: the last class defined by its files, in source order.
+
+        Args:
+            hook (str): The name of the hook.
+            hook_path (str): The hook directory.
+            manifest (dict): The manifest of the hook, see ``hook_manifest``.
+
+        Returns:
+            str: The class name, or None if the hook has no class or its manifest could not be read.
+        """
+        if manifest is None:
+            return None
+        classes = manifest["classes"]
+        if not classes:
+            self.logger.error("Failed to register hook %s: no class found in %s", hook, hook_path)
+            return None
+        return classes[-1]
+
+    def batch(self, hooks=None, size=100, interval=1.0):
+        """
+        Queue hook triggers and deliver them in batches.
+
+        Hooks implementing ``trigger_batch(events)`` receive each batch in one call, other
+        hooks are triggered once per queued event.
+
+        Args:
+            hooks (dict, optional): The hooks to batch, the registered hooks if not provided.
+            size (int, optional): The number of queued events of a hook triggering a delivery.
+            interval (float, optional): The maximum time in seconds an event stays queued.
+
+        Returns:
+            dict: The hooks wrapped so that ``trigger`` queues the event.
+        """
+        hooks = self.registered_hooks if hooks is None else hooks
+        self.dispatcher = HookDispatcher(self.logger, size, interval)
+        batched = {name: BatchedHook(hook, self.dispatcher, name) for name, hook in hooks.items()}
+        self.dispatcher.start()
+        self.logger.info("Batching hook triggers by %d events or %ss", size, interval)
+        return batched
+
+    def flush(self):
+        """Deliver the queued hook events."""
+        if self.dispatcher is not None:
+            self.dispatcher.flush()
+
+
+class AsyncHook:
+    """
+    A wrapper allowing hooks with an ``async def trigger`` to be called from any plugin.
+
+    Async plugins running on the event loop get the coroutine back and can await it, while
+    sync plugins running in worker threads block until the coroutine completed on the loop.
+    """
+
+    def __init__(self, hook, loop=None):
+        """
+        Initialize the AsyncHook instance.
+
+        Args:
+            hook: The hook instance to wrap.
+            loop (AbstractEventLoop, optional): The event loop running async plugins.
+        """
+        self.hook = hook
+        self.loop = loop
+
+    def trigger(self, *args, **kwargs):
+        """
+        Trigger the wrapped hook.
+
+        Returns:
+            The result of the hook, or a coroutine when called from the event loop thread.
+        """
+        result = self.hook.trigger(*args, **kwargs)
+        if not inspect.isawaitable(result):
+            return result
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is not None:
+            return result
+        if self.loop is not None and self.loop.is_running():
+            return asyncio.run_coroutine_threadsafe(result, self.loop).result()
+        return asyncio.run(result)
+
+    def __getattr__(self, name):
+        if name == "hook":
+            raise AttributeError(name)
+        return getattr(self.hook, name)
+
+
+class RecordingHook:
+    """A hook copy in a worker process, recording its triggers for the parent process to replay."""
+
+    def __init__(self, name):
+        """
+        Initialize the RecordingHook instance.
+
+        Args:
+            name (str): The name of the hook.
+        """
+        self.name = name
+
+    def trigger(self, *args, **kwargs):
+        """Record a trigger of the hook."""
+        RECORDED_TRIGGERS.append((self.name, args, kwargs))
+
+
+class RelayHook(AsyncHook):
+    """
+    A wrapper sending hooks to worker processes as recording copies.
+
+    Hooks often hold locks, open files or queues that cannot be copied to another process.
+    Their triggers in a worker process are recorded instead, then replayed on the hook in
+    the parent process once the plugin completed.
+    """
+
+    def __init__(self, hook, name, loop=None):
+        """
+        Initialize the RelayHook instance.
+
+        Args:
+            hook: The hook instance to wrap.
+            name (str): The name of the hook.
+            loop (AbstractEventLoop, optional): The event loop running async plugins.
+        """
+        super().__init__(hook, loop)
+        self.name = name
+
+    def __reduce__(self):
+        return RecordingHook, (self.name,)
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+
+
+class DiscoveryIndex:
+    """
+    A persistent cache of directory listings used to speed up plugin and hook discovery.
+
+    Every directory seen during a walk is recorded with its modification time, inode and
+    listing. On the next walk a directory is only listed again when its ``stat`` no longer
+    matches the cached entry, so unchanged subtrees cost a single ``stat`` per directory.
+    """
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, logger, index_path):
+        """
+        Initialize the DiscoveryIndex instance.
+
+        Args:
+            logger (Logger): The logger to use for logging.
+            index_path (str): The path of the on-disk index file.
+        """
+        self.logger = logger
+        self.index_path = index_path
+        self.entries = {}
+        self.dirty = False
+        self.load()
+
+    def load(self):
+        """
+        Load the index from disk.
+
+        A missing, unreadable or incompatible index file results in an empty index.
+
+        Returns:
+            dict: The cached directory entries.
+        """
+        try:
+            with open(self.index_path, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            self.logger.debug("Discovery index %s not found, starting empty", self.index_path)
+            return self.entries
+        except (OSError, ValueError) as err:
+            self.logger.warning("Cannot read discovery index %s: %s", self.index_path, err)
+            return self.entries
+
+        if data.get("version") != self.FORMAT_VERSION:
+            self.logger.info("Discovery index %s is outdated, rebuilding", self.index_path)
+            return self.entries
+
+        self.entries = data.get("entries", {})
+        self.logger.debug("Loaded %d entries from discovery index %s", len(self.entries), self.index_path)
+        return self.entries
+
+    def save(self):
+        """
+        Write the index to disk if it changed since it was loaded.
+
+        Returns:
+            bool: True if the index was written, False otherwise.
+        """
+        if not self.dirty:
+            return False
+        directory = os.path.dirname(os.path.abspath(self.index_path))
+        tmp_path = self.index_path + ".tmp"
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(tmp_path, "w") as f:
+                json.dump({"version": self.FORMAT_VERSION, "entries": self.entries}, f)
+            os.replace(tmp_path, self.index_path)
+        except OSError as err:
+            self.logger.warning("Cannot write discovery index %s: %s", self.index_path, err)
+            return False
+        self.dirty = False
+        self.logger.debug("Saved %d entries to discovery index %s", len(self.entries), self.index_path)
+        return True
+
+    def listdir(self, path):
+        """
+        List a directory, reusing the cached listing when the directory did not change.
+
+        Args:
+            path (str): The directory to list.
+
+        Returns:
+            dict: The entry for the directory with ``dirs``, ``links`` and ``files`` keys.
+
+        Raises:
+            OSError: If the directory cannot be accessed.
+        """
+        key = os.path.abspath(path)
+        st = os.stat(path)
+        entry = self.entries.get(key)
+        if entry is not None and entry["mtime"] == st.st_mtime_ns and entry["inode"] == st.st_ino:
+            return entry
+
+        self.logger.debug("Rescanning directory %s", path)
+        dirs, links, files = [], [], []
+        with os.scandir(path) as it:
+            for dir_entry in it:
+                try:
+                    is_dir = dir_entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if is_dir:
+                    dirs.append(dir_entry.name)
+                    if dir_entry.is_symlink():
+                        links.append(dir_entry.name)
+                else:
+                    files.append(dir_entry.name)
+
+        if entry is not None:
+            # Drop cached subtrees of directories that no longer exist
+            for name in set(entry["dirs"]) - set(dirs):
+                self.forget(os.path.join(path, name))
+
+        entry = {"mtime": st.st_mtime_ns, "inode": st.st_ino, "dirs": dirs, "links": links, "files": files}
+        self.entries[key] = entry
+        self.dirty = True
+        return entry
+
+    def walk(self, top):
+        """
+        Walk a directory tree top-down, like ``os.walk``, using the cached listings.
+
+        Symbolic links to directories are reported but not followed, and directories that
+        cannot be accessed are skipped, matching the ``os.walk`` defaults.
+
+        Args:
+            top (str): The root directory of the walk.
+
+        Yields:
+            tuple: A ``(dirpath, dirnames, filenames)`` tuple for each directory.
+        """
+        try:
+            entry = self.listdir(top)
+        except OSError as err:
+            self.logger.debug("Cannot list directory %s: %s", top, err)
+            self.forget(top)
+            return
+
+        dirs = list(entry["dirs"])
+        yield top, dirs, list(entry["files"])
+
+        for name in dirs:
+            if name in entry["links"]:
+                continue
+            yield from self.walk(os.path.join(top, name))
+
+    def forget(self, path):
+        """
+        Drop the cached entries of a directory and all of its subdirectories.
+
+        Args:
+            path (str): The directory to forget.
+        """
+        key = os.path.abspath(path)
+        prefix = key + os.sep
+        # Listed first, other threads may be walking other trees
+        stale = [k for k in list(self.entries) if k == key or k.startswith(prefix)]
+        for k in stale:
+            del self.entries[k]
+        if stale:
+            self.dirty = True
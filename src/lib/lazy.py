@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+import importlib.util
+import os
+import threading
+
+from src.lib.bytecode import file_spec
+
+
+def read_version(directory):
+    """
+    Read the VERSION file of a plugin or hook directory.
+
+    Args:
+        directory (str): The plugin or hook directory.
+
+    Returns:
+        str or None: The version if the file exists, None otherwise.
+    """
+    try:
+        with open(os.path.join(directory, "VERSION"), "r") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+class LazyModule:
+    """A placeholder for a plugin or hook package that is imported on first attribute access."""
+
+    def __init__(self, logger, name, path, version=None):
+        """
+        Initialize the LazyModule instance.
+
+        Args:
+            logger (Logger): The logger to use for logging.
+            name (str): The module name.
+            path (str): The path of the package ``__init__.py`` file.
+            version (str, optional): The version read from the VERSION file.
+        """
+        self._lazy_logger = logger
+        self._lazy_module = None
+        self._lazy_lock = threading.Lock()
+        self.__name__ = name
+        self.__file__ = path
+        self.__version__ = version
+
+    @property
+    def loaded(self):
+        """bool: True once the real module has been imported."""
+        return self._lazy_module is not None
+
+    def load(self):
+        """
+        Import the real module if it has not been imported yet.
+
+        Returns:
+            module: The imported module.
+        """
+        with self._lazy_lock:
+            if self._lazy_module is None:
+                self._lazy_logger.info("Importing %s on first use", self.__name__)
+                spec = file_spec(self.__name__, self.__file__)
+                module = importlib.util.module_from_spec(spec)
+                spec.loader.exec_module(module)
+                self._lazy_module = module
+        return self._lazy_module
+
+    def __getattr__(self, name):
+        if name.startswith("_lazy_"):
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+    def __getstate__(self):
+        # Modules and locks cannot be pickled, the copy imports the module again on first use
+        state = dict(self.__dict__)
+        state["_lazy_module"] = None
+        del state["_lazy_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lazy_lock = threading.Lock()
+
+    def __repr__(self):
+        state = "loaded" if self.loaded else "not loaded"
+        return f"<LazyModule {self.__name__} ({state})>"
+
+
+class LazyInstance:
+    """A proxy for a plugin or hook instance that is created the first time it is used."""
+
+    def __init__(self, module, class_name, *args, **kwargs):
+        """
+        Initialize the LazyInstance instance.
+
+        Args:
+            module (LazyModule): The module defining the class.
+            class_name (str): The name of the class to instantiate.
+            *args: Positional arguments passed to the class constructor.
+            **kwargs: Keyword arguments passed to the class constructor.
+        """
+        object.__setattr__(self, "_lazy_module", module)
+        object.__setattr__(self, "_lazy_class_name", class_name)
+        object.__setattr__(self, "_lazy_args", args)
+        object.__setattr__(self, "_lazy_kwargs", kwargs)
+        object.__setattr__(self, "_lazy_instance", None)
+        object.__setattr__(self, "_lazy_lock", threading.Lock())
+
+    @property
+    def loaded(self):
+        """bool: True once the real instance has been created."""
+        return self._lazy_instance is not None
+
+    def resolve(self):
+        """
+        Import the module and instantiate the class if not done yet.
+
+        Returns:
+            object: The real instance.
+        """
+        with self._lazy_lock:
+            if self._lazy_instance is None:
+                cls = getattr(self._lazy_module, self._lazy_class_name)
+                object.__setattr__(self, "_lazy_instance", cls(*self._lazy_args, **self._lazy_kwargs))
+        return self._lazy_instance
+
+    def __getattr__(self, name):
+        if name.startswith("_lazy_"):
+            raise AttributeError(name)
+        return getattr(self.resolve(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self.resolve(), name, value)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state["_lazy_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        object.__setattr__(self, "_lazy_lock", threading.Lock())
+
+    def __repr__(self):
+        state = "loaded" if self.loaded else "not loaded"
+        return f"<LazyInstance {self._lazy_class_name} ({state})>"
@@ -1,6 +1,176 @@
 # -*- coding: utf-8 -*-
 # lib/logger.py
+import atexit
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+
+
+# The background writer of queued logging and the handler feeding it, see ``setup_logger``
+LISTENER = None
+QUEUE_HANDLER = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as JSON lines, for log files read by machines."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, self.datefmt),
+            "level": record.levelname,
+            "logger": record.name,
+            "file": record.filename,
+            "line": record.lineno,
+            "process": record.process,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Drop the records of a line of code logging more than ``rate`` times per ``period`` seconds.
+
+    Plugins logging in a loop are throttled without losing the messages of the other lines.
+    The number of dropped records is appended to the next record of the line that gets through.
+    """
+
+    def __init__(self, rate, period=1.0):
+        """
+        Initialize the RateLimitFilter instance.
+
+        Args:
+            rate (int): The number of records a line of code may log per period.
+            period (float, optional): The period in seconds.
+        """
+        super().__init__()
+        self.rate = rate
+        self.period = period
+        self.windows = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self.lock:
+            start, count, dropped = self.windows.get(key, (now, 0, 0))
+            if now - start >= self.period:
+                start, count = now, 0
+            if count >= self.rate:
+                self.windows[key] = (start, count, dropped + 1)
+                return False
+            self.windows[key] = (start, count + 1, 0)
+        if dropped:
+            record.msg = f"{record.getMessage()} ({dropped} similar messages suppressed)"
+            record.args = None
+        return True
+
+
+class BatchQueueListener(logging.handlers.QueueListener):
+    """
+    A queue listener writing the records waiting in the queue in batches.
+
+    Plain stream and file handlers write a batch at once and flush once, instead of once per
+    record. Other handlers, rotating file handlers for instance, handle each record.
+    """
+
+    # Handlers whose batches are written to their stream at once
+    BATCHED_HANDLERS = (logging.StreamHandler, logging.FileHandler)
+    # Put on the queue to stop the writer thread
+    STOP = object()
+
+    def __init__(self, log_queue, *handlers, batch_size=100):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.batch_size = batch_size
+        self.thread = None
+
+    def start(self):
+        """Start the writer thread."""
+        self.thread = threading.Thread(target=self.monitor, name="log-writer", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop the writer thread, once every queued record is written."""
+        if self.thread is None:
+            return
+        self.enqueue_sentinel()
+        self.thread.join()
+        self.thread = None
+
+    def enqueue_sentinel(self):
+        """Put the stop marker on the queue."""
+        self.queue.put_nowait(self.STOP)
+
+    def monitor(self):
+        """Write the queued records in batches until stopped."""
+        stopped = False
+        while not stopped:
+            batch = [self.dequeue(True)]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.dequeue(False))
+                except queue.Empty:
+                    break
+            records = [record for record in batch if record is not self.STOP]
+            stopped = len(records) < len(batch)
+            if records:
+                self.handle_batch(records)
+
+    def handle_batch(self, records):
+        """
+        Write a batch of records with every handler.
+
+        Args:
+            records (list): The records taken from the queue.
+        """
+        records = [self.prepare(record) for record in records]
+        for handler in self.handlers:
+            selected = [record for record in records if record.levelno >= handler.level and handler.filter(record)]
+            if not selected:
+                continue
+            if type(handler) not in self.BATCHED_HANDLERS or handler.stream is None:
+                for record in selected:
+                    handler.handle(record)
+                continue
+            with handler.lock:
+                try:
+                    handler.stream.write("".join(handler.format(record) + handler.terminator for record in selected))
+                    handler.flush()
+                except Exception:
+                    handler.handleError(selected[0])
+
+
+def stop_logging():
+    """Stop the background writer of queued logging, once every queued record is written."""
+    global LISTENER
+    if LISTENER is None:
+        return
+    LISTENER.stop()
+    LISTENER = None
+
+
+def restart_after_fork():
+    """Give a forked process its own queue and writer, the writer thread is not forked."""
+    global LISTENER
+    if LISTENER is None:
+        return
+    QUEUE_HANDLER.queue = queue.SimpleQueue()
+    LISTENER = BatchQueueListener(QUEUE_HANDLER.queue, *LISTENER.handlers, batch_size=LISTENER.batch_size)
+    LISTENER.start()
+
+
+atexit.register(stop_logging)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=restart_after_fork)
 
 
 def setup_logger(
@@ -8,14 +178,29 @@ def setup_logger(
     file_level="INFO",
     console_level="INFO",
     format="%(asctime)s - %(levelname)s - %(message)s",
+    queued=False,
+    batch_size=100,
+    json_file=False,
+    rate_limit=None,
+    rate_period=1.0,
 ):
     """Set up logger configuration.
 
+    Queued logging puts records on a queue and returns at once, a background thread
+    formats and writes them in batches, so plugins never wait on disk or terminal I/O.
+
     Args:
         level (str): The general logging level
         file_level (str): The logging level for the file
         console_level (str): The logging level for the console
+        format (str): The format of the log lines
+        queued (bool): Write the records from a background thread
+        batch_size (int): The maximum number of records the background thread writes at once
+        json_file (bool): Write the log file as JSON lines
+        rate_limit (int): The number of records a line of code may log per period, no limit if not set
+        rate_period (float): The period of the rate limit in seconds
     """
+    global LISTENER, QUEUE_HANDLER
     # Create a logger
     logger = logging.getLogger(__name__)
     logger.setLevel(logging.getLevelName(level.upper()))
@@ -27,10 +212,22 @@ def setup_logger(
     console_handler.setLevel(logging.getLevelName(console_level.upper()))
     # Create a formatter and set it for the handlers
     formatter = logging.Formatter(format)
-    file_handler.setFormatter(formatter)
+    file_handler.setFormatter(JsonFormatter() if json_file else formatter)
     console_handler.setFormatter(formatter)
+    handlers = [file_handler, console_handler]
+
+    if queued:
+        stop_logging()
+        QUEUE_HANDLER = logging.handlers.QueueHandler(queue.SimpleQueue())
+        LISTENER = BatchQueueListener(QUEUE_HANDLER.queue, *handlers, batch_size=batch_size)
+        LISTENER.start()
+        handlers = [QUEUE_HANDLER]
+
+    if rate_limit:
+        # Dropped records are never queued nor formatted
+        logger.addFilter(RateLimitFilter(rate_limit, rate_period))
 
     # Add the handlers to the logger
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    for handler in handlers:
+        logger.addHandler(handler)
     return logger
@@ -0,0 +1,400 @@
+# -*- coding: utf-8 -*-
+import ast
+import json
+import os
+
+import yaml
+
+from src.lib.exceptions import PluginManifestError
+from src.lib.graph import DependencyGraph
+
+
+# Declarative manifest of a plugin or hook, optional
+MANIFEST_FILE = "manifest.yml"
+
+# Keys of a manifest, the missing ones are compiled from the plugin files
+MANIFEST_KEYS = ("version", "classes", "dependencies", "hooks")
+
+# Keys a manifest may declare, never compiled
+OPTIONAL_KEYS = ("priority",)
+
+# Hooks provided by the framework rather than by a hook directory
+BUILTIN_HOOKS = ("buffers",)
+
+
+def source_files(directory, kind):
+    """
+    List the python files defining the classes of a plugin or hook.
+
+    Args:
+        directory (str): The plugin or hook directory.
+        kind (str): ``plugin`` or ``hook``.
+
+    Returns:
+        list: The file names, in the order their classes are registered.
+    """
+    if kind == "plugin":
+        return ["plugin.py"]
+    return sorted(name for name in os.listdir(directory) if name.endswith(".py") and name != "__init__.py")
+
+
+def scan_source(file_path, source=None):
+    """
+    List the classes of a python file and the hooks it uses, without importing it.
+
+    Hooks are found from the ``self.hooks["name"]`` subscripts of the file.
+
+    Args:
+        file_path (str): The python file to scan.
+        source (str, optional): The content of the file, read from ``file_path`` if not provided.
+
+    Returns:
+        tuple: The top level class names in definition order, and the sorted hook names.
+    """
+    if source is None:
+        with open(file_path, "r") as f:
+            source = f.read()
+    tree = ast.parse(source, filename=file_path)
+    classes = [node.name for node in tree.body if isinstance(node, ast.ClassDef)]
+    hooks = set()
+    for node in ast.walk(tree):
+        if (
+            isinstance(node, ast.Subscript)
+            and isinstance(node.value, ast.Attribute)
+            and node.value.attr == "hooks"
+            and isinstance(node.slice, ast.Constant)
+            and isinstance(node.slice.value, str)
+        ):
+            hooks.add(node.slice.value)
+    return classes, sorted(hooks)
+
+
+def scan_imports(file_path, source):
+    """
+    List the names a package ``__init__.py`` imports from other modules, without importing it.
+
+    Args:
+        file_path (str): The ``__init__.py`` file to scan.
+        source (str): The content of the file.
+
+    Returns:
+        set: The names bound by its top level ``from ... import`` statements, with ``*`` for a star import.
+    """
+    tree = ast.parse(source, filename=file_path)
+    return {
+        alias.name
+        for node in tree.body
+        if isinstance(node, ast.ImportFrom)
+        for alias in node.names
+        if alias.asname is None or alias.asname == alias.name
+    }
+
+
+def file_reader(directory):
+    """
+    Build a function reading the files of a directory.
+
+    Args:
+        directory (str): The plugin or hook directory.
+
+    Returns:
+        callable: Returns the content of a file of the directory given its name, or None if it does not exist.
+    """
+
+    def read(file_name):
+        try:
+            with open(os.path.join(directory, file_name), "r") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    return read
+
+
+def read_lines(text):
+    """Return the stripped non blank lines of a file content, or None if the file does not exist."""
+    if text is None:
+        return None
+    return [line.strip() for line in text.splitlines() if line.strip()]
+
+
+def compile_manifest(directory, kind, read=None, names=None):
+    """
+    Build the manifest of a plugin or hook from its ``VERSION`` and ``DEPENDENCY`` files and its source.
+
+    Its classes are the classes of its source files which its ``__init__.py`` imports, the
+    ones registered when the package is imported.
+
+    Args:
+        directory (str): The plugin or hook directory.
+        kind (str): ``plugin`` or ``hook``.
+        read (callable, optional): Reads a file of the plugin given its name, see ``file_reader``.
+        names (list, optional): The source files, see ``source_files``.
+
+    Returns:
+        dict: The manifest.
+
+    Raises:
+        OSError: If a source file cannot be read.
+        SyntaxError: If a source file is not valid python.
+    """
+    read = read or file_reader(directory)
+    classes, hooks = [], set()
+    for file_name in names if names is not None else source_files(directory, kind):
+        source = read(file_name)
+        if source is None:
+            raise FileNotFoundError(os.path.join(directory, file_name))
+        file_classes, file_hooks = scan_source(os.path.join(directory, file_name), source)
+        classes.extend(file_classes)
+        hooks.update(file_hooks)
+    init = read("__init__.py")
+    if init is not None:
+        imported = scan_imports(os.path.join(directory, "__init__.py"), init)
+        classes = [name for name in classes if name in imported or ("*" in imported and not name.startswith("_"))]
+    version = read_lines(read("VERSION"))
+    return {
+        "version": version[0] if version else None,
+        "classes": classes,
+        "dependencies": read_lines(read("DEPENDENCY")) or [],
+        "hooks": sorted(hooks),
+    }
+
+
+def validate_manifest(data, path):
+    """
+    Check the content of a manifest file.
+
+    Args:
+        data: The parsed manifest.
+        path (str): The manifest file, for error messages.
+
+    Returns:
+        dict: The manifest, with ``classes`` given as a single name turned into a list.
+
+    Raises:
+        PluginManifestError: If the manifest is not a mapping, has unknown keys or values of the wrong type.
+    """
+    if data is None:
+        return {}
+    if not isinstance(data, dict):
+        raise PluginManifestError(f"{path}: expected a mapping, got {type(data).__name__}")
+    unknown = sorted(set(data) - set(MANIFEST_KEYS) - set(OPTIONAL_KEYS))
+    if unknown:
+        raise PluginManifestError(f"{path}: unknown keys {unknown}")
+    data = dict(data)
+    if "version" in data and data["version"] is not None:
+        data["version"] = str(data["version"])
+    if isinstance(data.get("classes"), str):
+        data["classes"] = [data["classes"]]
+    for key in ("classes", "dependencies", "hooks"):
+        if key in data and not (
+            isinstance(data[key], list) and all(isinstance(value, str) and value for value in data[key])
+        ):
+            raise PluginManifestError(f"{path}: {key} must be a list of names")
+    if "priority" in data and (isinstance(data["priority"], bool) or not isinstance(data["priority"], int)):
+        raise PluginManifestError(f"{path}: priority must be an integer")
+    return data
+
+
+def read_manifest(directory, kind="plugin", read=None, names=None):
+    """
+    Read the manifest of a plugin or hook.
+
+    The keys of its ``manifest.yml`` file take precedence, the others are compiled from the
+    plugin files with ``compile_manifest``. No plugin code is imported.
+
+    Args:
+        directory (str): The plugin or hook directory.
+        kind (str, optional): ``plugin`` or ``hook``.
+        read (callable, optional): Reads a file of the plugin given its name, see ``file_reader``.
+        names (list, optional): The source files, see ``source_files``.
+
+    Returns:
+        dict: The manifest, with its ``version``, ``classes``, ``dependencies``, ``hooks`` and
+        its ``priority`` if declared.
+
+    Raises:
+        PluginManifestError: If the manifest file is invalid.
+        OSError: If a file cannot be read.
+        SyntaxError: If a source file is not valid python.
+    """
+    read = read or file_reader(directory)
+    manifest_path = os.path.join(directory, MANIFEST_FILE)
+    declared = {}
+    text = read(MANIFEST_FILE)
+    if text is not None:
+        try:
+            declared = validate_manifest(yaml.safe_load(text), manifest_path)
+        except yaml.YAMLError as err:
+            raise PluginManifestError(f"{manifest_path}: {err}") from err
+    if all(key in declared for key in MANIFEST_KEYS):
+        return declared
+    return dict(compile_manifest(directory, kind, read, names), **declared)
+
+
+def manifest_signature(directory, kind):
+    """
+    Return the modification time and size of the files a manifest is read from.
+
+    Args:
+        directory (str): The plugin or hook directory.
+        kind (str): ``plugin`` or ``hook``.
+
+    Returns:
+        list: ``[file name, mtime, size]`` entries, None for missing files.
+    """
+    signature = []
+    for file_name in [MANIFEST_FILE, "VERSION", "DEPENDENCY", "__init__.py"] + source_files(directory, kind):
+        try:
+            stat = os.stat(os.path.join(directory, file_name))
+            signature.append([file_name, stat.st_mtime_ns, stat.st_size])
+        except FileNotFoundError:
+            signature.append([file_name, None, None])
+    return signature
+
+
+class ManifestCache:
+    """
+    A persistent cache of compiled plugin and hook manifests.
+
+    A manifest is compiled again only when one of the files it is read from changed, so
+    reading the manifests of unchanged plugins costs a few ``stat`` calls each.
+    """
+
+    FORMAT_VERSION = 2
+
+    def __init__(self, logger, path):
+        """
+        Initialize the ManifestCache instance.
+
+        Args:
+            logger (Logger): The logger to use for logging.
+            path (str): The path of the on-disk cache file.
+        """
+        self.logger = logger
+        self.path = path
+        self.entries = {}
+        self.dirty = False
+        self.load()
+
+    def load(self):
+        """
+        Load the cache from disk, a missing, unreadable or incompatible file results in an empty cache.
+
+        Returns:
+            dict: The cached manifests, keyed by directory.
+        """
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            self.logger.debug("Manifest cache %s not found, starting empty", self.path)
+            return self.entries
+        except (OSError, ValueError) as err:
+            self.logger.warning("Cannot read manifest cache %s: %s", self.path, err)
+            return self.entries
+        if data.get("version") != self.FORMAT_VERSION:
+            self.logger.info("Manifest cache %s is outdated, rebuilding", self.path)
+            return self.entries
+        self.entries = data.get("entries", {})
+        return self.entries
+
+    def save(self):
+        """
+        Write the cache to disk if it changed since it was loaded.
+
+        Returns:
+            bool: True if the cache was written, False otherwise.
+        """
+        if not self.dirty:
+            return False
+        tmp_path = self.path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(tmp_path, "w") as f:
+                json.dump({"version": self.FORMAT_VERSION, "entries": self.entries}, f)
+            os.replace(tmp_path, self.path)
+        except OSError as err:
+            self.logger.warning("Cannot write manifest cache %s: %s", self.path, err)
+            return False
+        self.dirty = False
+        return True
+
+    def get(self, directory, kind="plugin"):
+        """
+        Return the manifest of a plugin or hook, compiling it only if its files changed.
+
+        Args:
+            directory (str): The plugin or hook directory.
+            kind (str, optional): ``plugin`` or ``hook``.
+
+        Returns:
+            dict: The manifest, see ``read_manifest``.
+
+        Raises:
+            PluginManifestError: If the manifest file is invalid.
+            OSError: If a file cannot be read.
+            SyntaxError: If a source file is not valid python.
+        """
+        key = os.path.abspath(directory)
+        signature = manifest_signature(directory, kind)
+        entry = self.entries.get(key)
+        if entry is not None and entry["kind"] == kind and entry["signature"] == signature:
+            return entry["manifest"]
+        self.logger.debug("Compiling manifest of %s", directory)
+        manifest = read_manifest(directory, kind)
+        self.entries[key] = {"kind": kind, "signature": signature, "manifest": manifest}
+        self.dirty = True
+        return manifest
+
+
+def get_manifest(directory, kind="plugin", manifests=None):
+    """
+    Return the manifest of a plugin or hook, from a cache if provided.
+
+    Args:
+        directory (str): The plugin or hook directory.
+        kind (str, optional): ``plugin`` or ``hook``.
+        manifests (ManifestCache, optional): The cache of compiled manifests.
+
+    Returns:
+        dict: The manifest, see ``read_manifest``.
+    """
+    if manifests is not None:
+        return manifests.get(directory, kind)
+    return read_manifest(directory, kind)
+
+
+def plan_manifests(manifests, hooks=None):
+    """
+    Order plugins from their manifests and report the problems found, without importing them.
+
+    Args:
+        manifests (dict): The manifests of the plugins of one type, keyed by module name.
+        hooks (iterable, optional): The available hook names, to check the hooks used by the plugins.
+
+    Returns:
+        tuple: The execution levels, each a list of plugin class names, and a list of problems.
+    """
+    problems = []
+    dependencies = {}
+    for module_name, manifest in manifests.items():
+        if not manifest["classes"]:
+            problems.append(f"{module_name}: no plugin class")
+        for class_name in manifest["classes"]:
+            if class_name in dependencies:
+                problems.append(f"{module_name}: plugin {class_name} is defined by another module")
+            dependencies[class_name] = manifest["dependencies"]
+        if hooks is not None:
+            unknown = sorted(set(manifest["hooks"]) - set(hooks) - set(BUILTIN_HOOKS))
+            if unknown:
+                problems.append(f"{module_name}: uses unknown hooks {unknown}")
+    graph = DependencyGraph(dependencies, dependencies)
+    for name, missing in graph.missing.items():
+        problems.append(f"{name}: missing dependencies {missing}")
+    if graph.cycle:
+        problems.append(f"dependency cycle: {' -> '.join(graph.cycle)}")
+    blocked = [name for name in graph.blocked if name not in graph.missing]
+    if blocked:
+        problems.append(f"unresolved plugins: {blocked}")
+    return graph.levels, problems
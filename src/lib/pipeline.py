@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+from src.lib.plugins import PluginManager
+
+
+class PluginPipeline(PluginManager):
+    """
+    The registered plugins of every type in a single dependency graph.
+
+    Each plugin directory is discovered, loaded and registered by its own ``PluginManager``,
+    then the plugins of all types are resolved and sorted together. A plugin may depend on
+    plugins of any type, and a scheduler starts it as soon as those have completed, without
+    waiting for the other plugins of their type. Plugins of different types without a
+    dependency between them may run at the same time, so the pipeline is only used when
+    enabled with the ``pipeline`` option.
+    """
+
+    def __init__(self, logger, hooks=None):
+        """
+        Initialize the PluginPipeline instance.
+
+        Args:
+            logger (Logger): The logger to use for logging.
+            hooks (dict, optional): The hooks passed to each plugin.
+        """
+        super().__init__(logger, hooks)
+        self.managers = {}
+        self.types = {}
+
+    @property
+    def name(self):
+        """The plugin types of the pipeline, like ``core+users``."""
+        return "+".join(self.managers)
+
+    def add(self, plugin_type, manager):
+        """
+        Add the registered plugins of a type.
+
+        A plugin with the name of a plugin added before is left out.
+
+        Args:
+            plugin_type (str): The type of the plugins.
+            manager (PluginManager): The plugin manager which registered them.
+        """
+        self.managers[plugin_type] = manager
+        for name, plugin in manager.plugins.items():
+            if name in self.types:
+                self.logger.error(
+                    "Plugin %s of %s plugins is already registered by %s plugins, ignoring it",
+                    name,
+                    plugin_type,
+                    self.types[name],
+                )
+                continue
+            self.types[name] = plugin_type
+            self.plugins[name] = plugin
+            self.registered_plugins[name] = manager.registered_plugins[name]
+            self.dependencies[name] = manager.get_dependencies(name)
+
+    def reload(self, plugin_dirs, changed):
+        """
+        Reload the plugins whose files changed with the plugin manager of their type, and add
+        the plugins of every type again.
+
+        Args:
+            plugin_dirs (dict): The directories the plugins were discovered in, keyed by plugin type.
+            changed (set): The absolute paths of the changed directories.
+
+        Returns:
+            set: The names of the modules reloaded, added or removed.
+        """
+        modules = set()
+        for plugin_type, manager in self.managers.items():
+            modules |= manager.reload(plugin_dirs[plugin_type], changed)
+        if not modules:
+            return modules
+
+        managers = self.managers
+        self.managers = {}
+        self.types = {}
+        self.plugins = {}
+        self.registered_plugins = {}
+        self.dependencies = {}
+        self.resolved_plugins = set()
+        for plugin_type, manager in managers.items():
+            self.add(plugin_type, manager)
+        return modules
+
+    def read_priority(self, plugin_name):
+        """
+        Read the priority hint of a plugin with the plugin manager of its type.
+
+        Args:
+            plugin_name (str): The name of the plugin.
+
+        Returns:
+            int: The ``priority`` of its manifest, 0 if it has none.
+        """
+        return self.managers[self.types[plugin_name]].read_priority(plugin_name)
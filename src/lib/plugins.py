@@ -1,15 +1,33 @@
 # -*- coding: utf-8 -*-
+import importlib
 import importlib.util
+import logging
 import os
+import sys
+
+from src.lib.archive import ARCHIVE_SUFFIX, find_archive, open_archive
+from src.lib.bytecode import file_spec
+from src.lib.exceptions import PluginManifestError
+from src.lib.graph import DependencyGraph
+from src.lib.lazy import LazyInstance, LazyModule
+from src.lib.manifest import MANIFEST_FILE, get_manifest
 
 
 class PluginManager:
     """A manager for handling plugins in an application."""
 
-    def __init__(self, logger, hooks=None):
-        """Initialize PluginManager."""
+    def __init__(self, logger, hooks=None, index=None, lazy=False, manifests=None, options=None):
+        """Initialize PluginManager.
+
+        Args:
+            options (dict, optional): Keyword arguments passed to each plugin, keyed by plugin name.
+        """
         self.hooks = hooks
         self.logger = logger
+        self.index = index
+        self.lazy = lazy
+        self.manifests = manifests
+        self.options = options or {}
         self.plugins = {}
         self.discovered_plugins = {}
         self.loaded_plugins = {}
@@ -17,14 +35,23 @@ class PluginManager:
         self.dependencies = {}
         self.resolved_plugins = set()
         self.sorted_plugins = []
+        self.graph = None
 
     def discover(self, plugin_folder):
-        """Discover plugins in the given folder."""
+        """Discover plugins in the given folder, and in the plugin archives it contains or is."""
         self.logger.info("Discovering plugins in %s", plugin_folder)
-        for module_path, _dirs, files in os.walk(plugin_folder):
+        if plugin_folder.endswith(ARCHIVE_SUFFIX) and os.path.isfile(plugin_folder):
+            self.discover_archive(plugin_folder)
+            self.logger.debug("Discovered plugins: %s", self.discovered_plugins)
+            return self.discovered_plugins
+        walker = self.index.walk if self.index is not None else os.walk
+        for module_path, _dirs, files in walker(plugin_folder):
             if "IGNORE" in files:  # Check if the IGNORE file exists
                 self.logger.info("Plugin ignored: %s", module_path)
                 continue  # Skip this plugin if IGNORE file exists
+            for file_name in files:
+                if file_name.endswith(ARCHIVE_SUFFIX):
+                    self.discover_archive(os.path.join(module_path, file_name))
             for file_name in files:
                 if file_name.endswith(".py") and file_name != "__init__.py" and file_name == "plugin.py":
                     relative_module_name = os.path.basename(module_path)  # Get the last directory name
@@ -38,13 +65,53 @@ class PluginManager:
         self.logger.debug("Discovered plugins: %s", self.discovered_plugins)
         return self.discovered_plugins
 
-    def load(self):
-        """Load a plugin module."""
+    def discover_archive(self, archive_path):
+        """
+        Discover the plugins of an archive from its index.
+
+        Args:
+            archive_path (str): The plugin archive.
+        """
+        try:
+            archive = open_archive(self.logger, archive_path)
+        except (OSError, ValueError):
+            self.logger.exception("Cannot open plugin archive %s: ", archive_path)
+            return
+        for module_name in archive.plugins:
+            module_path = archive.directory(module_name)
+            self.logger.debug("Found plugin: %s (%s)", module_name, module_path)
+            self.discovered_plugins[module_name] = module_path
+
+    def load_archived(self, module_name, module_path):
+        """
+        Import a plugin from its archive.
+
+        Returns:
+            module: The plugin package, or None if the plugin is not archived.
+        """
+        archived = find_archive(module_path)
+        if archived is None:
+            return None
+        return archived[0].load(module_name)
+
+    def load(self, names=None):
+        """
+        Load a plugin module.
+
+        Args:
+            names (iterable, optional): Only load the discovered plugins with these names.
+        """
+        if self.lazy:
+            return self.load_lazy(names)
         try:
             for module_name, module_path in self.discovered_plugins.items():
-                spec = importlib.util.spec_from_file_location(module_name, os.path.join(module_path, "__init__.py"))
-                module = importlib.util.module_from_spec(spec)
-                spec.loader.exec_module(module)
+                if names is not None and module_name not in names:
+                    continue
+                module = self.load_archived(module_name, module_path)
+                if module is None:
+                    spec = file_spec(module_name, os.path.join(module_path, "__init__.py"))
+                    module = importlib.util.module_from_spec(spec)
+                    spec.loader.exec_module(module)
                 # Log loading information
                 self.logger.info(
                     "Loading plugin: %s version %s",
@@ -52,7 +119,8 @@ class PluginManager:
                     module.__version__,
                 )
                 self.logger.debug("Module file path: %s", module.__file__)
-                self.logger.debug("Module contents: %s", dir(module))
+                if self.logger.isEnabledFor(logging.DEBUG):
+                    self.logger.debug("Module contents: %s", dir(module))
                 self.loaded_plugins[module_name] = module
         except ImportError:
             self.logger.exception("Cannot import module from %s: ", module_path)
@@ -64,9 +132,46 @@ class PluginManager:
         self.logger.debug("Loaded plugins: %s", self.loaded_plugins)
         return self.loaded_plugins
 
-    def register(self, **kwargs):
-        """Register all classes from plugins."""
+    def load_lazy(self, names=None):
+        """
+        Load plugin metadata only, deferring the module import to first use.
+
+        Archived plugins are imported right away, which costs no file system access.
+
+        Args:
+            names (iterable, optional): Only load the discovered plugins with these names.
+        """
+        for module_name, module_path in self.discovered_plugins.items():
+            if names is not None and module_name not in names:
+                continue
+            if find_archive(module_path) is not None:
+                module = self.load_archived(module_name, module_path)
+                self.logger.info("Loading plugin: %s version %s (archived)", module_name, module.__version__)
+                self.loaded_plugins[module_name] = module
+                continue
+            try:
+                version = self.manifest(module_path)["version"]
+            except (PluginManifestError, OSError, SyntaxError):
+                self.logger.exception("Cannot read manifest of plugin %s: ", module_name)
+                continue
+            module = LazyModule(self.logger, module_name, os.path.join(module_path, "__init__.py"), version)
+            self.logger.info("Loading plugin: %s version %s (lazy)", module_name, module.__version__)
+            self.loaded_plugins[module_name] = module
+
+        self.logger.debug("Loaded plugins: %s", self.loaded_plugins)
+        return self.loaded_plugins
+
+    def register(self, names=None, **kwargs):
+        """
+        Register all classes from plugins.
+
+        Args:
+            names (iterable, optional): Only register the classes of the loaded plugins with these names.
+            **kwargs: Keyword arguments passed to each plugin, along with its own options.
+        """
         for module_name, module in self.loaded_plugins.items():
+            if names is not None and module_name not in names:
+                continue
             try:
                 module_path = getattr(module, "__file__", None)
                 if module_path is None:
@@ -78,126 +183,256 @@ class PluginManager:
                 self.logger.exception("Invalid module object for module: %s", module_name)
                 continue
 
-            for name, obj in module.__dict__.items():
-                if isinstance(obj, type):
-                    plugin_instance = obj(self.logger, self.hooks, **kwargs)
-                    self.registered_plugins[name] = plugin_instance
-                    # this should be plugin_registered
-                    # instead of plugins
-                    self.plugins[name] = {
-                        "module_name": module_name,
-                        "module_path": module_path,
-                        "module_directory": module_directory,
-                        "module": module,
-                        "instance": plugin_instance,
-                    }
-                    self.logger.info("Registered plugin: %s", name)
+            if isinstance(module, LazyModule):
+                try:
+                    class_names = self.manifest(module_directory)["classes"]
+                except (PluginManifestError, OSError, SyntaxError):
+                    self.logger.exception("Cannot read plugin classes for module: %s", module_name)
+                    continue
+                classes = [(name, None) for name in class_names]
+            else:
+                classes = [(name, obj) for name, obj in module.__dict__.items() if isinstance(obj, type)]
+
+            for name, obj in classes:
+                plugin_kwargs = dict(kwargs, **self.options.get(name, {}))
+                if obj is None:
+                    plugin_instance = LazyInstance(module, name, self.logger, self.hooks, **plugin_kwargs)
+                else:
+                    plugin_instance = obj(self.logger, self.hooks, **plugin_kwargs)
+                self.registered_plugins[name] = plugin_instance
+                # this should be plugin_registered
+                # instead of plugins
+                self.plugins[name] = {
+                    "module_name": module_name,
+                    "module_path": module_path,
+                    "module_directory": module_directory,
+                    "module": module,
+                    "instance": plugin_instance,
+                    "kwargs": plugin_kwargs,
+                }
+                self.logger.info("Registered plugin: %s", name)
 
         self.logger.debug("Registered plugins: %s", self.registered_plugins)
 
         return self.registered_plugins
 
-    def topological_sort(self):
+    def reload(self, plugin_folder, changed):
         """
-        Perform topological sorting on the plugins based on their dependencies.
+        Reload the plugins whose files changed, and pick up added and removed plugins.
+
+        Unchanged plugins keep their module and instance.
+
+        Args:
+            plugin_folder (str): The folder the plugins were discovered in.
+            changed (set): The absolute paths of the changed directories.
 
         Returns:
-            list: A list of plugin names sorted by their dependencies.
+            set: The names of the modules reloaded, added or removed.
         """
-        resolved_plugins = set()
-
-        while len(self.sorted_plugins) < len(self.plugins):
-            progress_made = False
+        previous = self.discovered_plugins
+        self.discovered_plugins = {}
+        self.discover(plugin_folder)
+
+        modules = set(previous) - set(self.discovered_plugins)
+        for module_name, module_path in self.discovered_plugins.items():
+            directory = os.path.abspath(module_path)
+            if module_name not in previous or any(
+                path == directory or path.startswith(directory + os.sep) for path in changed
+            ):
+                modules.add(module_name)
+        if not modules:
+            return modules
+
+        self.logger.info("Reloading plugins: %s", sorted(modules))
+        for name, plugin in list(self.plugins.items()):
+            if plugin["module_name"] in modules:
+                del self.plugins[name]
+                self.registered_plugins.pop(name, None)
+                self.dependencies.pop(name, None)
+                self.resolved_plugins.discard(name)
+        for module_name in modules:
+            self.loaded_plugins.pop(module_name, None)
+            module_path = previous.get(module_name) or self.discovered_plugins.get(module_name)
+            purge_modules(module_path)
+        importlib.invalidate_caches()
+
+        reloaded = modules & set(self.discovered_plugins)
+        self.load(reloaded)
+        self.register(reloaded)
+        for name, plugin in self.plugins.items():
+            if plugin["module_name"] in reloaded:
+                self.get_dependencies(name)
+        return modules
+
+    def manifest(self, module_directory):
+        """
+        Return the manifest of a plugin, read without importing it.
 
-            for plugin_name, _plugin_info in self.plugins.items():
-                if plugin_name in resolved_plugins:
-                    continue
+        Args:
+            module_directory (str): The plugin directory.
 
-                dependencies = self.dependencies.get(plugin_name, [])
+        Returns:
+            dict: The manifest, see ``read_manifest``.
+        """
+        archived = find_archive(module_directory)
+        if archived is not None:
+            return archived[0].manifest(archived[1])
+        return get_manifest(module_directory, "plugin", self.manifests)
 
-                if all(dep in self.resolved_plugins for dep in dependencies):
-                    self.sorted_plugins.append(plugin_name)
-                    resolved_plugins.add(plugin_name)
-                    progress_made = True
+    def topological_sort(self):
+        """
+        Perform topological sorting on the plugins based on their dependencies.
 
-            if not progress_made:
-                self.logger.error("Cycle detected in plugin dependencies.")
-                break
+        Returns:
+            list: A list of plugin names sorted by their dependencies.
+        """
+        self.graph = DependencyGraph(self.dependencies, self.plugins)
+        self.sorted_plugins = self.graph.order()
 
         self.logger.info("Sorted plugins: %s", self.sorted_plugins)
 
         return self.sorted_plugins
 
     def resolve_dependencies(self):
-        """Resolve dependencies for registered plugins."""
+        """
+        Resolve dependencies for registered plugins.
 
-        # Track whether any progress has been made in resolving dependencies
-        progress_made = True
+        Missing dependencies and dependency cycles are reported, and the plugins depending on
+        them are left unresolved.
 
-        # Continue resolving dependencies until all plugins are resolved or no further progress can be made
-        while self.resolved_plugins != set(self.plugins) and progress_made:
-            progress_made = False
+        Returns:
+            list: The execution levels, each a list of plugin names whose dependencies are all
+            in earlier levels.
+        """
+        self.graph = DependencyGraph(self.dependencies, self.plugins)
 
-            for plugin_name, plugin_info in self.plugins.items():
-                # Skip if plugin already resolved
-                if plugin_name in self.resolved_plugins:
-                    continue
+        for plugin_name, missing in self.graph.missing.items():
+            self.logger.error("Plugin %s has unregistered dependencies: %s", plugin_name, missing)
+        if self.graph.cycle:
+            self.logger.error("Cycle detected in plugin dependencies: %s", " -> ".join(self.graph.cycle))
+        if self.graph.blocked:
+            self.logger.error("Plugins with unresolved dependencies: %s", self.graph.blocked)
 
-                # Get dependencies for the current plugin
-                dependencies = self.dependencies.get(plugin_name, [])
-
-                # Filter out empty dependencies
-                dependencies = [dep for dep in dependencies if dep]
-
-                # Check if all dependencies are registered plugins
-                if all(dep in self.plugins for dep in dependencies):
-                    # Check if all dependencies are resolved
-                    if all(dep in self.resolved_plugins for dep in dependencies):
-                        # Instantiate the plugin if all dependencies are resolved
-                        plugin_class = getattr(plugin_info["module"], plugin_name)
-                        plugin_instance = plugin_class(self.logger)
-                        plugin_info["instance"] = plugin_instance
-                        self.resolved_plugins.add(plugin_name)
-                        progress_made = True  # Progress has been made in resolving dependencies
-                        self.logger.info("Resolved dependencies for plugin: %s", plugin_name)
-                    else:
-                        self.logger.debug(
-                            "Plugin %s has unresolved dependencies: %s",
-                            plugin_name,
-                            dependencies,
-                        )
-                else:
-                    self.logger.error(
-                        "Plugin %s has unregistered dependencies: %s",
-                        plugin_name,
-                        dependencies,
-                    )
+        for level in self.graph.levels:
+            for plugin_name in level:
+                self.resolved_plugins.add(plugin_name)
+                self.logger.info("Resolved dependencies for plugin: %s", plugin_name)
 
-        return self.resolved_plugins
-
-    def get_dependencies(self):
-        """Get dependencies for each registered plugin."""
-        for plugin_name, plugin_info in self.plugins.items():
-            plugin_directory = plugin_info["module_directory"]
-            dependency_file_path = os.path.join(plugin_directory, "DEPENDENCY")
-            dependencies = []
-
-            self.logger.debug("Dependency file path: %s", dependency_file_path)
-            if os.path.isfile(dependency_file_path):
-                with open(dependency_file_path, "r") as f:
-                    content = f.read().strip()  # Read content and strip whitespace
-                    if not content:  # Check if content is empty
-                        self.logger.info("Dependencies for plugin %s: Not Found", plugin_name)
-                    else:
-                        dependencies = content.split("\n")
-                        self.logger.info(
-                            "Dependencies for plugin %s: %s",
-                            plugin_name,
-                            dependencies,
-                        )
-            else:
-                self.logger.info("Dependencies for plugin %s: Not Found", plugin_name)
+        return self.graph.levels
+
+    def get_dependencies(self, plugin_name=None):
+        """
+        Get dependencies for each registered plugin.
+
+        Args:
+            plugin_name (str, optional): Only get the dependencies of this plugin.
+
+        Returns:
+            dict or list: The dependencies of every plugin, or the dependencies of ``plugin_name``.
+        """
+        if plugin_name is not None:
+            if plugin_name not in self.dependencies:
+                self.dependencies[plugin_name] = self.read_dependencies(plugin_name)
+            return self.dependencies[plugin_name]
 
-        self.dependencies[plugin_name] = dependencies
+        for plugin_name in self.plugins:
+            self.dependencies[plugin_name] = self.read_dependencies(plugin_name)
 
         return self.dependencies
+
+    def get_priorities(self):
+        """
+        Get the priority hints of the registered plugins.
+
+        Returns:
+            dict: The priority of each plugin, see ``read_priority``.
+        """
+        return {plugin_name: self.read_priority(plugin_name) for plugin_name in self.plugins}
+
+    def read_priority(self, plugin_name):
+        """
+        Read the priority hint of a registered plugin from its manifest.
+
+        A scheduler starts the plugins with a higher priority, and their dependencies, first
+        when more plugins are ready than can run.
+
+        Args:
+            plugin_name (str): The name of the plugin.
+
+        Returns:
+            int: The ``priority`` of its manifest, 0 if it has none.
+        """
+        plugin_directory = self.plugins[plugin_name]["module_directory"]
+        if (
+            self.manifests is None
+            and not os.path.isfile(os.path.join(plugin_directory, MANIFEST_FILE))
+            and find_archive(plugin_directory) is None
+        ):
+            return 0
+        try:
+            return self.manifest(plugin_directory).get("priority", 0)
+        except (PluginManifestError, OSError, SyntaxError):
+            self.logger.exception("Cannot read manifest of plugin %s: ", plugin_name)
+            return 0
+
+    def read_dependencies(self, plugin_name):
+        """
+        Read the dependencies of a registered plugin from its manifest, or its DEPENDENCY file.
+
+        Args:
+            plugin_name (str): The name of the plugin.
+
+        Returns:
+            list: The names of the plugins it depends on.
+        """
+        plugin_directory = self.plugins[plugin_name]["module_directory"]
+        dependency_file_path = os.path.join(plugin_directory, "DEPENDENCY")
+        dependencies = []
+
+        self.logger.debug("Dependency file path: %s", dependency_file_path)
+        if (
+            self.manifests is not None
+            or os.path.isfile(os.path.join(plugin_directory, MANIFEST_FILE))
+            or find_archive(plugin_directory) is not None
+        ):
+            try:
+                dependencies = self.manifest(plugin_directory)["dependencies"]
+            except (PluginManifestError, OSError, SyntaxError):
+                self.logger.exception("Cannot read manifest of plugin %s: ", plugin_name)
+        elif os.path.isfile(dependency_file_path):
+            with open(dependency_file_path, "r") as f:
+                # Skip blank lines and surrounding whitespace
+                dependencies = [line.strip() for line in f if line.strip()]
+
+        if dependencies:
+            self.logger.info("Dependencies for plugin %s: %s", plugin_name, dependencies)
+        else:
+            self.logger.info("Dependencies for plugin %s: Not Found", plugin_name)
+
+        return dependencies
+
+
+def purge_modules(directory):
+    """
+    Remove the modules imported from a directory from ``sys.modules``, so they are imported again.
+
+    Their bytecode caches are removed too, as they are only checked against the source
+    modification time in seconds and size, which may not change on a quick edit.
+
+    Args:
+        directory (str): The directory of the modules.
+    """
+    directory = os.path.abspath(directory)
+    for name, module in list(sys.modules.items()):
+        file_path = getattr(module, "__file__", None)
+        if file_path and os.path.abspath(file_path).startswith(directory + os.sep):
+            del sys.modules[name]
+    for path, _dirs, files in os.walk(directory):
+        if os.path.basename(path) != "__pycache__":
+            continue
+        for file_name in files:
+            if file_name.endswith(".pyc"):
+                try:
+                    os.unlink(os.path.join(path, file_name))
+                except OSError:
+                    pass
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+
+from contextlib import contextmanager, nullcontext
+
+from src.lib.dispatch import deliver
+
+
+def measure(profiler, category, name):
+    """
+    Measure a block of code if a profiler is given.
+
+    Args:
+        profiler (Profiler): The profiler recording the measure, may be None.
+        category (str): The category of the measure (``phase``, ``plugin`` or ``hook``).
+        name (str): The name of the measure.
+
+    Returns:
+        A context manager measuring the block, or doing nothing without a profiler.
+    """
+    if profiler is None:
+        return nullcontext()
+    return profiler.measure(category, name)
+
+
+class Profiler:
+    """
+    Records wall time, CPU time and allocation deltas of pipeline phases, plugins and hooks.
+
+    CPU time is measured for the running thread. Allocation deltas are measured with
+    ``tracemalloc`` when memory tracing is enabled and cover the whole process, so they also
+    count allocations of other plugins running concurrently.
+    """
+
+    def __init__(self, trace_memory=False):
+        """
+        Initialize the Profiler instance.
+
+        Args:
+            trace_memory (bool, optional): Start ``tracemalloc`` to record allocation deltas,
+                until ``close`` is called.
+        """
+        self.records = []
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+        self.trace_memory = trace_memory
+        self.started_tracing = trace_memory and not tracemalloc.is_tracing()
+        if self.started_tracing:
+            tracemalloc.start()
+
+    def close(self):
+        """Stop ``tracemalloc`` if this profiler started it."""
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+
+    @contextmanager
+    def measure(self, category, name):
+        """
+        Measure a block of code.
+
+        Args:
+            category (str): The category of the measure (``phase``, ``plugin`` or ``hook``).
+            name (str): The name of the measure.
+        """
+        tracing = tracemalloc.is_tracing()
+        alloc_start = tracemalloc.get_traced_memory()[0] if tracing else 0
+        cpu_start = time.thread_time()
+        wall_start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as err:
+            error = repr(err)
+            raise
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.thread_time() - cpu_start
+            alloc = tracemalloc.get_traced_memory()[0] - alloc_start if tracing else None
+            record = {
+                "category": category,
+                "name": name,
+                "start": wall_start - self.origin,
+                "wall": wall,
+                "cpu": cpu,
+                "alloc": alloc,
+                "thread": threading.get_ident(),
+                "error": error,
+            }
+            with self.lock:
+                self.records.append(record)
+
+    def report(self):
+        """
+        Aggregate the records by category and name.
+
+        Returns:
+            dict: For each category, a mapping of names to their call count, total wall time,
+            total CPU time and total allocation delta, in the order they were first recorded.
+        """
+        report = {"phase": {}, "plugin": {}, "hook": {}}
+        with self.lock:
+            records = list(self.records)
+        for record in records:
+            entry = report.setdefault(record["category"], {}).setdefault(
+                record["name"], {"calls": 0, "wall": 0.0, "cpu": 0.0, "alloc": None, "errors": 0}
+            )
+            entry["calls"] += 1
+            entry["wall"] += record["wall"]
+            entry["cpu"] += record["cpu"]
+            if record["alloc"] is not None:
+                entry["alloc"] = (entry["alloc"] or 0) + record["alloc"]
+            if record["error"] is not None:
+                entry["errors"] += 1
+        return report
+
+    def slowest(self, category="plugin", count=5):
+        """
+        Return the names with the largest total wall time in a category.
+
+        Args:
+            category (str, optional): The category to look at.
+            count (int, optional): The number of names to return.
+
+        Returns:
+            list: ``(name, wall)`` tuples, slowest first.
+        """
+        entries = self.report().get(category, {})
+        return sorted(((name, entry["wall"]) for name, entry in entries.items()), key=lambda item: -item[1])[:count]
+
+    def dump_json(self, path):
+        """
+        Write the report and the raw records as JSON.
+
+        Args:
+            path (str): The output file path.
+        """
+        with self.lock:
+            records = list(self.records)
+        self.write(path, {"report": self.report(), "records": records})
+
+    def dump_chrome_trace(self, path):
+        """
+        Write the records in the Chrome trace event format, viewable in ``chrome://tracing`` or Perfetto.
+
+        Args:
+            path (str): The output file path.
+        """
+        with self.lock:
+            records = list(self.records)
+        pid = os.getpid()
+        events = [
+            {
+                "name": record["name"],
+                "cat": record["category"],
+                "ph": "X",
+                "ts": record["start"] * 1e6,
+                "dur": record["wall"] * 1e6,
+                "pid": pid,
+                "tid": record["thread"],
+                "args": {"cpu": record["cpu"], "alloc": record["alloc"], "error": record["error"]},
+            }
+            for record in records
+        ]
+        self.write(path, {"traceEvents": events, "displayTimeUnit": "ms"})
+
+    @staticmethod
+    def write(path, data):
+        """Write JSON data to a file, creating its directory."""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(data, f, indent=2)
+
+
+class ProfiledHook:
+    """A wrapper recording each trigger of a hook in a profiler."""
+
+    def __init__(self, hook, profiler, name):
+        """
+        Initialize the ProfiledHook instance.
+
+        Args:
+            hook: The hook instance to wrap.
+            profiler (Profiler): The profiler recording the triggers.
+            name (str): The name of the hook.
+        """
+        self.hook = hook
+        self.profiler = profiler
+        self.name = name
+
+    def trigger(self, *args, **kwargs):
+        """
+        Trigger the wrapped hook, recording its duration.
+
+        Returns:
+            The result of the hook. Coroutines are wrapped so the measure covers their execution.
+        """
+        if inspect.iscoroutinefunction(self.hook.trigger):
+            return self.trigger_async(*args, **kwargs)
+        with self.profiler.measure("hook", self.name):
+            return self.hook.trigger(*args, **kwargs)
+
+    def trigger_batch(self, events):
+        """
+        Deliver a batch of events to the wrapped hook, recording its duration.
+
+        Args:
+            events (list): The events to deliver, None for a trigger without argument.
+        """
+        triggers = [((), {}) if event is None else ((event,), {}) for event in events]
+        with self.profiler.measure("hook", self.name):
+            deliver(self.hook, triggers, logging.getLogger(__name__))
+
+    async def trigger_async(self, *args, **kwargs):
+        """Await an async hook, recording its duration."""
+        with self.profiler.measure("hook", self.name):
+            return await self.hook.trigger(*args, **kwargs)
+
+    def __getattr__(self, name):
+        if name in ("hook", "profiler", "name"):
+            raise AttributeError(name)
+        return getattr(self.hook, name)
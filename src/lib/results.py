@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+import threading
+
+from src.lib.buffers import BUFFERS_HOOK
+from src.lib.hooks import RUNNING_PLUGIN, running_plugin
+
+
+class MemoizedHook:
+    """A wrapper recording the triggers of each plugin in a result store, to replay them with its result."""
+
+    def __init__(self, hook, name, store):
+        """
+        Initialize the MemoizedHook instance.
+
+        Args:
+            hook: The hook instance to wrap.
+            name (str): The name of the hook.
+            store (ResultStore): The store recording the triggers.
+        """
+        self.hook = hook
+        self.name = name
+        self.store = store
+
+    def trigger(self, *args, **kwargs):
+        """Record the trigger for the running plugin, then trigger the wrapped hook."""
+        self.store.record(RUNNING_PLUGIN.get(), self.name, args, kwargs)
+        return self.hook.trigger(*args, **kwargs)
+
+    def __getattr__(self, name):
+        if name in ("hook", "name", "store"):
+            raise AttributeError(name)
+        return getattr(self.hook, name)
+
+
+class ResultStore:
+    """
+    An in-memory store passing the results of plugins to the plugins depending on them.
+
+    The value returned by ``execute`` is stored only if another plugin of the run depends on
+    it, and freed as soon as every dependent has run, failed or been skipped. The results
+    held at any time are those of the frontier of the dependency graph, not of the whole run.
+
+    With a ``ResultCache``, ``lookup`` finds the result of a plugin run with the same source,
+    keyword arguments and inputs, and ``put`` caches the results of the plugins that ran. With
+    the ``PlanState`` of an incremental run, the unchanged plugins are replayed the same way.
+    The hook triggers of a plugin are stored along with its result, and replayed when its
+    result is, once the hooks are wrapped with ``record_hooks``.
+    """
+
+    def __init__(self, logger, dependencies, plugins=None, cache=None, sources=None, state=None):
+        """
+        Initialize the ResultStore instance.
+
+        Args:
+            logger (Logger): The logger to use for logging.
+            dependencies (dict): A mapping of plugin names to the names they depend on.
+            plugins (list, optional): The plugins of the run, every plugin in ``dependencies``
+                if not provided. Dependencies on other plugins are ignored.
+            cache (ResultCache, optional): The cache of the results of previous runs.
+            sources (dict, optional): The ``(directory, kwargs)`` of each cached plugin, used to
+                compute its cache key. Plugins missing from it are never cached.
+            state (PlanState, optional): The results of the unchanged plugins of an incremental
+                run, recording the results of this run.
+        """
+        self.logger = logger
+        names = set(dependencies if plugins is None else plugins)
+        self.dependencies = {name: [dep for dep in dependencies.get(name, []) if dep in names] for name in names}
+        self.remaining = dict.fromkeys(names, 0)
+        for deps in self.dependencies.values():
+            for dep in deps:
+                self.remaining[dep] += 1
+        self.results = {}
+        self.consumed = set()
+        self.peak = 0
+        self.lock = threading.Lock()
+        self.cache = cache
+        self.sources = sources or {}
+        self.keys = {}
+        self.state = state
+        self.hooks = None
+        self.triggers = {}
+
+    @property
+    def memoized(self):
+        """Tell if plugins may be completed by ``lookup`` without running."""
+        return self.cache is not None or self.state is not None
+
+    def lookup(self, name):
+        """
+        Look up the replayed or cached result of a plugin about to run, given the results of its dependencies.
+
+        Args:
+            name (str): The name of the plugin.
+
+        Returns:
+            tuple: ``(True, result)`` if the result is cached and the plugin must not run,
+            ``(False, None)`` otherwise.
+        """
+        if self.state is not None:
+            hit, stored = self.state.lookup(name)
+            if hit:
+                self.logger.debug("Replaying result of unchanged plugin %s", name)
+                return True, self.replay(name, stored)
+        if self.cache is None or name not in self.sources:
+            return False, None
+        directory, kwargs = self.sources[name]
+        key = self.cache.key(name, directory, kwargs, self.inputs(name))
+        if key is None:
+            return False, None
+        hit, stored = self.cache.get(name, key)
+        if hit:
+            self.logger.info("Using cached result of plugin %s", name)
+            return True, self.replay(name, stored)
+        with self.lock:
+            self.keys[name] = key
+        return False, None
+
+    def replay(self, name, stored):
+        """
+        Trigger the hooks again as the run of a plugin which stored its result did.
+
+        Args:
+            name (str): The name of the plugin.
+            stored (tuple): The stored ``(result, triggers)`` of the plugin.
+
+        Returns:
+            The result of the plugin.
+        """
+        result, triggers = stored
+        hooks = self.hooks or {}
+        with running_plugin(name):
+            for hook_name, args, kwargs in triggers:
+                if hook_name not in hooks:
+                    self.logger.warning("Cannot replay trigger of unknown hook %s for plugin %s", hook_name, name)
+                    continue
+                try:
+                    hooks[hook_name].trigger(*args, **kwargs)
+                except Exception:
+                    self.logger.exception("Failed to trigger hook %s for plugin %s", hook_name, name)
+        return result
+
+    def record(self, name, hook_name, args, kwargs):
+        """
+        Record a hook trigger of a plugin of the run, stored with its result.
+
+        Args:
+            name (str): The name of the plugin, None outside of a plugin run.
+            hook_name (str): The name of the hook.
+            args (tuple): The positional arguments of the trigger.
+            kwargs (dict): The keyword arguments of the trigger.
+        """
+        with self.lock:
+            if name in self.remaining:
+                self.triggers.setdefault(name, []).append((hook_name, args, kwargs))
+
+    def record_hooks(self, hooks):
+        """
+        Wrap the hooks so that the triggers of each plugin are stored and replayed with its result.
+
+        Args:
+            hooks (dict): The registered hooks, wrapped in place, may be None.
+
+        Returns:
+            dict: The original hooks, to restore with ``restore_hooks``.
+        """
+        if not hooks or not self.memoized:
+            return {}
+        originals = dict(hooks)
+        for name, hook in originals.items():
+            if name != BUFFERS_HOOK:
+                hooks[name] = MemoizedHook(hook, name, self)
+        self.hooks = hooks
+        return originals
+
+    def restore_hooks(self, hooks, originals):
+        """
+        Restore the hooks wrapped by ``record_hooks``.
+
+        Args:
+            hooks (dict): The registered hooks, may be None.
+            originals (dict): The original hooks.
+        """
+        if hooks:
+            hooks.update(originals)
+        self.hooks = None
+
+    def put(self, name, result):
+        """
+        Store the result of a plugin, if a plugin depends on it, record it in the incremental
+        state and cache it if it was looked up, along with its hook triggers.
+
+        Args:
+            name (str): The name of the plugin.
+            result: The value returned by its ``execute`` step.
+        """
+        with self.lock:
+            key = self.keys.pop(name, None)
+            stored = (result, self.triggers.pop(name, []))
+        if key is not None:
+            self.cache.set(name, key, stored)
+        if self.state is not None:
+            self.state.record(name, stored)
+        with self.lock:
+            if not self.remaining.get(name):
+                return
+            self.results[name] = result
+            self.peak = max(self.peak, len(self.results))
+
+    def inputs(self, name):
+        """
+        Return the results of the dependencies of a plugin.
+
+        Args:
+            name (str): The name of the plugin.
+
+        Returns:
+            dict: The results, keyed by dependency name. Dependencies that failed are missing.
+        """
+        with self.lock:
+            return {dep: self.results[dep] for dep in self.dependencies.get(name, []) if dep in self.results}
+
+    def get(self, name, expected_type=None):
+        """
+        Return a stored result.
+
+        Args:
+            name (str): The name of the plugin.
+            expected_type (type, optional): The type the result must have.
+
+        Returns:
+            The result of the plugin.
+
+        Raises:
+            KeyError: If the result is not stored.
+            TypeError: If the result does not have the expected type.
+        """
+        with self.lock:
+            result = self.results[name]
+        if expected_type is not None and not isinstance(result, expected_type):
+            raise TypeError(f"Result of {name} is {type(result).__name__}, expected {expected_type.__name__}")
+        return result
+
+    def consume(self, name):
+        """
+        Record that a plugin no longer needs the results of its dependencies, freeing them once unused.
+
+        Args:
+            name (str): The name of the plugin that completed, failed or was skipped.
+        """
+        with self.lock:
+            if name in self.consumed:
+                return
+            self.consumed.add(name)
+            self.triggers.pop(name, None)
+            for dep in self.dependencies.get(name, []):
+                self.remaining[dep] -= 1
+                if self.remaining[dep] == 0 and dep in self.results:
+                    del self.results[dep]
+                    self.logger.debug("Freed result of plugin %s", dep)
+
+    def __len__(self):
+        with self.lock:
+            return len(self.results)
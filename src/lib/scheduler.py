@@ -0,0 +1,687 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import contextvars
+import inspect
+import os
+import statistics
+import time
+
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from src.lib.exceptions import PluginExecutionError
+from src.lib.hooks import RECORDED_TRIGGERS, AsyncHook, RelayHook, running_plugin
+from src.lib.lazy import LazyInstance
+from src.lib.profiler import measure
+
+
+# The thread pool running the sync plugin steps of the current AsyncDagScheduler run, the
+# default executor of the event loop is used outside of a run
+STEP_EXECUTOR = contextvars.ContextVar("step_executor", default=None)
+
+
+def check_result(plugin_instance, name, result):
+    """
+    Check the result of a plugin against the type it declares in its ``result_type`` attribute.
+
+    Raises:
+        PluginExecutionError: If the result does not have the declared type.
+    """
+    result_type = getattr(plugin_instance, "result_type", None)
+    if isinstance(result_type, (type, tuple)) and not isinstance(result, result_type):
+        raise PluginExecutionError(f"Plugin {name} returned {type(result).__name__}, expected {result_type}")
+
+
+def run_plugin(plugin_instance, name=None, profiler=None, inputs=None):
+    """
+    Run the execution steps of a plugin.
+
+    Async steps are run to completion on a new event loop.
+
+    Args:
+        plugin_instance: The plugin instance to run.
+        name (str, optional): The plugin name, used to label the measures.
+        profiler (Profiler, optional): The profiler recording each step.
+        inputs (dict, optional): The results of its dependencies, set as its ``inputs``
+            attribute for the duration of the run.
+
+    Returns:
+        The value returned by its ``execute`` step.
+    """
+    if inputs is not None:
+        plugin_instance.inputs = inputs
+    try:
+        result = None
+        for step_name in ("execute", "process_results"):
+            with running_plugin(name), measure(profiler, "plugin", f"{name}.{step_name}"):
+                value = getattr(plugin_instance, step_name)()
+                if inspect.isawaitable(value):
+                    value = asyncio.run(value)
+            if step_name == "execute":
+                check_result(plugin_instance, name, value)
+                result = value
+        return result
+    finally:
+        if inputs is not None:
+            # Do not keep the results of the dependencies alive after the run
+            plugin_instance.inputs = {}
+
+
+def run_plugin_recording(plugin_instance, name=None, inputs=None):
+    """
+    Run a plugin in a worker process, recording its hook triggers.
+
+    Args:
+        plugin_instance: The plugin instance to run, whose hooks are recording copies.
+        name (str, optional): The plugin name.
+        inputs (dict, optional): The results of its dependencies.
+
+    Returns:
+        tuple: The value returned by its ``execute`` step, and the ``(hook_name, args, kwargs)``
+        triggers to replay in the parent process.
+    """
+    del RECORDED_TRIGGERS[:]
+    try:
+        result = run_plugin(plugin_instance, name, inputs=inputs)
+        return result, list(RECORDED_TRIGGERS)
+    finally:
+        del RECORDED_TRIGGERS[:]
+
+
+async def run_plugin_async(plugin_instance, name=None, profiler=None, inputs=None):
+    """
+    Run the execution steps of a plugin on the running event loop.
+
+    Async steps are awaited directly, sync steps run in the thread pool of the scheduler
+    running the plugin, or in the default executor of the loop.
+
+    Args:
+        plugin_instance: The plugin instance to run.
+        name (str, optional): The plugin name, used to label the measures.
+        profiler (Profiler, optional): The profiler recording each step.
+        inputs (dict, optional): The results of its dependencies, set as its ``inputs``
+            attribute for the duration of the run.
+
+    Returns:
+        The value returned by its ``execute`` step.
+    """
+    loop = asyncio.get_running_loop()
+    if inputs is not None:
+        plugin_instance.inputs = inputs
+    try:
+        result = None
+        for step_name in ("execute", "process_results"):
+            step = getattr(plugin_instance, step_name)
+            label = f"{name}.{step_name}"
+            if asyncio.iscoroutinefunction(step):
+                with running_plugin(name), measure(profiler, "plugin", label):
+                    value = await step()
+            else:
+                value = await loop.run_in_executor(STEP_EXECUTOR.get(), run_step, step, label, profiler, name)
+                if inspect.isawaitable(value):
+                    value = await value
+            if step_name == "execute":
+                check_result(plugin_instance, name, value)
+                result = value
+        return result
+    finally:
+        if inputs is not None:
+            plugin_instance.inputs = {}
+
+
+def run_step(step, label, profiler, name=None):
+    """Run and measure a sync plugin step in a worker thread."""
+    with running_plugin(name), measure(profiler, "plugin", label):
+        return step()
+
+
+class DagScheduler:
+    """
+    A scheduler running plugins concurrently along their dependency graph.
+
+    Each plugin is dispatched to the executor as soon as all of its dependencies have
+    completed, so plugins without a dependency path between them run in parallel. When more
+    plugins are ready than can run, the ones with the highest priority hint, then the longest
+    estimated path to the end of the run, are dispatched first. The plugins depending on a
+    failed plugin are skipped, or run degraded, without its result in their ``inputs``.
+    """
+
+    EXECUTORS = {
+        "thread": ThreadPoolExecutor,
+        "process": ProcessPoolExecutor,
+    }
+
+    # What happens to the plugins depending on a failed plugin
+    ON_FAILURE = ("skip", "degrade")
+
+    def __init__(self, logger, executor="thread", max_workers=None, history=None, on_failure="skip"):
+        """
+        Initialize the DagScheduler instance.
+
+        Args:
+            logger (Logger): The logger to use for logging.
+            executor (str, optional): The executor type, either ``thread`` or ``process``.
+            max_workers (int, optional): The maximum number of plugins running at the same time.
+            history (RuntimeHistory, optional): The durations of previous runs, to start the
+                plugins on the critical path first, and to record the durations of this run.
+            on_failure (str, optional): ``skip`` the plugins depending on a failed plugin, or
+                ``degrade`` to run them without its result.
+
+        Raises:
+            ValueError: If the executor type or the failure handling is unknown.
+        """
+        if executor not in self.EXECUTORS:
+            raise ValueError(f"Unknown executor type: {executor}")
+        if on_failure not in self.ON_FAILURE:
+            raise ValueError(f"Unknown failure handling: {on_failure}")
+        self.logger = logger
+        self.executor = executor
+        self.max_workers = max_workers
+        self.history = history
+        self.on_failure = on_failure
+        self.results = {}
+        self.failed = {}
+        self.skipped = []
+        self.degraded = []
+        self.order = {}
+        self.pending = {}
+        self.dependents = {}
+        self.store = None
+
+    def task(self, plugin_instance, name=None, profiler=None):
+        """
+        Build the task running a plugin on this scheduler.
+
+        Args:
+            plugin_instance: The plugin instance to run.
+            name (str, optional): The plugin name, used to label the measures.
+            profiler (Profiler, optional): The profiler recording each step. Not supported by
+                the process executor, whose workers cannot share the profiler.
+
+        Returns:
+            tuple: A ``(function, args)`` tuple to pass to ``run``.
+        """
+        if self.executor == "process":
+            if isinstance(plugin_instance, LazyInstance):
+                # Import the plugin here rather than in every worker process
+                plugin_instance = plugin_instance.resolve()
+            return run_plugin_recording, (plugin_instance, name)
+        return run_plugin, (plugin_instance, name, profiler)
+
+    def run(self, tasks, dependencies, hooks=None, store=None, priorities=None, types=None):
+        """
+        Run tasks once their dependencies have completed.
+
+        Args:
+            tasks (dict): An ordered mapping of plugin names to ``(function, args)`` tuples. The
+                order is used to break ties between plugins of the same priority.
+            dependencies (dict): A mapping of plugin names to the names they depend on.
+            hooks (dict, optional): The registered hooks, wrapped for the duration of the run so
+                async hooks can be triggered from sync plugins.
+            store (ResultStore, optional): Pass the results of the dependencies of each task as its
+                ``inputs`` keyword argument, and store its result instead of returning it.
+            priorities (dict, optional): The priority hint of each plugin, higher first.
+            types (dict, optional): The type of each plugin, keying its durations in the runtime history.
+
+        Returns:
+            dict: A mapping of plugin names to the values returned by their task, without a store.
+
+        Raises:
+            PluginExecutionError: If one or more plugins failed.
+        """
+        ready = self.prepare(tasks, dependencies, store, priorities, types)
+        self.logger.info("Scheduling %d plugins on a %s pool", len(tasks), self.executor)
+
+        originals = self.wrap_hooks(hooks)
+        try:
+            limit = self.pool_size()
+            with self.EXECUTORS[self.executor](max_workers=limit) as pool:
+                # Only submit what can run, so the pool queue does not override the priorities
+                queued = []
+                running = {}
+                while ready or queued or running:
+                    queued.extend(self.cached(ready))
+                    queued.sort(key=self.order.get)
+                    ready = []
+                    while queued and len(running) < limit:
+                        name = queued.pop(0)
+                        function, args = tasks[name]
+                        self.logger.debug("Dispatching plugin %s", name)
+                        running[pool.submit(function, *args, **self.inputs(name))] = (name, time.perf_counter())
+                    if not running:
+                        break
+
+                    done, _not_done = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        name, started = running.pop(future)
+                        try:
+                            result = future.result()
+                        except Exception as err:
+                            ready.extend(self.fail(name, err))
+                            continue
+                        self.measured(name, time.perf_counter() - started)
+                        if self.executor == "process":
+                            result, triggers = result
+                            self.replay(name, triggers, originals)
+                        ready.extend(self.complete(name, result))
+        finally:
+            self.unwrap_hooks(hooks, originals)
+
+        return self.finish()
+
+    def pool_size(self):
+        """
+        Return the number of plugins running at the same time.
+
+        Returns:
+            int: ``max_workers``, or the default of the executor in ``concurrent.futures``.
+        """
+        if self.max_workers:
+            return self.max_workers
+        if self.executor == "process":
+            return os.cpu_count() or 1
+        return min(32, (os.cpu_count() or 1) + 4)
+
+    def replay(self, name, triggers, hooks):
+        """
+        Replay the hook triggers recorded by a plugin run in a worker process.
+
+        Args:
+            name (str): The name of the plugin.
+            triggers (list): The ``(hook_name, args, kwargs)`` triggers recorded by the plugin.
+            hooks (dict): The hooks to trigger.
+        """
+        with running_plugin(name):
+            for hook_name, args, kwargs in triggers:
+                try:
+                    hooks[hook_name].trigger(*args, **kwargs)
+                except Exception:
+                    self.logger.exception("Failed to trigger hook %s for plugin %s", hook_name, name)
+
+    def prepare(self, tasks, dependencies, store=None, priorities=None, types=None):
+        """
+        Reset the scheduler state and index the dependency graph of a run.
+
+        Args:
+            tasks (dict): An ordered mapping of plugin names to tasks.
+            dependencies (dict): A mapping of plugin names to the names they depend on.
+            store (ResultStore, optional): The store passing results between the tasks.
+            priorities (dict, optional): The priority hint of each plugin, higher first.
+            types (dict, optional): The type of each plugin, keying its durations in the runtime history.
+
+        Returns:
+            list: The plugins without dependencies, ready to be dispatched, in dispatch order.
+        """
+        self.store = store
+        self.types = types or {}
+        self.results = {}
+        self.failed = {}
+        self.skipped = []
+        self.degraded = []
+        self.pending = {}
+        self.dependents = {name: [] for name in tasks}
+        requires = {}
+        for name in tasks:
+            requires[name] = {dep for dep in dependencies.get(name, []) if dep in tasks}
+            self.pending[name] = len(requires[name])
+            for dep in requires[name]:
+                self.dependents[dep].append(name)
+        self.order = self.rank(tasks, requires, priorities)
+        return sorted((name for name in tasks if self.pending[name] == 0), key=self.order.get)
+
+    def rank(self, tasks, requires, priorities=None):
+        """
+        Order the plugins to dispatch first when more are ready than can run.
+
+        A plugin inherits the highest priority hint of the plugins depending on it. Among
+        plugins of the same priority, the one with the longest estimated path to the end of
+        the run goes first, the estimates coming from the runtime history. Plugins which never
+        ran are estimated at the median duration of the others, so without a history the path
+        with the most plugins goes first.
+
+        Args:
+            tasks (dict): An ordered mapping of plugin names to tasks, the order breaking ties.
+            requires (dict): The dependencies of each plugin, among the tasks.
+            priorities (dict, optional): The priority hint of each plugin, higher first.
+            types (dict, optional): The type of each plugin, keying its durations in the runtime history.
+
+        Returns:
+            dict: The dispatch position of each plugin.
+        """
+        priorities = priorities or {}
+        estimates = {}
+        if self.history is not None:
+            estimates = {name: self.history.estimate(self.history_key(name)) for name in tasks}
+        known = [estimate for estimate in estimates.values() if estimate is not None]
+        default = statistics.median(known) if known else 1.0
+        # Walk the graph from the plugins nothing depends on back to the roots
+        remaining = {name: len(self.dependents[name]) for name in tasks}
+        stack = [name for name in tasks if not remaining[name]]
+        paths = {}
+        hints = {}
+        while stack:
+            name = stack.pop()
+            dependents = self.dependents[name]
+            paths[name] = (estimates.get(name) or default) + max((paths[dep] for dep in dependents), default=0.0)
+            hints[name] = max([priorities.get(name, 0)] + [hints[dep] for dep in dependents])
+            for dep in requires[name]:
+                remaining[dep] -= 1
+                if not remaining[dep]:
+                    stack.append(dep)
+        position = {name: index for index, name in enumerate(tasks)}
+        order = sorted(tasks, key=lambda name: (-hints.get(name, 0), -paths.get(name, 0.0), position[name]))
+        if paths:
+            self.logger.debug("Estimated critical path: %.3fs", max(paths.values()))
+        return {name: index for index, name in enumerate(order)}
+
+    def measured(self, name, duration):
+        """
+        Record the duration of a plugin in the runtime history.
+
+        Args:
+            name (str): The name of the plugin.
+            duration (float): The duration of its run in seconds.
+        """
+        if self.history is not None:
+            self.history.record(self.history_key(name), duration)
+
+    def history_key(self, name):
+        """
+        Return the key of a plugin in the runtime history.
+
+        Args:
+            name (str): The name of the plugin.
+
+        Returns:
+            str: ``type:name``, plugins of different types may have the same name.
+        """
+        plugin_type = self.types.get(name)
+        return name if plugin_type is None else f"{plugin_type}:{name}"
+
+    def inputs(self, name):
+        """
+        Build the keyword arguments passing the results of its dependencies to a task.
+
+        Args:
+            name (str): The name of the plugin about to be dispatched.
+
+        Returns:
+            dict: The ``inputs`` keyword argument, or no argument without a store.
+        """
+        if self.store is None:
+            return {}
+        return {"inputs": self.store.inputs(name)}
+
+    def cached(self, ready):
+        """
+        Complete the ready plugins whose result is replayed or cached, without running them.
+
+        Args:
+            ready (list): The plugins ready to be dispatched, in order.
+
+        Returns:
+            list: The plugins to dispatch, including the dependents of cached plugins that became ready.
+        """
+        if self.store is None or not self.store.memoized:
+            return ready
+        dispatch = []
+        ready = list(ready)
+        while ready:
+            name = ready.pop(0)
+            hit, result = self.store.lookup(name)
+            if not hit:
+                dispatch.append(name)
+                continue
+            ready.extend(self.complete(name, result))
+            ready.sort(key=self.order.get)
+        return dispatch
+
+    def complete(self, name, result):
+        """
+        Record a completed plugin.
+
+        Args:
+            name (str): The name of the completed plugin.
+            result: The value returned by its task.
+
+        Returns:
+            list: The dependents that became ready to be dispatched.
+        """
+        self.logger.debug("Plugin %s completed", name)
+        if self.store is not None:
+            self.store.put(name, result)
+            self.store.consume(name)
+        else:
+            self.results[name] = result
+        return self.release(name)
+
+    def release(self, name):
+        """
+        Release the dependents of a plugin which completed, or failed when they run degraded.
+
+        Args:
+            name (str): The name of the plugin.
+
+        Returns:
+            list: The dependents that became ready to be dispatched.
+        """
+        ready = []
+        for dependent in self.dependents[name]:
+            if (name in self.failed or name in self.degraded) and dependent not in self.degraded:
+                self.degraded.append(dependent)
+            self.pending[dependent] -= 1
+            if self.pending[dependent] == 0 and dependent not in self.skipped:
+                ready.append(dependent)
+        return ready
+
+    def fail(self, name, err):
+        """
+        Record a failed plugin, and skip or degrade everything depending on it.
+
+        Args:
+            name (str): The name of the failed plugin.
+            err (Exception): The error raised by its task.
+
+        Returns:
+            list: The degraded dependents that became ready to be dispatched.
+        """
+        self.logger.error("Plugin %s failed: %s", name, err)
+        self.failed[name] = err
+        if self.store is not None:
+            self.store.consume(name)
+        if self.on_failure == "degrade":
+            for dependent in self.dependents[name]:
+                self.logger.warning("Running plugin %s degraded: dependency %s failed", dependent, name)
+            return self.release(name)
+        self.skip_dependents(name)
+        return []
+
+    def finish(self):
+        """
+        Return the results of the run.
+
+        Returns:
+            dict: A mapping of plugin names to the values returned by their task.
+
+        Raises:
+            PluginExecutionError: If one or more plugins failed.
+        """
+        if self.failed:
+            message = f"Plugins failed: {', '.join(self.failed)}"
+            if self.degraded:
+                message += f", degraded: {', '.join(self.degraded)}"
+            raise PluginExecutionError(message)
+        return self.results
+
+    def skip_dependents(self, name):
+        """
+        Mark every plugin depending directly or transitively on a plugin as skipped.
+
+        Args:
+            name (str): The name of the plugin that did not complete.
+        """
+        stack = list(self.dependents[name])
+        while stack:
+            dependent = stack.pop()
+            if dependent in self.skipped:
+                continue
+            self.logger.warning("Skipping plugin %s: dependency %s did not complete", dependent, name)
+            self.skipped.append(dependent)
+            if self.store is not None:
+                self.store.consume(dependent)
+            stack.extend(self.dependents[dependent])
+
+    def wrap_hooks(self, hooks, loop=None):
+        """
+        Wrap the registered hooks in place so async hooks can be triggered from any plugin.
+
+        With the process executor, hooks are wrapped so worker processes get copies recording
+        their triggers instead.
+
+        Args:
+            hooks (dict): The registered hooks, may be None.
+            loop (AbstractEventLoop, optional): The event loop running async plugins.
+
+        Returns:
+            dict: The original hooks, to restore with ``unwrap_hooks``.
+        """
+        if not hooks:
+            return {}
+        originals = dict(hooks)
+        for name, hook in originals.items():
+            if self.executor == "process":
+                # Worker processes get recording copies, replayed with ``replay``
+                hooks[name] = RelayHook(hook, name, loop)
+            else:
+                hooks[name] = AsyncHook(hook, loop)
+        return originals
+
+    def unwrap_hooks(self, hooks, originals):
+        """
+        Restore the hooks wrapped by ``wrap_hooks``.
+
+        Args:
+            hooks (dict): The registered hooks, may be None.
+            originals (dict): The original hooks.
+        """
+        if hooks:
+            hooks.update(originals)
+
+
+class AsyncDagScheduler(DagScheduler):
+    """
+    A scheduler running plugins on a single asyncio event loop along their dependency graph.
+
+    Plugins with ``async def`` steps are awaited on the loop, so thousands of them can be in
+    flight at once without a thread each. Sync steps run on a bounded thread pool.
+    """
+
+    EXECUTORS = {
+        "asyncio": ThreadPoolExecutor,
+    }
+
+    def __init__(
+        self, logger, executor="asyncio", max_workers=None, max_concurrency=1000, history=None, on_failure="skip"
+    ):
+        """
+        Initialize the AsyncDagScheduler instance.
+
+        Args:
+            logger (Logger): The logger to use for logging.
+            executor (str, optional): The executor type, always ``asyncio``.
+            max_workers (int, optional): The maximum number of threads running sync plugin steps.
+            max_concurrency (int, optional): The maximum number of plugins in flight at the same time.
+            history (RuntimeHistory, optional): The durations of previous runs, see ``DagScheduler``.
+            on_failure (str, optional): ``skip`` or ``degrade`` the plugins depending on a failed plugin.
+
+        Raises:
+            ValueError: If the executor type or the failure handling is unknown.
+        """
+        super().__init__(logger, executor, max_workers, history, on_failure)
+        self.max_concurrency = max_concurrency
+
+    def task(self, plugin_instance, name=None, profiler=None):
+        """
+        Build the task running a plugin on the event loop.
+
+        Args:
+            plugin_instance: The plugin instance to run.
+            name (str, optional): The plugin name, used to label the measures.
+            profiler (Profiler, optional): The profiler recording each step.
+
+        Returns:
+            tuple: A ``(coroutine function, args)`` tuple to pass to ``run``.
+        """
+        return run_plugin_async, (plugin_instance, name, profiler)
+
+    def run(self, tasks, dependencies, hooks=None, store=None, priorities=None, types=None):
+        """
+        Run tasks on an event loop once their dependencies have completed.
+
+        Args:
+            tasks (dict): An ordered mapping of plugin names to ``(coroutine function, args)`` tuples.
+            dependencies (dict): A mapping of plugin names to the names they depend on.
+            hooks (dict, optional): The registered hooks, wrapped for the duration of the run so
+                async hooks can be triggered from sync plugins.
+            store (ResultStore, optional): Pass the results of the dependencies of each task as its
+                ``inputs`` keyword argument, and store its result instead of returning it.
+            priorities (dict, optional): The priority hint of each plugin, higher first.
+            types (dict, optional): The type of each plugin, keying its durations in the runtime history.
+
+        Returns:
+            dict: A mapping of plugin names to the values returned by their task, without a store.
+
+        Raises:
+            PluginExecutionError: If one or more plugins failed.
+        """
+        return asyncio.run(self.run_async(tasks, dependencies, hooks, store, priorities, types))
+
+    async def run_async(self, tasks, dependencies, hooks=None, store=None, priorities=None, types=None):
+        """
+        Coroutine version of ``run``, to use from a running event loop.
+
+        The sync plugin steps run in a thread pool of the run, the default executor of the
+        loop is left untouched.
+        """
+        loop = asyncio.get_running_loop()
+        pool = self.EXECUTORS[self.executor](max_workers=self.max_workers)
+        # Copied into the context of each plugin task
+        token = STEP_EXECUTOR.set(pool)
+
+        ready = self.prepare(tasks, dependencies, store, priorities, types)
+        self.logger.info("Scheduling %d plugins on the event loop", len(tasks))
+
+        originals = self.wrap_hooks(hooks, loop)
+        try:
+            # At most max_concurrency plugins in flight, the others wait in priority order
+            queued = []
+            running = {}
+            while ready or queued or running:
+                queued.extend(self.cached(ready))
+                queued.sort(key=self.order.get)
+                ready = []
+                while queued and len(running) < self.max_concurrency:
+                    name = queued.pop(0)
+                    function, args = tasks[name]
+                    self.logger.debug("Dispatching plugin %s", name)
+                    future = asyncio.ensure_future(function(*args, **self.inputs(name)))
+                    running[future] = (name, time.perf_counter())
+                if not running:
+                    break
+
+                done, _pending = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    name, started = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as err:
+                        ready.extend(self.fail(name, err))
+                        continue
+                    self.measured(name, time.perf_counter() - started)
+                    ready.extend(self.complete(name, result))
+        finally:
+            self.unwrap_hooks(hooks, originals)
+            STEP_EXECUTOR.reset(token)
+            # Without blocking the loop, the steps of an interrupted run finish in the background
+            pool.shutdown(wait=False)
+
+        return self.finish()
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+import json
+
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class Serializer:
+    """An encoder and decoder for one format, backed by one library."""
+
+    def __init__(self, name, format, dumps, loads):
+        """
+        Initialize the Serializer instance.
+
+        Args:
+            name (str): The name of the backend library.
+            format (str): The encoded format (``json`` or ``msgpack``).
+            dumps (callable): Encodes an object to bytes.
+            loads (callable): Decodes bytes to an object.
+        """
+        self.name = name
+        self.format = format
+        self.dumps = dumps
+        self.loads = loads
+
+    def __repr__(self):
+        return f"<Serializer {self.format} ({self.name})>"
+
+
+def json_backends():
+    """
+    Build the available JSON serializers, fastest first.
+
+    Objects that are not natively serializable are encoded with ``str``.
+
+    Returns:
+        dict: The serializers keyed by backend name.
+    """
+    backends = {}
+    if orjson is not None:
+        backends["orjson"] = Serializer(
+            "orjson",
+            "json",
+            lambda obj: orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS),
+            orjson.loads,
+        )
+    if msgspec is not None:
+        encoder = msgspec.json.Encoder(enc_hook=str)
+        backends["msgspec"] = Serializer("msgspec", "json", encoder.encode, msgspec.json.decode)
+    backends["json"] = Serializer(
+        "json",
+        "json",
+        lambda obj: json.dumps(obj, default=str, separators=(",", ":")).encode("utf-8"),
+        json.loads,
+    )
+    return backends
+
+
+def msgpack_backends():
+    """
+    Build the available MessagePack serializers, fastest first.
+
+    Returns:
+        dict: The serializers keyed by backend name.
+    """
+    backends = {}
+    if msgspec is not None:
+        encoder = msgspec.msgpack.Encoder(enc_hook=str)
+        backends["msgspec"] = Serializer("msgspec", "msgpack", encoder.encode, msgspec.msgpack.decode)
+    if msgpack is not None:
+        backends["msgpack"] = Serializer(
+            "msgpack",
+            "msgpack",
+            lambda obj: msgpack.packb(obj, default=str),
+            lambda data: msgpack.unpackb(data, strict_map_key=False),
+        )
+    return backends
+
+
+BACKENDS = {
+    "json": json_backends,
+    "msgpack": msgpack_backends,
+}
+
+
+def get_serializer(format="json", backend=None):
+    """
+    Return the fastest available serializer for a format.
+
+    Args:
+        format (str, optional): The encoded format, ``json`` or ``msgpack``.
+        backend (str, optional): Use this backend library instead of the fastest one.
+
+    Returns:
+        Serializer: The serializer.
+
+    Raises:
+        ValueError: If the format is unknown.
+        ImportError: If no library, or not the requested one, is installed for the format.
+    """
+    if format not in BACKENDS:
+        raise ValueError(f"Unknown serializer format: {format}")
+    backends = BACKENDS[format]()
+    if backend is not None:
+        if backend not in backends:
+            raise ImportError(f"Serializer backend {backend} is not available for {format}")
+        return backends[backend]
+    if not backends:
+        raise ImportError(f"No serializer backend is installed for {format}")
+    return next(iter(backends.values()))
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import os
+import pickle
+import threading
+
+from src.lib.cache import tree_digest
+
+
+class PlanState:
+    """
+    The incremental state of the plugins of one type, for one run.
+
+    Holds the results of the previous run of the unchanged plugins, replayed instead of
+    running them, and records the results of this run.
+    """
+
+    def __init__(self, fingerprints, replay):
+        """
+        Initialize the PlanState instance.
+
+        Args:
+            fingerprints (dict): The fingerprint of each plugin of the run.
+            replay (dict): The pickled results of the previous run of the unchanged plugins.
+        """
+        self.fingerprints = fingerprints
+        self.replay = replay
+        self.recorded = {}
+        self.lock = threading.Lock()
+
+    def lookup(self, name):
+        """
+        Return the previous result of a plugin if it did not change.
+
+        Args:
+            name (str): The name of the plugin.
+
+        Returns:
+            tuple: ``(True, result)`` if the plugin must be replayed, ``(False, None)`` otherwise.
+        """
+        with self.lock:
+            data = self.replay.pop(name, None)
+        if data is None:
+            return False, None
+        return True, pickle.loads(data)
+
+    def record(self, name, result):
+        """
+        Record the result of a plugin, for the next run.
+
+        Args:
+            name (str): The name of the plugin.
+            result: The value returned by its ``execute`` step, or replayed.
+
+        Returns:
+            bool: False if the result cannot be pickled, the plugin then runs again next time.
+        """
+        try:
+            data = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            return False
+        with self.lock:
+            self.recorded[name] = (self.fingerprints[name], data)
+        return True
+
+
+class RunState:
+    """
+    The state of the previous run, to only run the plugins downstream of a change.
+
+    Each plugin gets a fingerprint hashing its source tree (including its ``VERSION``), its
+    keyword arguments and the fingerprints of its dependencies. A plugin runs again if its
+    fingerprint changed, if it did not complete in the previous run, or if one of its
+    dependencies runs again. The other plugins are not run: their previous result is replayed.
+    """
+
+    FORMAT_VERSION = 2
+
+    def __init__(self, logger, path, exclude=None, full=False):
+        """
+        Initialize the RunState instance.
+
+        Args:
+            logger (Logger): The logger to use for logging.
+            path (str): The file storing the state between runs.
+            exclude (list, optional): The names of the plugins always run, along with their dependents.
+            full (bool, optional): Run every plugin, and record their results for the next run.
+        """
+        self.logger = logger
+        self.path = path
+        self.exclude = set(exclude or [])
+        self.full = full
+        self.types = None
+        self.plans = {}
+
+    def load(self):
+        """Load the state of the previous run, on first use."""
+        if self.types is not None:
+            return
+        self.types = {}
+        try:
+            with open(self.path, "rb") as f:
+                data = pickle.load(f)
+        except FileNotFoundError:
+            self.logger.debug("No previous run state at %s", self.path)
+            return
+        except (OSError, pickle.UnpicklingError, EOFError) as err:
+            self.logger.warning("Ignoring unreadable run state %s: %s", self.path, err)
+            return
+        if not isinstance(data, dict) or data.get("version") != self.FORMAT_VERSION:
+            self.logger.info("Run state %s is outdated, running every plugin", self.path)
+            return
+        self.types = data["types"]
+
+    def fingerprint(self, name, directory, kwargs, dependencies):
+        """
+        Compute the fingerprint of a plugin.
+
+        Args:
+            name (str): The name of the plugin.
+            directory (str): The plugin directory.
+            kwargs (dict): The keyword arguments the plugin was registered with.
+            dependencies (list): The fingerprints of its dependencies.
+
+        Returns:
+            str: The fingerprint, or None if the plugin cannot be fingerprinted.
+        """
+        try:
+            payload = pickle.dumps((name, sorted((kwargs or {}).items()), sorted(dependencies)))
+            source = tree_digest(directory)
+        except (pickle.PicklingError, TypeError, AttributeError, OSError) as err:
+            self.logger.debug("Plugin %s cannot be fingerprinted: %s", name, err)
+            return None
+        return hashlib.sha256(source.encode("ascii") + payload).hexdigest()
+
+    def plan(self, plugin_type, sorted_plugins, dependencies, sources):
+        """
+        Find the plugins of a type to run again.
+
+        Args:
+            plugin_type (str): The type of the plugins.
+            sorted_plugins (list): The plugins of the run, in topological order.
+            dependencies (dict): A mapping of plugin names to the names they depend on.
+            sources (dict): The ``(directory, kwargs)`` of each plugin.
+
+        Returns:
+            PlanState: The results to replay, recording the results of this run.
+        """
+        self.load()
+        previous = self.types.get(plugin_type, {})
+        fingerprints = {}
+        changed = set()
+        for name in sorted_plugins:
+            deps = [dep for dep in dependencies.get(name, []) if dep in fingerprints]
+            directory, kwargs = sources.get(name, (None, None))
+            fingerprints[name] = None
+            if directory is not None:
+                fingerprints[name] = self.fingerprint(
+                    name, directory, kwargs, [(dep, fingerprints[dep]) for dep in deps]
+                )
+            entry = previous.get(name)
+            if (
+                self.full
+                or name in self.exclude
+                or fingerprints[name] is None
+                or entry is None
+                or entry[0] != fingerprints[name]
+                or any(dep in changed for dep in deps)
+            ):
+                changed.add(name)
+        replay = {name: previous[name][1] for name in sorted_plugins if name not in changed}
+        self.logger.info(
+            "Incremental run of %s plugins: %d to run, %d replayed", plugin_type, len(changed), len(replay)
+        )
+        self.logger.debug("Changed %s plugins: %s", plugin_type, [name for name in sorted_plugins if name in changed])
+        self.plans[plugin_type] = PlanState(fingerprints, replay)
+        return self.plans[plugin_type]
+
+    def save(self):
+        """Write the plugins that completed in this run, they are replayed by the next run if unchanged."""
+        if not self.plans:
+            return
+        self.load()
+        for plugin_type, plan in self.plans.items():
+            self.types[plugin_type] = plan.recorded
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        temporary_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as f:
+            pickle.dump({"version": self.FORMAT_VERSION, "types": self.types}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, self.path)
+        self.logger.debug("Saved run state to %s", self.path)
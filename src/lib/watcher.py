@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+import os
+import threading
+
+
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+
+IGNORED_DIRECTORIES = ("__pycache__",)
+
+
+class Watcher:
+    """
+    Watches directory trees for changed files.
+
+    Changes are found by comparing snapshots of the name, modification time and size of the
+    files of every directory. When the ``inotify_simple`` package is installed, ``wait``
+    returns as soon as a file changes, otherwise it sleeps for the polling interval.
+    """
+
+    def __init__(self, logger, directories, interval=1.0):
+        """
+        Initialize the Watcher instance.
+
+        Args:
+            logger (Logger): The logger to use for logging.
+            directories (list): The root directories to watch.
+            interval (float, optional): The polling interval in seconds.
+        """
+        self.logger = logger
+        self.directories = [os.path.abspath(directory) for directory in directories if directory]
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.inotify = None
+        self.watches = set()
+        if inotify_simple is not None:
+            self.inotify = inotify_simple.INotify()
+        self.snapshots = self.scan()
+
+    def scan(self):
+        """
+        Take a snapshot of the watched directories.
+
+        Returns:
+            dict: The signature of each directory, keyed by path.
+        """
+        snapshots = {}
+        for root in self.directories:
+            for path, dirs, files in os.walk(root):
+                dirs[:] = sorted(name for name in dirs if name not in IGNORED_DIRECTORIES)
+                signature = [tuple(dirs)]
+                for file_name in sorted(files):
+                    try:
+                        stat = os.stat(os.path.join(path, file_name))
+                    except OSError:
+                        continue
+                    signature.append((file_name, stat.st_mtime_ns, stat.st_size))
+                snapshots[path] = tuple(signature)
+                self.watch(path)
+        return snapshots
+
+    def watch(self, path):
+        """Add an inotify watch on a directory, if inotify is available."""
+        if self.inotify is None or path in self.watches:
+            return
+        flags = inotify_simple.flags
+        mask = flags.CREATE | flags.DELETE | flags.MODIFY | flags.MOVED_FROM | flags.MOVED_TO | flags.ATTRIB
+        try:
+            self.inotify.add_watch(path, mask)
+            self.watches.add(path)
+        except OSError as err:
+            self.logger.debug("Cannot watch %s: %s", path, err)
+
+    def changes(self):
+        """
+        Return the directories changed since the previous call.
+
+        Returns:
+            set: The paths of the directories added, removed or whose files changed.
+        """
+        snapshots = self.scan()
+        changed = {
+            path for path in set(snapshots) | set(self.snapshots) if snapshots.get(path) != self.snapshots.get(path)
+        }
+        self.watches &= set(snapshots)
+        self.snapshots = snapshots
+        if changed:
+            self.logger.debug("Changed directories: %s", sorted(changed))
+        return changed
+
+    def wait(self, timeout=None):
+        """
+        Wait for a change, or for the timeout to expire.
+
+        Args:
+            timeout (float, optional): The maximum time to wait in seconds, the interval if not provided.
+
+        Returns:
+            bool: False if the watcher was stopped, True otherwise.
+        """
+        timeout = self.interval if timeout is None else timeout
+        if self.inotify is not None and not self.stopped.is_set():
+            self.inotify.read(timeout=int(timeout * 1000))
+            return not self.stopped.is_set()
+        return not self.stopped.wait(timeout)
+
+    def stop(self):
+        """Stop waiting for changes, ``wait`` returns within one interval."""
+        self.stopped.set()
+
+    def close(self):
+        """Release the inotify instance."""
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
@@ -0,0 +1,519 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import contextlib
+import functools
+import importlib.util
+import logging
+import math
+import multiprocessing
+import os
+import pickle
+import queue
+import signal
+import threading
+import time
+import traceback
+
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from src.lib.archive import ARCHIVE_SUFFIX, find_archive, open_archive
+from src.lib.buffers import BUFFERS_HOOK, REMOTE_METHODS, RemoteBuffers, share_tracker
+from src.lib.bytecode import file_spec
+from src.lib.exceptions import PluginBudgetError, PluginExecutionError
+from src.lib.hooks import running_plugin
+from src.lib.logger import stop_logging
+from src.lib.profiler import measure
+from src.lib.scheduler import STEP_EXECUTOR, AsyncDagScheduler, run_plugin
+
+
+def dumps(message):
+    """Encode a message sent between the pool and its workers."""
+    return pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+loads = pickle.loads
+
+
+class RemoteHook:
+    """A hook proxy in a worker process, relaying its triggers to the hook in the pool process."""
+
+    def __init__(self, conn, name, buffers=None):
+        """
+        Initialize the RemoteHook instance.
+
+        Args:
+            conn (Connection): The connection to the pool process.
+            name (str): The name of the hook.
+            buffers (RemoteBuffers, optional): The result buffers, whose views are sent by reference.
+        """
+        self.conn = conn
+        self.name = name
+        self.buffers = buffers
+
+    def trigger(self, *args, **kwargs):
+        """Send a trigger to the pool process, which triggers the hook."""
+        if self.buffers is not None:
+            args = tuple(self.buffers.ref(arg) for arg in args)
+            kwargs = {key: self.buffers.ref(value) for key, value in kwargs.items()}
+        self.conn.send_bytes(dumps(("hook", self.name, args, kwargs)))
+
+
+def remote_call(conn):
+    """
+    Build a function calling a method of the result buffers of the pool process.
+
+    Args:
+        conn (Connection): The connection to the pool process.
+
+    Returns:
+        callable: The function, called as ``call(method, *args)``.
+    """
+
+    def call(method, *args):
+        conn.send_bytes(dumps(("call", method, args)))
+        kind, value = loads(conn.recv_bytes())
+        if kind == "raise":
+            raise value
+        return value
+
+    return call
+
+
+def build_hooks(conn, hook_names):
+    """
+    Build the hooks of an isolated plugin, relaying their use to the pool process.
+
+    Args:
+        conn (Connection): The connection to the pool process.
+        hook_names (list): The names of the hooks of the pool process.
+
+    Returns:
+        dict: The hook proxies, or None if there are no hooks.
+    """
+    buffers = RemoteBuffers(remote_call(conn)) if BUFFERS_HOOK in hook_names else None
+    hooks = {name: RemoteHook(conn, name, buffers) for name in hook_names if name != BUFFERS_HOOK}
+    if buffers is not None:
+        hooks[BUFFERS_HOOK] = buffers
+    return hooks or None
+
+
+def import_plugin(module_name, module_path):
+    """
+    Import a plugin module in a worker process.
+
+    Args:
+        module_name (str): The name of the plugin module.
+        module_path (str): The ``__init__.py`` of the plugin, possibly in a plugin archive.
+
+    Returns:
+        module: The plugin module.
+    """
+    head, sep, _member = module_path.partition(ARCHIVE_SUFFIX + os.sep)
+    if sep:
+        # Opened already when the worker was forked from the process which discovered it
+        open_archive(logging.getLogger(__name__), head + ARCHIVE_SUFFIX)
+    archived = find_archive(module_path)
+    if archived is not None:
+        return archived[0].load(module_name)
+    spec = file_spec(module_name, module_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def address_space():
+    """Return the size of the address space of the current process in bytes, or None if unknown."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[0]) * resource.getpagesize()
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def cpu_exceeded(signum, frame):
+    """Interrupt a plugin which used its CPU time budget, ``SIGXCPU`` is sent every second until it stops."""
+    raise PluginBudgetError("exceeded its CPU time budget")
+
+
+@contextlib.contextmanager
+def resource_limits(memory=None, cpu=None):
+    """
+    Limit the resources a plugin may use in a worker process, for the duration of a block.
+
+    The limits are relative to what the worker already uses, as workers run many plugins.
+    Memory is limited with ``RLIMIT_AS``, as ``RLIMIT_RSS`` is not enforced by Linux, so a
+    plugin allocating more gets a ``MemoryError``. CPU time is limited with ``RLIMIT_CPU``,
+    whose ``SIGXCPU`` is turned into a ``PluginBudgetError`` by ``cpu_exceeded``. Only the
+    soft limits are lowered, so they can be restored for the next plugin.
+
+    Args:
+        memory (int, optional): The bytes the plugin may add to the address space of the worker.
+        cpu (float, optional): The CPU seconds the plugin may use, rounded up to a whole second.
+    """
+    previous = {}
+    try:
+        if resource is not None and cpu:
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            soft, hard = previous[resource.RLIMIT_CPU] = resource.getrlimit(resource.RLIMIT_CPU)
+            limit = math.ceil(usage.ru_utime + usage.ru_stime + cpu)
+            resource.setrlimit(
+                resource.RLIMIT_CPU, (limit if hard == resource.RLIM_INFINITY else min(limit, hard), hard)
+            )
+        size = address_space() if resource is not None and memory else None
+        if size is not None:
+            soft, hard = previous[resource.RLIMIT_AS] = resource.getrlimit(resource.RLIMIT_AS)
+            limit = size + memory
+            resource.setrlimit(
+                resource.RLIMIT_AS, (limit if hard == resource.RLIM_INFINITY else min(limit, hard), hard)
+            )
+        yield
+    finally:
+        for limit, values in previous.items():
+            resource.setrlimit(limit, values)
+
+
+def worker_main(conn, logger_name):
+    """
+    Run plugins sent by the pool until it sends None.
+
+    Modules and plugin instances are cached, so a plugin running again on the same worker is
+    not imported again. Workers are recycled after reloads so the cache is never stale.
+
+    Args:
+        conn (Connection): The connection to the pool process.
+        logger_name (str): The name of the logger passed to plugins.
+    """
+    # Interrupts are handled by the pool process
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if hasattr(signal, "SIGXCPU"):
+        signal.signal(signal.SIGXCPU, cpu_exceeded)
+    logger = logging.getLogger(logger_name)
+    modules = {}
+    instances = {}
+    while True:
+        try:
+            message = conn.recv_bytes()
+        except EOFError:
+            break
+        task = loads(message)
+        if task is None:
+            break
+        module_name, module_path, class_name, name, hook_names, options, inputs, limits = task
+        hooks = None
+        try:
+            key = (module_path, class_name)
+            if key not in instances:
+                if module_path not in modules:
+                    modules[module_path] = import_plugin(module_name, module_path)
+                hooks = build_hooks(conn, hook_names)
+                instances[key] = (getattr(modules[module_path], class_name)(logger, hooks, **options), hooks)
+            instance, hooks = instances[key]
+            with resource_limits(**limits):
+                result = run_plugin(instance, name, inputs=inputs)
+            reply = ("result", result)
+        except PluginBudgetError as err:
+            reply = ("budget", str(err))
+        except MemoryError:
+            if limits.get("memory"):
+                reply = ("budget", f"exceeded its memory budget of {limits['memory']} bytes")
+            else:
+                reply = ("error", "MemoryError", traceback.format_exc())
+        except Exception as err:
+            reply = ("error", f"{type(err).__name__}: {err}", traceback.format_exc())
+        if hooks and BUFFERS_HOOK in hooks:
+            hooks[BUFFERS_HOOK].close()
+        try:
+            conn.send_bytes(dumps(reply))
+        except (pickle.PicklingError, TypeError, AttributeError) as err:
+            conn.send_bytes(dumps(("error", f"Cannot send the result of {name}: {err}", "")))
+    # Worker processes exit without running the exit handlers writing the queued log records
+    stop_logging()
+
+
+class Worker:
+    """A pre-forked worker process and the pool end of its connection."""
+
+    def __init__(self, context, logger_name, generation):
+        """
+        Start a worker process.
+
+        Args:
+            context (BaseContext): The multiprocessing context starting the process.
+            logger_name (str): The name of the logger passed to plugins.
+            generation (int): The pool generation the worker was started in.
+        """
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=worker_main, args=(child_conn, logger_name), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.generation = generation
+        self.tasks = 0
+
+    def stop(self, timeout=1.0):
+        """Ask the worker to exit, and kill it if it does not exit in time."""
+        try:
+            self.conn.send_bytes(dumps(None))
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout)
+        self.kill()
+
+    def kill(self):
+        """Kill the worker process."""
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class WorkerPool:
+    """
+    A pool of pre-forked worker processes running isolated plugins.
+
+    Isolated plugins run outside the interpreter of the application, so CPU-bound plugins
+    do not hold its GIL and a crashing plugin only takes its worker down. Workers are reused
+    across plugins and replaced after ``max_tasks`` tasks, when they crash or when a plugin
+    exceeds its budget: its ``timeout`` in wall seconds, its ``memory`` in bytes or its
+    ``cpu`` seconds. Hook triggers of isolated plugins are sent back and run on the hooks of
+    the application.
+    """
+
+    def __init__(
+        self,
+        logger,
+        processes=None,
+        max_tasks=100,
+        timeout=None,
+        types=None,
+        plugins=None,
+        start_method=None,
+        memory=None,
+        cpu=None,
+    ):
+        """
+        Initialize the WorkerPool instance.
+
+        Args:
+            logger (Logger): The logger to use for logging, also passed to isolated plugins.
+            processes (int, optional): The number of worker processes, the number of CPUs if not provided.
+            max_tasks (int, optional): The number of tasks after which a worker is replaced.
+            timeout (float, optional): The default maximum run time of a plugin in seconds.
+            types (list, optional): The plugin types whose plugins are all isolated.
+            plugins (dict or list, optional): The isolated plugins, or a mapping of plugin names
+                to their options: ``timeout``, ``memory`` and ``cpu``.
+            start_method (str, optional): The multiprocessing start method, ``fork`` where available.
+            memory (int, optional): The default bytes a plugin may allocate in its worker.
+            cpu (float, optional): The default CPU seconds a plugin may use.
+        """
+        if start_method is None and "fork" in multiprocessing.get_all_start_methods():
+            start_method = "fork"
+        self.logger = logger
+        self.processes = processes or multiprocessing.cpu_count()
+        self.max_tasks = max_tasks
+        self.timeout = timeout
+        self.memory = memory
+        self.cpu = cpu
+        self.types = set(types or [])
+        if isinstance(plugins, dict):
+            self.plugins = {name: options or {} for name, options in plugins.items()}
+        else:
+            self.plugins = {name: {} for name in plugins or []}
+        self.context = multiprocessing.get_context(start_method)
+        self.idle = queue.Queue()
+        self.workers = []
+        self.lock = threading.Lock()
+        self.generation = 0
+
+    def isolates(self, plugin_type, name):
+        """
+        Tell if a plugin runs in the pool.
+
+        Args:
+            plugin_type (str): The type of the plugin.
+            name (str): The name of the plugin.
+
+        Returns:
+            bool: True if the plugin or its type is isolated.
+        """
+        return plugin_type in self.types or name in self.plugins
+
+    def start(self):
+        """Start the worker processes, if they are not started yet."""
+        with self.lock:
+            if self.workers:
+                return
+            self.logger.info("Starting %d plugin worker processes", self.processes)
+            # Segments of the result buffers are tracked, and unlinked, by this process only
+            share_tracker()
+            for _ in range(self.processes):
+                self.spawn()
+
+    def spawn(self):
+        """Start a worker and make it available, the lock must be held."""
+        worker = Worker(self.context, self.logger.name, self.generation)
+        self.workers.append(worker)
+        self.idle.put(worker)
+
+    def replace(self, worker, kill=False):
+        """
+        Stop a worker and start another one in its place.
+
+        Args:
+            worker (Worker): The worker to replace.
+            kill (bool, optional): Kill the worker instead of asking it to exit.
+        """
+        if kill:
+            worker.kill()
+        else:
+            worker.stop()
+        with self.lock:
+            # Workers are not replaced once the pool is closed
+            if worker in self.workers:
+                self.workers.remove(worker)
+                self.spawn()
+
+    def acquire(self):
+        """Wait for an available worker started in the current generation."""
+        self.start()
+        while True:
+            worker = self.idle.get()
+            if worker.generation == self.generation and worker.process.is_alive():
+                return worker
+            self.replace(worker, kill=not worker.process.is_alive())
+
+    def release(self, worker):
+        """Make a worker available again, or replace it once it has run ``max_tasks`` tasks."""
+        if self.max_tasks and worker.tasks >= self.max_tasks:
+            self.logger.debug("Recycling plugin worker %s after %d tasks", worker.process.pid, worker.tasks)
+            self.replace(worker)
+        else:
+            self.idle.put(worker)
+
+    def recycle(self):
+        """Replace every worker, so plugins reloaded since they started are imported again."""
+        with self.lock:
+            self.generation += 1
+
+    def task(self, plugin, name, hooks=None, scheduler=None, profiler=None):
+        """
+        Build the task running a plugin in the pool.
+
+        Args:
+            plugin (dict): The registered plugin, with its ``module_name`` and ``module_path``.
+            name (str): The name of the plugin, which is also the name of its class.
+            hooks (dict, optional): The hooks triggered on behalf of the plugin.
+            scheduler (DagScheduler, optional): The scheduler running the task.
+            profiler (Profiler, optional): The profiler recording the run.
+
+        Returns:
+            tuple: A ``(function, args)`` tuple to pass to the scheduler.
+        """
+        args = (plugin["module_name"], plugin["module_path"], name, hooks, profiler, plugin.get("kwargs"))
+        if isinstance(scheduler, AsyncDagScheduler):
+            return self.run_async, args
+        return self.run, args
+
+    def run(self, module_name, module_path, name, hooks=None, profiler=None, options=None, inputs=None):
+        """
+        Run a plugin in a worker process.
+
+        Args:
+            module_name (str): The name of the plugin module.
+            module_path (str): The path of the plugin module.
+            name (str): The name of the plugin class.
+            hooks (dict, optional): The hooks triggered on behalf of the plugin.
+            profiler (Profiler, optional): The profiler recording the run.
+            options (dict, optional): The keyword arguments the plugin was registered with.
+            inputs (dict, optional): The results of its dependencies.
+
+        Returns:
+            The value returned by the plugin run.
+
+        Raises:
+            PluginBudgetError: If the plugin exceeded its budget.
+            PluginExecutionError: If the plugin failed or its worker crashed.
+        """
+        hooks = hooks or {}
+        budget = self.plugins.get(name, {})
+        timeout = budget.get("timeout", self.timeout)
+        limits = {"memory": budget.get("memory", self.memory), "cpu": budget.get("cpu", self.cpu)}
+        worker = self.acquire()
+        worker.tasks += 1
+        kill = False
+        try:
+            with running_plugin(name), measure(profiler, "plugin", f"{name}.isolated"):
+                worker.conn.send_bytes(
+                    dumps((module_name, module_path, name, name, sorted(hooks), options or {}, inputs, limits))
+                )
+                deadline = time.monotonic() + timeout if timeout else None
+                while True:
+                    remaining = max(deadline - time.monotonic(), 0) if deadline else None
+                    if not worker.conn.poll(remaining):
+                        kill = True
+                        raise PluginBudgetError(f"Plugin {name} timed out after {timeout}s")
+                    try:
+                        message = loads(worker.conn.recv_bytes())
+                    except EOFError:
+                        kill = True
+                        worker.process.join(1.0)
+                        raise PluginExecutionError(
+                            f"Plugin {name} worker exited with code {worker.process.exitcode}"
+                        ) from None
+                    if message[0] == "hook":
+                        self.trigger(hooks, *message[1:])
+                    elif message[0] == "call":
+                        worker.conn.send_bytes(dumps(self.call(hooks, *message[1:])))
+                    elif message[0] == "error":
+                        self.logger.debug("Plugin %s failed in its worker:\n%s", name, message[2])
+                        raise PluginExecutionError(f"Plugin {name} failed: {message[1]}")
+                    elif message[0] == "budget":
+                        # Do not reuse a worker whose plugin may have left it short of memory
+                        kill = True
+                        raise PluginBudgetError(f"Plugin {name} {message[1]}")
+                    else:
+                        return message[1]
+        finally:
+            if kill:
+                self.replace(worker, kill=True)
+            else:
+                self.release(worker)
+
+    def trigger(self, hooks, hook_name, args, kwargs):
+        """Trigger a hook on behalf of an isolated plugin, passing views of the buffers it references."""
+        buffers = hooks.get(BUFFERS_HOOK)
+        if buffers is not None:
+            args = tuple(buffers.resolve(arg) for arg in args)
+            kwargs = {key: buffers.resolve(value) for key, value in kwargs.items()}
+        hooks[hook_name].trigger(*args, **kwargs)
+
+    def call(self, hooks, method, args):
+        """
+        Call a method of the result buffers on behalf of an isolated plugin.
+
+        Returns:
+            tuple: The reply to send, ``("reply", result)`` or ``("raise", error)``.
+        """
+        buffers = hooks.get(BUFFERS_HOOK)
+        if buffers is None or method not in REMOTE_METHODS:
+            return "raise", PluginExecutionError(f"Result buffers do not support {method}")
+        try:
+            return "reply", getattr(buffers, method)(*args)
+        except Exception as err:
+            return "raise", err
+
+    async def run_async(self, *args, **kwargs):
+        """Run a plugin in a worker process without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(STEP_EXECUTOR.get(), functools.partial(self.run, *args, **kwargs))
+
+    def close(self):
+        """Stop every worker process."""
+        with self.lock:
+            workers, self.workers = self.workers, []
+            self.idle = queue.Queue()
+        for worker in workers:
+            worker.stop()
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+
+# The plugins run in worker processes, by the worker pool and by the workers of a coordinator
+PLUGINS = '''
+import os
+import time
+
+__version__ = '1.0'
+
+
+class Plugin:
+    def __init__(self, logger, hooks=None, marker=None):
+        self.hooks = hooks
+        self.marker = marker
+        self.inputs = {}
+
+    def execute(self):
+        self.hooks['record'].trigger(os.getpid())
+
+    def process_results(self):
+        pass
+
+
+class Base(Plugin):
+    def execute(self):
+        result = type(self).__name__ + ''.join(sorted(self.inputs.values()))
+        self.hooks['record'].trigger(result)
+        return result
+
+
+class Report(Base):
+    pass
+
+
+class CrashOnce(Base):
+    def execute(self):
+        if not os.path.exists(self.marker):
+            open(self.marker, 'w').close()
+            os._exit(3)
+        return super().execute()
+
+
+class Crash(Plugin):
+    def execute(self):
+        os._exit(3)
+
+
+class Slow(Plugin):
+    def execute(self):
+        time.sleep(10)
+
+
+class Broken(Plugin):
+    def execute(self):
+        raise ValueError('boom')
+
+
+class Spin(Plugin):
+    def execute(self):
+        while True:
+            pass
+
+
+class Hog(Plugin):
+    def execute(self):
+        return len(bytearray(512 * 1024 * 1024))
+'''
+
+
+@pytest.fixture
+def module_path(tmp_path):
+    path = tmp_path / 'plugins' / '__init__.py'
+    path.parent.mkdir()
+    path.write_text(PLUGINS)
+    return str(path)
+
+
+@pytest.fixture
+def make_plugin_dir(tmp_path):
+    """Return a function writing a plugin directory from a mapping of file names to their content."""
+
+    def make(name, files, parent=None):
+        directory = (parent or tmp_path) / name
+        directory.mkdir(parents=True)
+        for file_name, content in files.items():
+            (directory / file_name).write_text(content)
+        return directory
+
+    return make
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+import zipfile
+
+import pytest
+
+from src.lib import archive
+from src.lib.cache import tree_digest
+from src.lib.plugins import PluginManager
+
+
+@pytest.fixture
+def plugin_folder(make_plugin_dir, tmp_path):
+    folder = tmp_path / 'plugins'
+    for name, class_name, dependency in (('base', 'Base', ''), ('report', 'Report', 'Base\n')):
+        files = {
+            '__init__.py': f'from .plugin import {class_name}\n\nraise RuntimeError("not run")\n',
+            'VERSION': '1.0.0\n',
+            'DEPENDENCY': dependency,
+            'helpers.py': f'NAME = "{class_name}"\n',
+            'plugin.py': (
+                f'from .helpers import NAME\n\n\nclass {class_name}:\n'
+                '    def __init__(self, logger, hooks, **kwargs):\n'
+                '        self.name = NAME\n'
+            ),
+        }
+        make_plugin_dir(name, files, folder)
+    make_plugin_dir('ignored', {'plugin.py': 'class Ignored:\n    pass\n', 'IGNORE': ''}, folder)
+    yield folder
+    for opened in list(archive.OPEN_ARCHIVES.values()):
+        opened.close()
+    archive.OPEN_ARCHIVES.clear()
+
+
+def test_pack(plugin_folder, tmp_path, mocker):
+    """Test that the plugins of a folder are packed, skipping the ignored ones."""
+    path = str(tmp_path / 'bundle.ppz')
+
+    assert archive.pack(mocker.Mock(), str(plugin_folder), path) == ['base', 'report']
+    with zipfile.ZipFile(path) as packed:
+        assert not [name for name in packed.namelist() if name.startswith('ignored/')]
+    assert sorted(archive.open_archive(mocker.Mock(), path).plugins) == ['base', 'report']
+
+
+def test_load_archived_plugins(plugin_folder, tmp_path, mocker):
+    """Test that archived plugins are discovered, ordered and registered from the archive."""
+    path = str(tmp_path / 'bundle.ppz')
+    archive.pack(mocker.Mock(), str(plugin_folder), path)
+    manager = PluginManager(logger=mocker.Mock())
+
+    assert manager.discover(path) == {'base': f'{path}/base', 'report': f'{path}/report'}
+    manager.load()
+    manager.register()
+
+    assert manager.get_dependencies() == {'Base': [], 'Report': ['Base']}
+    assert manager.plugins['Report']['module'].__version__ == '1.0.0'
+    assert manager.plugins['Report']['instance'].name == 'Report'
+
+
+def test_archive_in_ignored_directory(plugin_folder, tmp_path, mocker):
+    """Test that archives in a directory with an IGNORE file are not discovered."""
+    folder = tmp_path / 'folder'
+    (folder / 'ignored').mkdir(parents=True)
+    (folder / 'ignored' / 'IGNORE').write_text('')
+    archive.pack(mocker.Mock(), str(plugin_folder), str(folder / 'ignored' / 'bundle.ppz'))
+    archive.pack(mocker.Mock(), str(plugin_folder), str(folder / 'bundle.ppz'))
+    manager = PluginManager(logger=mocker.Mock())
+
+    assert manager.discover(str(folder)) == {
+        'base': str(folder / 'bundle.ppz' / 'base'),
+        'report': str(folder / 'bundle.ppz' / 'report'),
+    }
+
+
+def test_archived_digest(plugin_folder, tmp_path, mocker):
+    """Test that archived plugin directories have the digest of their sources."""
+    path = str(tmp_path / 'bundle.ppz')
+    archive.pack(mocker.Mock(), str(plugin_folder), path)
+    opened = archive.open_archive(mocker.Mock(), path)
+
+    assert tree_digest(opened.directory('base')) == tree_digest(str(plugin_folder / 'base'))
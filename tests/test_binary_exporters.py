@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from src.hooks.transformers.arrow.hook import ArrowExporter
+from src.hooks.transformers.msgpack.hook import MsgpackExporter
+
+
+def test_msgpack_exporter(tmp_path, mocker):
+    """Test that results are streamed as concatenated MessagePack objects."""
+    msgpack = pytest.importorskip('msgpack')
+    path = tmp_path / 'results.msgpack'
+    exporter = MsgpackExporter(mocker.Mock(), path=str(path))
+
+    exporter.trigger_batch([{'value': i} for i in range(3)])
+    exporter.close()
+
+    with open(path, 'rb') as f:
+        assert list(msgpack.Unpacker(f)) == [{'value': 0}, {'value': 1}, {'value': 2}]
+
+
+@pytest.mark.parametrize('format', ['parquet', 'ipc'])
+def test_arrow_exporter(tmp_path, mocker, format):
+    """Test that results are written in record batches."""
+    pyarrow = pytest.importorskip('pyarrow')
+    import pyarrow.ipc
+    import pyarrow.parquet
+
+    path = tmp_path / f'results.{format}'
+    exporter = ArrowExporter(mocker.Mock(), path=str(path), format=format, batch_rows=2)
+
+    exporter.trigger_batch([{'plugin': 'Test', 'value': i} for i in range(3)])
+    assert exporter.records == 3
+    exporter.trigger({'plugin': 'Test', 'value': 3})
+    exporter.trigger({'plugin': 'Test', 'value': 4})
+    assert exporter.records == 5
+    exporter.trigger({'plugin': 'Test', 'value': 5})
+    assert len(exporter.rows) == 1
+    exporter.close()
+
+    if format == 'parquet':
+        table = pyarrow.parquet.read_table(path)
+    else:
+        table = pyarrow.ipc.open_stream(str(path)).read_all()
+    assert table.column('value').to_pylist() == [0, 1, 2, 3, 4, 5]
+
+
+def test_arrow_exporter_without_path(mocker):
+    """Test that results are ignored when no path is configured."""
+    exporter = ArrowExporter(mocker.Mock())
+
+    exporter.trigger({'value': 1})
+    exporter.close()
+
+    assert exporter.rows == []
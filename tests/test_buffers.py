@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+import logging
+
+import pytest
+
+from src.lib.buffers import RemoteBuffers, ResultBuffers, attach
+from src.lib.workers import WorkerPool
+
+
+PLUGINS = '''
+__version__ = '1.0'
+
+
+class Producer:
+    def __init__(self, logger, hooks=None):
+        self.hooks = hooks
+
+    def execute(self):
+        view = self.hooks['buffers'].publish('capture', size=4)
+        view[:] = b'pcap'
+        self.hooks['record'].trigger(view)
+
+    def process_results(self):
+        pass
+
+
+class Consumer(Producer):
+    def execute(self):
+        view = self.hooks['buffers'].open('capture')
+        self.hooks['record'].trigger(bytes(view))
+        self.hooks['buffers'].release('capture')
+'''
+
+
+@pytest.fixture
+def buffers(mocker):
+    buffers = ResultBuffers(mocker.Mock())
+    yield buffers
+    buffers.close()
+
+
+def test_open_shares_memory(buffers):
+    """Test that opened buffers are views of the published memory."""
+    written = buffers.publish('capture', b'abcd')
+    view = buffers.open('capture')
+
+    written[0:1] = b'z'
+
+    assert bytes(view) == b'zbcd'
+    assert view.readonly
+    assert buffers.exists('capture')
+    buffers.release('capture')
+
+
+def test_close_frees_opened_buffers(buffers):
+    """Test that every buffer is freed at the end of the run, even if a reader did not release it."""
+    buffers.publish('capture', b'abcd')
+    segment_name, _size = buffers.acquire('capture')
+    buffers.open('capture')
+
+    buffers.close()
+
+    assert not buffers.exists('capture')
+    assert buffers.segments == {}
+    with pytest.raises(FileNotFoundError):
+        attach(segment_name)
+    buffers.release('capture')
+
+
+def test_release_after_republish(buffers):
+    """Test that a release drops the buffer opened, not the one published since under the same name."""
+    buffers.publish('capture', b'abcd')
+    old = buffers.open('capture')
+    buffers.publish('capture', b'ef')
+
+    assert bytes(old) == b'abcd'
+    buffers.release('capture')
+
+    assert len(buffers.segments) == 1
+    assert bytes(buffers.open('capture')) == b'ef'
+    buffers.release('capture')
+
+
+def test_remote_references_per_segment(buffers):
+    """Test that a worker maps a segment once and drops the references of the segments it opened."""
+    remote = RemoteBuffers(lambda method, *args: getattr(buffers, method)(*args))
+    buffers.publish('capture', b'abcd')
+
+    remote.open('capture')
+    remote.open('capture')
+    (old,) = buffers.segments.values()
+    assert old.refs == 3
+    assert len(remote.mapped) == 1
+
+    remote.publish('capture', b'ef')
+    remote.release('capture')
+    remote.release('capture')
+
+    assert old.refs == 0
+    assert [segment.refs for segment in buffers.segments.values()] == [1]
+    assert bytes(remote.open('capture')) == b'ef'
+    remote.release('capture')
+    remote.close()
+    assert remote.mapped == {}
+
+
+def test_republish_frees_previous(buffers):
+    """Test that publishing a name again frees the unreferenced previous buffer."""
+    buffers.publish('capture', b'abcd')
+    buffers.publish('capture', b'ef')
+
+    assert bytes(buffers.open('capture')) == b'ef'
+    assert len(buffers.segments) == 1
+    buffers.release('capture')
+
+
+def test_isolated_plugins_share_buffers(buffers, tmp_path, mocker):
+    """Test that isolated plugins publish and read buffers in shared memory."""
+    path = tmp_path / 'plugins' / '__init__.py'
+    path.parent.mkdir()
+    path.write_text(PLUGINS)
+    hooks = {'record': mocker.Mock(), 'buffers': buffers}
+    pool = WorkerPool(logging.getLogger('test_buffers'), processes=1)
+    try:
+        pool.run('plugins', str(path), 'Producer', hooks)
+        pool.run('plugins', str(path), 'Consumer', hooks)
+    finally:
+        pool.close()
+
+    (produced,), _kwargs = hooks['record'].trigger.call_args_list[0]
+    (consumed,), _kwargs = hooks['record'].trigger.call_args_list[1]
+    assert isinstance(produced, memoryview)
+    assert bytes(produced) == b'pcap'
+    assert consumed == b'pcap'
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import importlib.util
+import shutil
+import sys
+import types
+import zipfile
+
+import pytest
+
+from src.lib import bytecode
+
+
+@pytest.fixture
+def plugin_dir(make_plugin_dir, tmp_path):
+    yield make_plugin_dir(
+        'compiled',
+        {
+            '__init__.py': 'from .plugin import Compiled\n',
+            'plugin.py': 'class Compiled:\n    def execute(self):\n        return __file__\n',
+        },
+        tmp_path / 'plugins',
+    )
+    bytecode.uninstall()
+
+
+def import_plugin(mocker, directory, name):
+    spec = bytecode.file_spec(name, str(directory / '__init__.py'))
+    module = importlib.util.module_from_spec(spec)
+    mocker.patch.dict(sys.modules, {name: module})
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_import_from_bundle(plugin_dir, tmp_path, mocker):
+    """Test that a package and its submodules are imported from the bundle."""
+    path = str(tmp_path / 'bytecode.zip')
+    assert bytecode.compile_tree(mocker.Mock(), [str(plugin_dir)], path) == 2
+
+    finder = bytecode.install(bytecode.BytecodeBundle(mocker.Mock(), path), [str(plugin_dir.parent)])
+    module = import_plugin(mocker, plugin_dir, 'compiled_plugin')
+
+    assert module.Compiled().execute() == str(plugin_dir / 'plugin.py')
+    assert (finder.bundle.hits, finder.bundle.misses) == (2, 0)
+
+
+def test_bundle_is_relocatable(plugin_dir, tmp_path, mocker):
+    """Test that a bundle built elsewhere is used, with the file names of the sources it is used for."""
+    path = str(tmp_path / 'bytecode.zip')
+    bytecode.compile_tree(mocker.Mock(), [str(plugin_dir)], path)
+    moved = tmp_path / 'deployed' / 'compiled'
+    shutil.copytree(plugin_dir, moved)
+    (moved / 'plugin.py').write_text('class Compiled:\n    def execute(self):\n        return "changed"\n')
+
+    finder = bytecode.install(bytecode.BytecodeBundle(mocker.Mock(), path), [str(moved.parent)])
+    module = import_plugin(mocker, moved, 'moved_plugin')
+
+    assert module.Compiled().execute() == 'changed'
+    assert module.__spec__.loader.get_code('moved_plugin').co_filename == str(moved / '__init__.py')
+    assert (finder.bundle.hits, finder.bundle.misses) == (2, 1)
+
+
+def test_with_filename():
+    """Test that the file name of the functions defined by a module is set too."""
+    code = compile('def function():\n    return 1\n', 'built.py', 'exec')
+
+    code = bytecode.with_filename(code, 'deployed.py')
+
+    (function,) = [const for const in code.co_consts if isinstance(const, types.CodeType)]
+    assert (code.co_filename, function.co_filename) == ('deployed.py', 'deployed.py')
+
+
+def test_bundle_of_another_python(tmp_path, mocker):
+    """Test that bundles built by another python version are rejected."""
+    path = str(tmp_path / 'bytecode.zip')
+    with zipfile.ZipFile(path, 'w') as bundle:
+        bundle.writestr(bytecode.MAGIC_ENTRY, b'\x00\x00\r\n')
+
+    with pytest.raises(ValueError):
+        bytecode.BytecodeBundle(mocker.Mock(), path)
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+import os
+import subprocess
+import sys
+
+from src.lib.cache import ResultCache
+from src.lib.results import ResultStore
+from src.lib.scheduler import DagScheduler
+
+
+DEPENDENCIES = {'Plugin': [], 'Plugin1': ['Plugin']}
+
+
+def make_plugin(tmp_path, name, version='1.0.0'):
+    directory = tmp_path / 'plugins' / name
+    directory.mkdir(parents=True)
+    (directory / 'plugin.py').write_text('class Plugin:\n    pass\n')
+    (directory / 'VERSION').write_text(version)
+    return str(directory)
+
+
+def test_key_depends_on_source_kwargs_and_inputs(tmp_path, mocker):
+    """Test that changing the source, the VERSION, the kwargs or the inputs changes the key."""
+    directory = make_plugin(tmp_path, 'Plugin')
+    cache = ResultCache(mocker.Mock(), str(tmp_path / 'cache'))
+    key = cache.key('Plugin', directory, {'depth': 1}, {'Dep': [1, 2]})
+
+    assert cache.key('Plugin', directory, {'depth': 1}, {'Dep': [1, 2]}) == key
+    assert cache.key('Plugin', directory, {'depth': 2}, {'Dep': [1, 2]}) != key
+    assert cache.key('Plugin', directory, {'depth': 1}, {'Dep': [1, 3]}) != key
+
+    with open(os.path.join(directory, 'VERSION'), 'w') as f:
+        f.write('1.0.10')
+    assert cache.key('Plugin', directory, {'depth': 1}, {'Dep': [1, 2]}) != key
+
+
+def test_key_is_independent_of_the_hash_seed(tmp_path, mocker):
+    """Test that set valued inputs get the same key in every process, and opaque inputs no key."""
+    directory = make_plugin(tmp_path, 'Plugin')
+    script = (
+        'import logging, sys\n'
+        'from src.lib.cache import ResultCache\n'
+        'cache = ResultCache(logging.getLogger(), sys.argv[1])\n'
+        'print(cache.key("Plugin", sys.argv[2], {}, {"Scan": {"ports": {"ssh", "http", "https", "smtp", "dns"}}}))\n'
+    )
+    keys = {
+        subprocess.run(
+            [sys.executable, '-c', script, str(tmp_path / 'cache'), directory],
+            env=dict(os.environ, PYTHONHASHSEED=seed),
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout
+        for seed in ('1', '2', '3')
+    }
+    assert len(keys) == 1
+
+    cache = ResultCache(mocker.Mock(), str(tmp_path / 'cache'))
+    assert cache.key('Plugin', directory, {}, {'Scan': object()}) is None
+
+
+def test_get_set_and_invalidate(tmp_path, mocker):
+    """Test that stored results are found again until their plugin is invalidated."""
+    cache = ResultCache(mocker.Mock(), str(tmp_path / 'cache'))
+    cache.set('Plugin', 'abc', {'packets': 3})
+
+    assert cache.get('Plugin', 'abc') == (True, {'packets': 3})
+    assert cache.get('Plugin', 'def') == (False, None)
+    assert cache.info()['plugins'] == {'Plugin': {'results': 1, 'bytes': mocker.ANY}}
+
+    assert cache.invalidate('Plugin') == 1
+    assert cache.get('Plugin', 'abc') == (False, None)
+
+
+def test_evicts_least_recently_used(tmp_path, mocker):
+    """Test that the cache evicts the results used the longest time ago once full."""
+    cache = ResultCache(mocker.Mock(), str(tmp_path / 'cache'), max_bytes=250)
+    cache.set('Plugin', 'old', b'x' * 100)
+    cache.set('Plugin', 'new', b'y' * 100)
+    os.utime(cache.entry_path('Plugin', 'old'), ns=(1, 1))
+    cache.entries = None
+    cache.set('Plugin1', 'newer', b'z' * 100)
+
+    assert cache.get('Plugin', 'old') == (False, None)
+    assert cache.get('Plugin', 'new')[0]
+    assert cache.get('Plugin1', 'newer')[0]
+
+
+class Plugin:
+    def __init__(self, value):
+        self.value = value
+        self.inputs = None
+        self.runs = 0
+
+    def execute(self):
+        self.runs += 1
+        return self.value + sum(self.inputs.values())
+
+    def process_results(self):
+        pass
+
+
+def test_scheduler_skips_cached_plugins(tmp_path, mocker):
+    """Test that a second run with unchanged plugins serves every result from the cache."""
+    cache = ResultCache(mocker.Mock(), str(tmp_path / 'cache'))
+    sources = {name: (make_plugin(tmp_path, name), {}) for name in DEPENDENCIES}
+    plugins = {'Plugin': Plugin(1), 'Plugin1': Plugin(10)}
+    scheduler = DagScheduler(mocker.Mock(), max_workers=2)
+    tasks = {name: scheduler.task(plugin, name) for name, plugin in plugins.items()}
+
+    for _run in range(2):
+        store = ResultStore(mocker.Mock(), DEPENDENCIES, cache=cache, sources=sources)
+        scheduler.run(tasks, DEPENDENCIES, store=store)
+
+    assert plugins['Plugin'].runs == 1
+    assert plugins['Plugin1'].runs == 1
+    assert (cache.hits, cache.misses) == (2, 2)
+
+    cache.invalidate('Plugin')
+    store = ResultStore(mocker.Mock(), DEPENDENCIES, cache=cache, sources=sources)
+    scheduler.run(tasks, DEPENDENCIES, store=store)
+
+    assert plugins['Plugin'].runs == 2
+    # Same result, so its dependent is still cached
+    assert plugins['Plugin1'].runs == 1
+
+
+class Reporter(Plugin):
+    def __init__(self, value, hooks):
+        super().__init__(value)
+        self.hooks = hooks
+
+    def process_results(self):
+        self.hooks['json'].trigger(self.value, kind='report')
+
+
+def test_cached_plugins_replay_their_hook_triggers(tmp_path, mocker):
+    """Test that the hook triggers of the run which cached a result are replayed when it is used."""
+    cache = ResultCache(mocker.Mock(), str(tmp_path / 'cache'))
+    sources = {name: (make_plugin(tmp_path, name), {}) for name in DEPENDENCIES}
+    json_hook = mocker.Mock()
+    hooks = {'json': json_hook}
+    plugins = {'Plugin': Reporter(1, hooks), 'Plugin1': Reporter(10, hooks)}
+    scheduler = DagScheduler(mocker.Mock(), max_workers=2)
+    tasks = {name: scheduler.task(plugin, name) for name, plugin in plugins.items()}
+
+    for _run in range(2):
+        store = ResultStore(mocker.Mock(), DEPENDENCIES, cache=cache, sources=sources)
+        originals = store.record_hooks(hooks)
+        scheduler.run(tasks, DEPENDENCIES, hooks, store)
+        store.restore_hooks(hooks, originals)
+
+    assert [plugin.runs for plugin in plugins.values()] == [1, 1]
+    assert json_hook.trigger.call_args_list == [mocker.call(1, kind='report'), mocker.call(10, kind='report')] * 2
+    assert hooks == {'json': json_hook}
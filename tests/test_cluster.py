@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+import logging
+import multiprocessing
+
+import pytest
+
+from src.lib.cluster import Coordinator, parse_address, run_worker
+from src.lib.exceptions import PluginExecutionError
+from src.lib.results import ResultStore
+
+
+@pytest.fixture
+def coordinator(tmp_path):
+    logger = logging.getLogger('test_cluster')
+    address = str(tmp_path / 'c.sock')
+    coordinator = Coordinator(
+        logger, address=address, authkey='secret', lease_timeout=5.0, heartbeat=0.1, max_attempts=2
+    )
+    coordinator.start()
+    context = multiprocessing.get_context('fork')
+    workers = [
+        context.Process(target=run_worker, args=(logger, address, b'secret', 5.0), daemon=True) for _ in range(2)
+    ]
+    for worker in workers:
+        worker.start()
+    yield coordinator
+    coordinator.close()
+    for worker in workers:
+        worker.join(5)
+        if worker.is_alive():
+            worker.kill()
+
+
+def tasks(coordinator, module_path, names, marker=None):
+    plugin = {'module_name': 'plugins', 'module_path': module_path, 'kwargs': {'marker': marker}}
+    return {name: coordinator.task(plugin, name) for name in names}
+
+
+def test_parse_address():
+    """Test that TCP addresses are split and anything else is a Unix socket path."""
+    assert parse_address('127.0.0.1:7700') == ('127.0.0.1', 7700)
+    assert parse_address(':7700') == ('0.0.0.0', 7700)
+    assert parse_address('/tmp/coordinator.sock') == '/tmp/coordinator.sock'
+
+
+def test_run_on_workers(coordinator, module_path, mocker):
+    """Test that workers run the leased plugins with the results of their dependencies, replaying hook triggers."""
+    hooks = {'record': mocker.Mock()}
+    dependencies = {'Report': ['Base']}
+    store = ResultStore(mocker.Mock(), dependencies, ['Base', 'Report'])
+
+    coordinator.run(tasks(coordinator, module_path, ['Base', 'Report']), dependencies, hooks, store)
+
+    assert [call.args for call in hooks['record'].trigger.call_args_list] == [('Base',), ('ReportBase',)]
+
+
+def test_lost_lease_is_retried(coordinator, module_path, tmp_path, mocker):
+    """Test that a plugin whose worker is lost is leased again to another worker."""
+    hooks = {'record': mocker.Mock()}
+
+    results = coordinator.run(tasks(coordinator, module_path, ['CrashOnce'], str(tmp_path / 'marker')), {}, hooks)
+
+    assert results == {'CrashOnce': 'CrashOnce'}
+    assert coordinator.attempts['CrashOnce'] == 2
+
+
+def test_lost_leases_fail(coordinator, module_path):
+    """Test that a plugin failing on every attempt fails the run, skipping its dependents."""
+    with pytest.raises(PluginExecutionError):
+        coordinator.run(tasks(coordinator, module_path, ['Crash', 'Report']), {'Report': ['Crash']})
+
+    assert list(coordinator.failed) == ['Crash']
+    assert coordinator.skipped == ['Report']
+
+
+def test_no_worker_fails_the_run(tmp_path, module_path):
+    """Test that the plugins fail when no worker joins before the worker timeout."""
+    logger = logging.getLogger('test_cluster')
+    coordinator = Coordinator(logger, address=str(tmp_path / 'c.sock'), authkey='secret', worker_timeout=0.2)
+    try:
+        with pytest.raises(PluginExecutionError):
+            coordinator.run(tasks(coordinator, module_path, ['Base', 'Report']), {'Report': ['Base']})
+    finally:
+        coordinator.close()
+
+    assert list(coordinator.failed) == ['Base']
+    assert coordinator.skipped == ['Report']
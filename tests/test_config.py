@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 import yaml
 
-from src.lib.config import yaml_parser
+from src.lib.config import load_config, parse_yaml, validate, yaml_parser
 
 
 def test_yaml_parser_valid(mocker):
@@ -132,3 +132,72 @@ def test_yaml_parser_io_error(mocker):
     assert output is None
     mock_open.assert_called_once()
 
+
+
+CONFIGURATION = '''
+app:
+  name: test
+  core:
+    directory: ./core
+  users:
+    directory: ./users
+  hooks:
+    directory: ./hooks
+    options:
+      json:
+        compression:
+  plugins:
+    Args:
+      verbose: true
+'''
+
+
+def test_load_config_defaults(tmp_path):
+    """Test that the configuration is validated and completed with its defaults."""
+    conf = tmp_path / 'configuration.yml'
+    conf.write_text(CONFIGURATION)
+
+    configuration = load_config(str(conf), None)
+
+    assert configuration['app']['logger']['level'] == 'INFO'
+    assert configuration['app']['plugins'] == {'Args': {'verbose': True}}
+
+
+def test_load_config_invalid(tmp_path):
+    """Test that invalid configurations are rejected with every error found."""
+    conf = tmp_path / 'configuration.yml'
+    conf.write_text(CONFIGURATION.replace('directory: ./hooks', 'buffers: yes') + '  lazy: 1\n')
+
+    assert load_config(str(conf), None) is None
+    _data, errors, warnings = validate(yaml.safe_load(conf.read_text()))
+    assert errors == ['configuration.app.lazy: expected bool, got int', 'configuration.app.hooks.directory: required']
+    assert warnings == []
+
+
+def test_load_config_snapshot(tmp_path, mocker):
+    """Test that the compiled snapshot is used until the configuration file changes."""
+    conf = tmp_path / 'configuration.yml'
+    conf.write_text(CONFIGURATION)
+    snapshot = str(tmp_path / 'configuration.marshal')
+    expected = load_config(str(conf), snapshot)
+
+    parse = mocker.patch('src.lib.config.parse_yaml', wraps=parse_yaml)
+    assert load_config(str(conf), snapshot) == expected
+    parse.assert_not_called()
+
+    conf.write_text(CONFIGURATION.replace('name: test', 'name: changed'))
+    assert load_config(str(conf), snapshot)['app']['name'] == 'changed'
+    parse.assert_called_once()
+
+
+def test_snapshot_of_other_schema(tmp_path, mocker):
+    """Test that a snapshot validated against another schema is not used."""
+    conf = tmp_path / 'configuration.yml'
+    conf.write_text(CONFIGURATION)
+    snapshot = str(tmp_path / 'configuration.marshal')
+    load_config(str(conf), snapshot)
+
+    mocker.patch('src.lib.config.SCHEMA_DIGEST', 'other')
+    parse = mocker.patch('src.lib.config.parse_yaml', wraps=parse_yaml)
+    load_config(str(conf), snapshot)
+    parse.assert_called_once()
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+import socket
+import threading
+import time
+
+import pytest
+
+from src.lib import watcher
+from src.lib.daemon import PluginDaemon, request
+
+
+PLUGIN = '''
+__version__ = '1.0'
+
+
+class {name}:
+    def __init__(self, logger, hooks):
+        self.logger = logger
+
+    def execute(self):
+        with open({output!r}, 'a') as f:
+            f.write('{mark}\\n')
+
+    def process_results(self):
+        pass
+'''
+
+
+def write_plugin(root, name, output, mark):
+    plugin_dir = root / name.lower()
+    plugin_dir.mkdir(exist_ok=True)
+    (plugin_dir / 'plugin.py').write_text('')
+    (plugin_dir / '__init__.py').write_text(PLUGIN.format(name=name, output=str(output), mark=mark))
+    return plugin_dir
+
+
+@pytest.fixture
+def tree(tmp_path, mocker):
+    mocker.patch.object(watcher, 'inotify_simple', None)
+    root = tmp_path / 'plugins'
+    root.mkdir()
+    write_plugin(root, 'First', tmp_path / 'first.txt', 'v1')
+    write_plugin(root, 'Second', tmp_path / 'second.txt', 'v1')
+    return tmp_path
+
+
+@pytest.fixture
+def daemon(tree, mocker):
+    daemon = PluginDaemon(mocker.Mock(), {'users': str(tree / 'plugins')}, socket_path=str(tree / 'd.sock'))
+    daemon.start()
+    yield daemon
+    daemon.close()
+
+
+def test_run_keeps_plugins_loaded(daemon, tree):
+    """Test that each run reuses the registered plugin instances."""
+    instance = daemon.managers['users'].registered_plugins['First']
+
+    assert daemon.run()['plugins'] == {'users': ['First', 'Second']}
+    assert daemon.run()['status'] == 'ok'
+
+    assert daemon.managers['users'].registered_plugins['First'] is instance
+    assert (tree / 'first.txt').read_text() == 'v1\nv1\n'
+
+
+def test_refresh_reloads_changed_plugins(daemon, tree):
+    """Test that only the plugins whose files changed are reloaded."""
+    second = daemon.managers['users'].registered_plugins['Second']
+    write_plugin(tree / 'plugins', 'First', tree / 'first.txt', 'v2-changed')
+    write_plugin(tree / 'plugins', 'Third', tree / 'third.txt', 'v1')
+
+    assert daemon.refresh() == ['first', 'third']
+    daemon.run()
+
+    assert daemon.managers['users'].registered_plugins['Second'] is second
+    assert (tree / 'first.txt').read_text() == 'v2-changed\n'
+    assert (tree / 'third.txt').read_text() == 'v1\n'
+
+
+def test_refresh_removes_deleted_plugins(daemon, tree):
+    """Test that deleted plugins are no longer run."""
+    (tree / 'plugins' / 'second' / 'plugin.py').unlink()
+
+    assert daemon.refresh() == ['second']
+    assert daemon.run()['plugins'] == {'users': ['First']}
+
+
+def test_serve_requests(tree, mocker):
+    """Test that requests are served over the Unix socket until the daemon is stopped."""
+    socket_path = str(tree / 'd.sock')
+    daemon = PluginDaemon(mocker.Mock(), {'users': str(tree / 'plugins')}, socket_path=socket_path)
+    thread = threading.Thread(target=daemon.serve_forever)
+    thread.start()
+    while daemon.started is None:
+        time.sleep(0.01)
+
+    assert request(socket_path, 'status', timeout=5)['plugins'] == {'users': ['First', 'Second']}
+    assert request(socket_path, 'run', timeout=5, types=['users'])['status'] == 'ok'
+    assert request(socket_path, 'run', timeout=5, types=['core'])['errors'] == {'core': 'Unknown plugin type'}
+    assert request(socket_path, 'unknown', timeout=5)['status'] == 'error'
+    assert request(socket_path, 'stop', timeout=5)['status'] == 'ok'
+
+    thread.join(5)
+    assert not thread.is_alive()
+    assert (tree / 'first.txt').read_text() == 'v1\n'
+
+
+def test_pipeline_resolves_dependencies_across_types(tree, mocker):
+    """Test that a pipeline daemon runs and reloads plugins depending on plugins of another type."""
+    (tree / 'core').mkdir()
+    write_plugin(tree / 'core', 'Base', tree / 'base.txt', 'v1')
+    (tree / 'plugins' / 'first' / 'DEPENDENCY').write_text('Base')
+    plugins = {'core': str(tree / 'core'), 'users': str(tree / 'plugins')}
+    daemon = PluginDaemon(mocker.Mock(), plugins, socket_path=str(tree / 'd.sock'), pipeline=True)
+    daemon.start()
+    try:
+        assert daemon.run()['plugins'] == {'core+users': ['Base', 'Second', 'First']}
+        write_plugin(tree / 'core', 'Base', tree / 'base.txt', 'v2')
+
+        assert daemon.refresh() == ['base']
+        assert daemon.run()['status'] == 'ok'
+    finally:
+        daemon.close()
+
+    daemon.logger.error.assert_not_called()
+    assert (tree / 'base.txt').read_text() == 'v1\nv2\n'
+
+
+def test_start_refuses_a_socket_in_use(tree, mocker):
+    """Test that a second daemon does not take over the socket of a running one."""
+    socket_path = str(tree / 'd.sock')
+    daemon = PluginDaemon(mocker.Mock(), {'users': str(tree / 'plugins')}, socket_path=socket_path)
+    thread = threading.Thread(target=daemon.serve_forever)
+    thread.start()
+    while daemon.started is None:
+        time.sleep(0.01)
+    other = PluginDaemon(mocker.Mock(), {'users': str(tree / 'plugins')}, socket_path=socket_path)
+    try:
+        with pytest.raises(FileExistsError):
+            other.start()
+
+        assert request(socket_path, 'status', timeout=5)['status'] == 'ok'
+    finally:
+        daemon.stop()
+        thread.join(5)
+
+
+def test_start_replaces_a_stale_socket(tree, mocker):
+    """Test that the socket left over by a daemon that did not stop cleanly is replaced."""
+    socket_path = str(tree / 'd.sock')
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stale:
+        stale.bind(socket_path)
+    daemon = PluginDaemon(mocker.Mock(), {'users': str(tree / 'plugins')}, socket_path=socket_path)
+    thread = threading.Thread(target=daemon.serve_forever)
+    thread.start()
+    while daemon.started is None:
+        time.sleep(0.01)
+    try:
+        assert request(socket_path, 'status', timeout=5)['status'] == 'ok'
+    finally:
+        daemon.stop()
+        thread.join(5)
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import pickle
+import time
+
+from src.lib.dispatch import PENDING_DELIVERIES, BatchedHook, HookDispatcher, deliver
+
+
+class BatchHook:
+    def __init__(self):
+        self.batches = []
+
+    def trigger_batch(self, events):
+        self.batches.append(list(events))
+
+
+class SingleHook:
+    def __init__(self):
+        self.events = []
+
+    def trigger(self, event=None):
+        self.events.append(event)
+
+
+class ArgsHook(BatchHook):
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def trigger(self, *args, **kwargs):
+        self.calls.append((args, kwargs))
+
+
+class FailingHook:
+    async def trigger(self, event=None):
+        raise ValueError(event)
+
+
+def wait_for(condition):
+    deadline = time.monotonic() + 5
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_flush_by_size(mocker):
+    """Test that a full queue is delivered as one batch."""
+    hook = BatchHook()
+    dispatcher = HookDispatcher(mocker.Mock(), batch_size=3, interval=None)
+    batched = BatchedHook(hook, dispatcher, 'export')
+
+    for i in range(7):
+        batched.trigger(i)
+
+    assert hook.batches == [[0, 1, 2], [3, 4, 5]]
+    batched.close()
+    assert hook.batches[-1] == [6]
+
+
+def test_flush_by_interval(mocker):
+    """Test that queued events are delivered after the interval."""
+    hook = BatchHook()
+    dispatcher = HookDispatcher(mocker.Mock(), batch_size=100, interval=0.01)
+    batched = BatchedHook(hook, dispatcher, 'export')
+    dispatcher.start()
+
+    batched.trigger('event')
+    wait_for(lambda: hook.batches)
+    dispatcher.close()
+
+    assert hook.batches == [['event']]
+
+
+def test_fallback_to_trigger(mocker):
+    """Test that hooks without trigger_batch are triggered once per event."""
+    hook = SingleHook()
+    dispatcher = HookDispatcher(mocker.Mock(), batch_size=2, interval=None)
+    batched = BatchedHook(hook, dispatcher, 'export')
+
+    batched.trigger()
+    batched.trigger('event')
+
+    assert hook.events == [None, 'event']
+
+
+def test_pickle_unwraps(mocker):
+    """Test that batched hooks are sent to worker processes unwrapped."""
+    dispatcher = HookDispatcher(mocker.Mock(), interval=None)
+    batched = BatchedHook(SingleHook(), dispatcher, 'export')
+
+    assert isinstance(pickle.loads(pickle.dumps(batched)), SingleHook)
+
+
+def test_trigger_arguments(mocker):
+    """Test that triggers with several or keyword arguments are delivered one by one with their arguments."""
+    hook = ArgsHook()
+    dispatcher = HookDispatcher(mocker.Mock(), batch_size=100, interval=None)
+    batched = BatchedHook(hook, dispatcher, 'export')
+
+    batched.trigger('a')
+    batched.trigger('b', 'c', kind='report')
+    batched.flush()
+    batched.trigger('d')
+    batched.flush()
+
+    assert hook.calls == [(('a',), {}), (('b', 'c'), {'kind': 'report'})]
+    assert hook.batches == [['d']]
+
+
+def test_async_delivery_failure_is_logged(mocker):
+    """Test that a delivery scheduled on a running event loop is kept until done and its failure logged."""
+    logger = mocker.Mock()
+
+    async def main():
+        deliver(FailingHook(), [(('event',), {})], logger)
+        assert len(PENDING_DELIVERIES) == 1
+        await asyncio.gather(*PENDING_DELIVERIES, return_exceptions=True)
+        await asyncio.sleep(0)
+
+    asyncio.run(main())
+
+    assert not PENDING_DELIVERIES
+    logger.error.assert_called_once()
+
+
+def test_interval_deliveries_after_close(mocker):
+    """Test that the events of the next run are delivered after the interval once the dispatcher was closed."""
+    hook = BatchHook()
+    dispatcher = HookDispatcher(mocker.Mock(), batch_size=100, interval=0.01)
+    batched = BatchedHook(hook, dispatcher, 'export')
+    dispatcher.start()
+    batched.trigger('first')
+    batched.close()
+
+    batched.trigger('second')
+    wait_for(lambda: len(hook.batches) == 2)
+    dispatcher.close()
+
+    assert hook.batches == [['first'], ['second']]
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+from src.lib.graph import DependencyGraph
+
+
+def test_levels():
+    """Test that plugins are grouped into execution levels."""
+    graph = DependencyGraph(
+        {'Plugin': [], 'Plugin1': ['Plugin'], 'Plugin2': ['Plugin'], 'Plugin3': ['Plugin1', 'Plugin2']}
+    )
+
+    assert graph.levels == [['Plugin'], ['Plugin1', 'Plugin2'], ['Plugin3']]
+    assert graph.order() == ['Plugin', 'Plugin1', 'Plugin2', 'Plugin3']
+    assert graph.cycle == []
+    assert graph.blocked == []
+
+
+def test_missing_dependencies():
+    """Test that missing dependencies block their dependents."""
+    graph = DependencyGraph(
+        {'Plugin': [], 'Plugin1': ['Plugin', 'Unknown'], 'Plugin2': ['Plugin1']},
+        known=['Plugin', 'Plugin1', 'Plugin2'],
+    )
+
+    assert graph.missing == {'Plugin1': ['Unknown']}
+    assert graph.levels == [['Plugin']]
+    assert graph.blocked == ['Plugin1', 'Plugin2']
+    assert graph.cycle == []
+
+
+def test_cycle():
+    """Test that the exact nodes of a cycle are reported."""
+    graph = DependencyGraph(
+        {
+            'Plugin': [],
+            'Plugin1': ['Plugin', 'Plugin3'],
+            'Plugin2': ['Plugin1'],
+            'Plugin3': ['Plugin2'],
+            'Plugin4': ['Plugin3'],
+        }
+    )
+
+    assert graph.levels == [['Plugin']]
+    assert sorted(graph.cycle) == ['Plugin1', 'Plugin2', 'Plugin3']
+    assert sorted(graph.blocked) == ['Plugin1', 'Plugin2', 'Plugin3', 'Plugin4']
@@ -61,3 +61,13 @@ def test_plugin_handler_directory_not_found(logger, plugin_manager, mocker):
     assert not PluginHandler(logger, 'core_plugins', plugins_dir)
 
     logger.error.assert_called_with("Directory '/path/to/nonexistent/plugins' not found...")
+
+
+def test_plugin_handler_on_failure(logger, mocker):
+    """Test that the failure handling of the configuration reaches the serial run."""
+    manager = mocker.patch('src.lib.handler.prepare_plugins').return_value
+    run_plugins = mocker.patch('src.lib.handler.run_plugins')
+
+    assert PluginHandler(logger, 'core_plugins', '/fake/plugins/directory', on_failure='degrade')
+
+    run_plugins.assert_called_once_with(manager, None, None, None, 'core_plugins', None, None, 'degrade')
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from src.lib.history import RuntimeHistory
+
+
+def test_record_moving_average(tmp_path, mocker):
+    """Test that the estimate of a plugin moves toward its last durations."""
+    history = RuntimeHistory(mocker.Mock(), str(tmp_path / 'history.json'), alpha=0.5)
+
+    assert history.estimate('Plugin') is None
+    assert history.estimate('Plugin', 1.0) == 1.0
+
+    history.record('Plugin', 2.0)
+    history.record('Plugin', 4.0)
+
+    assert history.estimate('Plugin') == 3.0
+
+
+def test_save_and_load(tmp_path, mocker):
+    """Test that the history is written when it changed and read back by the next run."""
+    path = tmp_path / 'cache' / 'history.json'
+    history = RuntimeHistory(mocker.Mock(), str(path))
+
+    assert history.save() is False
+
+    history.record('Plugin', 1.5)
+
+    assert history.save() is True
+    assert RuntimeHistory(mocker.Mock(), str(path)).estimate('Plugin') == 1.5
+
+    path.write_text('not json')
+
+    assert RuntimeHistory(mocker.Mock(), str(path)).entries == {}
+
+
+def test_invalid_alpha(tmp_path, mocker):
+    """Test that the weight of the last run must be between 0 and 1."""
+    with pytest.raises(ValueError):
+        RuntimeHistory(mocker.Mock(), str(tmp_path / 'history.json'), alpha=0)
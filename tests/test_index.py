@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pytest
+
+from src.lib.index import DiscoveryIndex
+
+
+@pytest.fixture
+def tree(tmp_path):
+    for name in ('plugin1', 'plugin2'):
+        plugin_dir = tmp_path / 'plugins' / name
+        plugin_dir.mkdir(parents=True)
+        (plugin_dir / 'plugin.py').write_text('')
+        (plugin_dir / '__init__.py').write_text('')
+    return tmp_path
+
+
+def test_walk_matches_os_walk(tree, mocker):
+    """Test that the cached walk yields the same entries as os.walk."""
+    index = DiscoveryIndex(mocker.Mock(), str(tree / 'index.json'))
+    root = str(tree / 'plugins')
+
+    expected = sorted((path, sorted(dirs), sorted(files)) for path, dirs, files in os.walk(root))
+    walked = sorted((path, sorted(dirs), sorted(files)) for path, dirs, files in index.walk(root))
+
+    assert walked == expected
+
+
+def test_walk_reuses_unchanged_directories(tree, mocker):
+    """Test that a saved index only rescans directories that changed."""
+    index_path = str(tree / 'index.json')
+    root = str(tree / 'plugins')
+    index = DiscoveryIndex(mocker.Mock(), index_path)
+    list(index.walk(root))
+    assert index.save()
+
+    (tree / 'plugins' / 'plugin2' / 'IGNORE').write_text('')
+
+    index = DiscoveryIndex(mocker.Mock(), index_path)
+    mock_scandir = mocker.patch('os.scandir', wraps=os.scandir)
+    walked = {path: files for path, _dirs, files in index.walk(root)}
+
+    mock_scandir.assert_called_once_with(os.path.join(root, 'plugin2'))
+    assert 'IGNORE' in walked[os.path.join(root, 'plugin2')]
+
+
+def test_walk_forgets_removed_directories(tree, mocker):
+    """Test that removed directories are dropped from the index."""
+    index = DiscoveryIndex(mocker.Mock(), str(tree / 'index.json'))
+    root = str(tree / 'plugins')
+    list(index.walk(root))
+
+    plugin_dir = tree / 'plugins' / 'plugin1'
+    for child in plugin_dir.iterdir():
+        child.unlink()
+    plugin_dir.rmdir()
+
+    walked = [path for path, _dirs, _files in index.walk(root)]
+
+    assert os.path.join(root, 'plugin1') not in walked
+    assert os.path.abspath(os.path.join(root, 'plugin1')) not in index.entries
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import gzip
+import json
+
+from src.hooks.transformers.json.hook import JsonExporter
+
+
+def test_trigger_without_event(tmp_path, mocker):
+    """Test that triggering without a result does not create the output file."""
+    path = tmp_path / 'results.jsonl'
+    exporter = JsonExporter(mocker.Mock(), path=str(path))
+
+    exporter.trigger()
+    exporter.close()
+
+    assert not path.exists()
+
+
+def test_stream_results(tmp_path, mocker):
+    """Test that results are streamed as JSON Lines and flushed by threshold."""
+    path = tmp_path / 'results.jsonl'
+    exporter = JsonExporter(mocker.Mock(), path=str(path), flush_records=2)
+
+    exporter.trigger({'plugin': 'Test', 'value': 1})
+    exporter.trigger_batch([{'plugin': 'Test', 'value': 2}, None])
+
+    assert exporter.pending_records == 0
+    assert [json.loads(line) for line in path.read_text().splitlines()] == [
+        {'plugin': 'Test', 'value': 1},
+        {'plugin': 'Test', 'value': 2},
+    ]
+
+    exporter.trigger({'value': 3})
+    exporter.close()
+
+    assert [json.loads(line)['value'] for line in path.read_text().splitlines()] == [1, 2, 3]
+
+
+def test_gzip_compression(tmp_path, mocker):
+    """Test that results can be gzip compressed."""
+    path = tmp_path / 'results.jsonl.gz'
+    exporter = JsonExporter(mocker.Mock(), path=str(path), compression='gzip')
+
+    exporter.trigger_batch([{'value': i} for i in range(10)])
+    exporter.close()
+
+    with gzip.open(path, 'rt') as f:
+        assert [json.loads(line)['value'] for line in f] == list(range(10))
+
+
+def test_unknown_compression(tmp_path, mocker):
+    """Test that an unknown compression disables the export."""
+    path = tmp_path / 'results.jsonl'
+    exporter = JsonExporter(mocker.Mock(), path=str(path), compression='lz4')
+
+    exporter.trigger({'value': 1})
+
+    assert exporter.path is None
+    assert not path.exists()
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+import logging
+import pickle
+import sys
+
+import pytest
+
+from src.lib import hooks
+from src.lib.hooks import HookManager
+from src.lib.lazy import LazyInstance, LazyModule
+from src.lib.plugins import PluginManager
+
+
+@pytest.fixture
+def plugin_dir(make_plugin_dir):
+    return make_plugin_dir(
+        'lazy_plugin',
+        {
+            'VERSION': '2.0.0\n',
+            'plugin.py': (
+                'class LazyPlugin:\n'
+                '    def __init__(self, logger, hooks=None, **kwargs):\n'
+                '        self.logger = logger\n'
+                '        self.hooks = hooks\n'
+                '\n'
+                '    def execute(self):\n'
+                '        return "executed"\n'
+            ),
+            '__init__.py': (
+                'import os, sys\n'
+                'sys.path.insert(0, os.path.dirname(__file__))\n'
+                'from plugin import LazyPlugin\n'
+                '__version__ = "2.0.0"\n'
+            ),
+        },
+    )
+
+
+def test_lazy_instance_imports_on_first_use(plugin_dir, mocker):
+    """Test that the module is only imported when the instance is used."""
+    module = LazyModule(mocker.Mock(), 'lazy_plugin', str(plugin_dir / '__init__.py'), '2.0.0')
+    instance = LazyInstance(module, 'LazyPlugin', mocker.Mock())
+
+    assert not module.loaded
+    assert not instance.loaded
+
+    assert instance.execute() == 'executed'
+    assert module.loaded
+    assert instance.loaded
+
+
+def test_register_lazy(plugin_dir, mocker):
+    """Test that lazy registration does not import plugin modules."""
+    manager = PluginManager(mocker.Mock(), lazy=True)
+    manager.discovered_plugins = {'lazy_plugin': str(plugin_dir)}
+
+    manager.load()
+    registered = manager.register()
+
+    assert list(registered) == ['LazyPlugin']
+    assert manager.loaded_plugins['lazy_plugin'].__version__ == '2.0.0'
+    assert not manager.loaded_plugins['lazy_plugin'].loaded
+    assert isinstance(registered['LazyPlugin'], LazyInstance)
+
+
+def test_lazy_instance_pickle(plugin_dir, mocker):
+    """Test that proxies can be sent to worker processes before being loaded."""
+    module = LazyModule(logging.getLogger(__name__), 'lazy_plugin', str(plugin_dir / '__init__.py'), '2.0.0')
+    instance = pickle.loads(pickle.dumps(LazyInstance(module, 'LazyPlugin', None)))
+
+    assert not instance.loaded
+    assert instance.execute() == 'executed'
+
+
+@pytest.mark.parametrize('lazy', [False, True])
+def test_register_imported_classes(tmp_path, mocker, lazy):
+    """Test that plugins register the classes their __init__ imports, not their helpers, imported lazily or not."""
+    directory = tmp_path / 'exporting_plugin'
+    directory.mkdir()
+    (directory / 'VERSION').write_text('1.0.0\n')
+    (directory / 'plugin.py').write_text(
+        'class Helper:\n'
+        '    pass\n'
+        '\n\n'
+        'class Exported:\n'
+        '    def __init__(self, logger, hooks=None):\n'
+        '        self.helper = Helper()\n'
+    )
+    (directory / '__init__.py').write_text('from exporting_plugin.plugin import Exported\n\n__version__ = "1.0.0"\n')
+    mocker.patch.object(sys, 'path', [str(tmp_path)] + sys.path)
+    mocker.patch.dict(sys.modules)
+    manager = PluginManager(mocker.Mock(), lazy=lazy)
+    manager.discover(str(tmp_path))
+    manager.load()
+
+    assert list(manager.register()) == ['Exported']
+
+
+@pytest.mark.parametrize('lazy', [False, True])
+def test_register_hook_last_defined_class(tmp_path, mocker, lazy):
+    """Test that hooks register the last class of their files in source order, imported lazily or not."""
+    directory = tmp_path / 'ordered_hook'
+    directory.mkdir()
+    (directory / 'VERSION').write_text('1.0.0\n')
+    (directory / 'hook.py').write_text(
+        'class Zeta:\n'
+        '    def __init__(self, logger, **kwargs):\n'
+        '        pass\n'
+        '\n\n'
+        'class Alpha(Zeta):\n'
+        '    pass\n'
+    )
+    (directory / '__init__.py').write_text(
+        'import os, sys\n'
+        'sys.path.insert(0, os.path.dirname(__file__))\n'
+        'from hook import Zeta, Alpha\n'
+        '__version__ = "1.0.0"\n'
+    )
+    manager = HookManager(mocker.Mock(), lazy=lazy)
+    manager.discover(str(tmp_path))
+    get_manifest = mocker.spy(hooks, 'get_manifest')
+
+    hook = manager.register()['ordered_hook']
+
+    assert type(hook.resolve() if lazy else hook).__name__ == 'Alpha'
+    get_manifest.assert_called_once()
@@ -1,8 +1,13 @@
 # -*- coding: utf-8 -*-
+import io
+import json
 import logging
+import logging.handlers
+import queue
+
 from logging import FileHandler, StreamHandler
 
-from src.lib.logger import setup_logger
+from src.lib.logger import BatchQueueListener, RateLimitFilter, setup_logger, stop_logging
 
 
 def test_setup_logger(mocker):
@@ -21,3 +26,52 @@ def test_setup_logger(mocker):
     assert any(isinstance(handler, FileHandler) for handler in logger.handlers)
     assert any(isinstance(handler, StreamHandler) for handler in logger.handlers)
 
+
+def test_queued_logger(tmp_path, monkeypatch):
+    """Test that queued records are written as JSON lines by the background thread, rate limited."""
+    monkeypatch.chdir(tmp_path)
+    logger = setup_logger(queued=True, json_file=True, rate_limit=2)
+    try:
+        for i in range(5):
+            logger.info('record %d', i)
+    finally:
+        stop_logging()
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+        for rate_filter in list(logger.filters):
+            logger.removeFilter(rate_filter)
+
+    lines = (tmp_path / 'plugin_manager.log').read_text().splitlines()
+    assert [json.loads(line)['message'] for line in lines] == ['record 0', 'record 1']
+
+
+def test_rate_limit_reports_suppressed(mocker):
+    """Test that the next record let through reports the number of records dropped."""
+    rate_filter = RateLimitFilter(1, period=10)
+    records = [logging.LogRecord('test', logging.INFO, 'plugin.py', 3, 'spam %d', (i,), None) for i in range(3)]
+    assert [rate_filter.filter(record) for record in records] == [True, False, False]
+
+    mocker.patch('time.monotonic', return_value=rate_filter.windows[('plugin.py', 3)][0] + 10)
+    record = logging.LogRecord('test', logging.INFO, 'plugin.py', 3, 'spam %d', (3,), None)
+    assert rate_filter.filter(record)
+    assert record.getMessage() == 'spam 3 (2 similar messages suppressed)'
+
+
+def test_batch_listener_rotates(tmp_path):
+    """Test that rotating handlers roll over while plain stream handlers get each batch in one write."""
+    log_queue = queue.SimpleQueue()
+    rotating = logging.handlers.RotatingFileHandler(str(tmp_path / 'rotating.log'), maxBytes=100, backupCount=5)
+    stream = io.StringIO()
+    listener = BatchQueueListener(log_queue, rotating, StreamHandler(stream), batch_size=10)
+    listener.start()
+    try:
+        for i in range(20):
+            log_queue.put(logging.makeLogRecord({'msg': 'record %02d', 'args': (i,), 'levelno': logging.INFO}))
+    finally:
+        listener.stop()
+        rotating.close()
+
+    assert listener.thread is None
+    assert len(stream.getvalue().splitlines()) == 20
+    assert len(list(tmp_path.glob('rotating.log*'))) > 1
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from src.lib.exceptions import PluginManifestError
+from src.lib.manifest import ManifestCache, plan_manifests, read_manifest
+
+
+@pytest.fixture
+def plugin_dir(make_plugin_dir):
+    return make_plugin_dir(
+        'plugin1',
+        {
+            'VERSION': '1.2.0\n',
+            'DEPENDENCY': 'Base\n\n',
+            'plugin.py': 'class Report:\n' '    def process_results(self):\n' '        self.hooks["json"].trigger()\n',
+            '__init__.py': 'from .plugin import Report\n\nraise RuntimeError("imported")\n',
+        },
+    )
+
+
+def test_compiled_manifest(plugin_dir):
+    """Test that a manifest is compiled from the plugin files without importing them."""
+    assert read_manifest(str(plugin_dir)) == {
+        'version': '1.2.0',
+        'classes': ['Report'],
+        'dependencies': ['Base'],
+        'hooks': ['json'],
+    }
+
+
+def test_compiled_manifest_imported_classes(plugin_dir):
+    """Test that the classes of a manifest are the ones the plugin __init__ imports."""
+    (plugin_dir / 'plugin.py').write_text('class Helper:\n    pass\n\n\nclass Report:\n    pass\n')
+    assert read_manifest(str(plugin_dir))['classes'] == ['Report']
+
+    (plugin_dir / '__init__.py').write_text('from .plugin import *\n')
+    assert read_manifest(str(plugin_dir))['classes'] == ['Helper', 'Report']
+
+
+def test_declared_manifest(plugin_dir):
+    """Test that the keys of manifest.yml take precedence and are validated."""
+    (plugin_dir / 'manifest.yml').write_text('version: 2.0\nclasses: Report\ndependencies: []\n')
+
+    manifest = read_manifest(str(plugin_dir))
+
+    assert manifest['version'] == '2.0'
+    assert manifest['dependencies'] == []
+    assert manifest['hooks'] == ['json']
+
+    (plugin_dir / 'manifest.yml').write_text('entry: Report\n')
+    with pytest.raises(PluginManifestError):
+        read_manifest(str(plugin_dir))
+
+
+def test_manifest_priority(plugin_dir):
+    """Test that a manifest may declare an integer priority, which is never compiled."""
+    assert 'priority' not in read_manifest(str(plugin_dir))
+
+    (plugin_dir / 'manifest.yml').write_text('priority: 5\n')
+    assert read_manifest(str(plugin_dir))['priority'] == 5
+
+    (plugin_dir / 'manifest.yml').write_text('priority: high\n')
+    with pytest.raises(PluginManifestError):
+        read_manifest(str(plugin_dir))
+
+
+def test_cache_compiles_changed_manifests(plugin_dir, tmp_path, mocker):
+    """Test that cached manifests are reused until a file they are read from changes."""
+    path = str(tmp_path / 'manifests.json')
+    cache = ManifestCache(mocker.Mock(), path)
+    cache.get(str(plugin_dir))
+    assert cache.save()
+
+    cache = ManifestCache(mocker.Mock(), path)
+    read = mocker.patch('src.lib.manifest.read_manifest', return_value={})
+    assert cache.get(str(plugin_dir))['version'] == '1.2.0'
+    read.assert_not_called()
+
+    (plugin_dir / 'VERSION').write_text('1.3.0\n')
+    cache.get(str(plugin_dir))
+    read.assert_called_once()
+
+
+def test_plan_manifests():
+    """Test that plans report missing dependencies and unknown hooks."""
+    manifests = {
+        'base': {'classes': ['Base'], 'dependencies': [], 'hooks': []},
+        'plugin1': {'classes': ['Report'], 'dependencies': ['Base'], 'hooks': ['json', 'buffers']},
+        'plugin2': {'classes': ['Orphan'], 'dependencies': ['Missing'], 'hooks': ['xml']},
+    }
+
+    levels, problems = plan_manifests(manifests, ['json'])
+
+    assert levels == [['Base'], ['Report']]
+    assert problems == ["plugin2: uses unknown hooks ['xml']", "Orphan: missing dependencies ['Missing']"]
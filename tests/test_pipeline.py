@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from src.lib.handler import prepare_pipeline, run_plugins
+from src.lib.scheduler import DagScheduler
+
+
+def write_plugin(directory, class_name, dependencies=()):
+    directory.mkdir(parents=True)
+    (directory / 'plugin.py').write_text('')
+    (directory / 'DEPENDENCY').write_text('\n'.join(dependencies))
+    (directory / '__init__.py').write_text(
+        '__version__ = "1.0"\n\n\n'
+        f'class {class_name}:\n'
+        '    def __init__(self, logger, hooks=None, **kwargs):\n'
+        '        self.inputs = {}\n\n'
+        '    def execute(self):\n'
+        '        self.seen = dict(self.inputs)\n'
+        f'        return "{directory.parent.name}." + "+".join(sorted(self.inputs.values()))\n\n'
+        '    def process_results(self):\n'
+        '        pass\n'
+    )
+
+
+@pytest.fixture
+def plugin_dirs(tmp_path):
+    write_plugin(tmp_path / 'core' / 'base', 'Base')
+    write_plugin(tmp_path / 'core' / 'slow', 'Slow', ['Base'])
+    write_plugin(tmp_path / 'users' / 'report', 'Report', ['Base'])
+    write_plugin(tmp_path / 'users' / 'duplicate', 'Slow')
+    return {'core': str(tmp_path / 'core'), 'users': str(tmp_path / 'users')}
+
+
+def test_prepare_pipeline(plugin_dirs, mocker):
+    """Test that plugins of every type are sorted together, the first type winning name conflicts."""
+    pipeline = prepare_pipeline(mocker.Mock(), plugin_dirs)
+
+    assert pipeline.name == 'core+users'
+    assert pipeline.graph.levels == [['Base'], ['Slow', 'Report']]
+    assert pipeline.types == {'Base': 'core', 'Slow': 'core', 'Report': 'users'}
+    pipeline.logger.error.assert_called_once()
+
+
+def test_run_pipeline(plugin_dirs, mocker):
+    """Test that plugins get the results of their dependencies of other types."""
+    pipeline = prepare_pipeline(mocker.Mock(), plugin_dirs)
+
+    run_plugins(pipeline, DagScheduler(mocker.Mock(), max_workers=2), plugin_type=pipeline.name)
+
+    assert pipeline.registered_plugins['Report'].seen == {'Base': 'core.'}
+    assert pipeline.registered_plugins['Slow'].seen == {'Base': 'core.'}
@@ -178,3 +178,27 @@ def test_topological_sort(plugin_manager):
     assert 'Plugin1' in sorted_plugins
     assert 'Plugin' in sorted_plugins
     assert sorted_plugins.index('Plugin') < sorted_plugins.index('Plugin1')
+
+
+def test_register_plugin_options(tmp_path, mocker):
+    """Test that each plugin is registered with its own options along with the common ones."""
+    directory = tmp_path / 'configured'
+    directory.mkdir()
+    (directory / 'plugin.py').write_text('')
+    (directory / '__init__.py').write_text(
+        '__version__ = "1.0"\n\n\n'
+        'class Configured:\n'
+        '    def __init__(self, logger, hooks=None, **kwargs):\n'
+        '        self.kwargs = kwargs\n\n\n'
+        'class Other(Configured):\n'
+        '    pass\n'
+    )
+    manager = PluginManager(mocker.Mock(), options={'Configured': {'verbose': True}})
+    manager.discover(str(tmp_path))
+    manager.load()
+
+    manager.register(mode='fast')
+
+    assert manager.plugins['Configured']['instance'].kwargs == {'mode': 'fast', 'verbose': True}
+    assert manager.plugins['Configured']['kwargs'] == {'mode': 'fast', 'verbose': True}
+    assert manager.plugins['Other']['instance'].kwargs == {'mode': 'fast'}
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+import json
+import tracemalloc
+
+import pytest
+
+from src.lib.profiler import ProfiledHook, Profiler, measure
+
+
+def test_measure_records_phase():
+    """Test that a measured block is recorded and reported."""
+    profiler = Profiler()
+    with measure(profiler, 'phase', 'discover'):
+        sum(range(1000))
+    with measure(profiler, 'phase', 'discover'):
+        pass
+
+    report = profiler.report()
+
+    assert report['phase']['discover']['calls'] == 2
+    assert report['phase']['discover']['wall'] > 0
+    assert report['phase']['discover']['alloc'] is None
+
+
+def test_measure_without_profiler():
+    """Test that measuring without a profiler does nothing."""
+    with measure(None, 'phase', 'discover'):
+        pass
+
+
+def test_measure_records_errors():
+    """Test that failing blocks are recorded with their error."""
+    profiler = Profiler()
+    with pytest.raises(ValueError):
+        with measure(profiler, 'plugin', 'Plugin.execute'):
+            raise ValueError('boom')
+
+    assert profiler.report()['plugin']['Plugin.execute']['errors'] == 1
+
+
+def test_profiled_hook(mocker):
+    """Test that hook triggers are recorded."""
+    profiler = Profiler()
+    hook = mocker.Mock()
+    hook.trigger.return_value = 'done'
+
+    assert ProfiledHook(hook, profiler, 'json').trigger('event') == 'done'
+    hook.trigger.assert_called_once_with('event')
+    assert profiler.report()['hook']['json']['calls'] == 1
+
+
+def test_profiled_hook_batch(mocker):
+    """Test that a batch is delivered to a hook without trigger_batch one event at a time."""
+    profiler = Profiler()
+    hook = mocker.Mock(spec=['trigger'])
+
+    ProfiledHook(hook, profiler, 'json').trigger_batch([None, 'event'])
+
+    assert hook.trigger.call_args_list == [mocker.call(), mocker.call('event')]
+    assert profiler.report()['hook']['json']['calls'] == 1
+
+
+def test_dump_chrome_trace(tmp_path):
+    """Test that records are written as Chrome trace events."""
+    profiler = Profiler(trace_memory=True)
+    try:
+        with measure(profiler, 'plugin', 'Plugin.execute'):
+            [0] * 1000
+
+        path = tmp_path / 'trace.json'
+        profiler.dump_chrome_trace(str(path))
+    finally:
+        profiler.close()
+    events = json.loads(path.read_text())['traceEvents']
+
+    assert events[0]['name'] == 'Plugin.execute'
+    assert events[0]['ph'] == 'X'
+    assert events[0]['args']['alloc'] is not None
+
+
+def test_close_stops_its_own_tracing():
+    """Test that a profiler only stops the memory tracing it started."""
+    profiler = Profiler(trace_memory=True)
+    assert tracemalloc.is_tracing()
+    profiler.close()
+    assert not tracemalloc.is_tracing()
+
+    tracemalloc.start()
+    try:
+        Profiler(trace_memory=True).close()
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from src.lib.exceptions import PluginExecutionError
+from src.lib.results import ResultStore
+from src.lib.scheduler import DagScheduler, run_plugin
+
+
+DEPENDENCIES = {'Plugin': [], 'Plugin1': ['Plugin'], 'Plugin2': ['Plugin'], 'Plugin3': ['Plugin1']}
+
+
+def test_inputs_and_free(mocker):
+    """Test that results are passed to dependents and freed once every dependent consumed them."""
+    store = ResultStore(mocker.Mock(), DEPENDENCIES)
+
+    store.put('Plugin', {'packets': 3})
+    store.consume('Plugin')
+    assert store.inputs('Plugin1') == {'Plugin': {'packets': 3}}
+
+    store.put('Plugin1', 'summary')
+    store.consume('Plugin1')
+    assert len(store) == 2
+
+    store.consume('Plugin2')
+    assert len(store) == 1
+    assert store.inputs('Plugin3') == {'Plugin1': 'summary'}
+    assert store.peak == 2
+
+
+def test_results_without_consumers_are_not_stored(mocker):
+    """Test that results nobody depends on are dropped right away."""
+    store = ResultStore(mocker.Mock(), DEPENDENCIES)
+
+    store.put('Plugin3', 'report')
+
+    assert len(store) == 0
+
+
+def test_get_checks_type(mocker):
+    """Test that typed reads reject results of another type."""
+    store = ResultStore(mocker.Mock(), DEPENDENCIES)
+    store.put('Plugin', {'packets': 3})
+
+    assert store.get('Plugin', dict) == {'packets': 3}
+    with pytest.raises(TypeError):
+        store.get('Plugin', list)
+
+
+class Plugin:
+    result_type = int
+
+    def __init__(self, value):
+        self.value = value
+        self.inputs = None
+        self.seen = None
+
+    def execute(self):
+        self.seen = self.inputs
+        return self.value + sum(self.inputs.values())
+
+    def process_results(self):
+        pass
+
+
+def test_run_plugin_checks_result_type():
+    """Test that a result not matching the declared result type fails the plugin."""
+    plugin = Plugin(1)
+    plugin.result_type = str
+
+    with pytest.raises(PluginExecutionError):
+        run_plugin(plugin, 'Plugin', inputs={})
+
+
+def test_scheduler_passes_inputs(mocker):
+    """Test that the scheduler hands each plugin the results of its dependencies."""
+    plugins = {name: Plugin(position) for position, name in enumerate(DEPENDENCIES, start=1)}
+    store = ResultStore(mocker.Mock(), DEPENDENCIES)
+    scheduler = DagScheduler(mocker.Mock(), max_workers=2)
+    tasks = {name: scheduler.task(plugin, name) for name, plugin in plugins.items()}
+
+    scheduler.run(tasks, DEPENDENCIES, store=store)
+
+    assert plugins['Plugin1'].seen == {'Plugin': 1}
+    assert plugins['Plugin3'].seen == {'Plugin1': 3}
+    assert plugins['Plugin3'].inputs == {}
+    assert len(store) == 0
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.lib.exceptions import PluginExecutionError
+from src.lib.history import RuntimeHistory
+from src.lib.scheduler import AsyncDagScheduler, DagScheduler, run_plugin_async
+
+
+def test_run_respects_dependencies(mocker):
+    """Test that a plugin only starts once its dependencies have completed."""
+    finished = []
+    lock = threading.Lock()
+
+    def task(name, deps):
+        with lock:
+            assert all(dep in finished for dep in deps)
+        with lock:
+            finished.append(name)
+        return name
+
+    dependencies = {'Plugin': [], 'Plugin1': ['Plugin'], 'Plugin2': ['Plugin'], 'Plugin3': ['Plugin1', 'Plugin2']}
+    tasks = {name: (task, (name, deps)) for name, deps in dependencies.items()}
+
+    scheduler = DagScheduler(mocker.Mock(), max_workers=4)
+    results = scheduler.run(tasks, dependencies)
+
+    assert results == {name: name for name in dependencies}
+    assert finished[0] == 'Plugin'
+    assert finished[-1] == 'Plugin3'
+
+
+def test_run_overlaps_independent_plugins(mocker):
+    """Test that plugins without a dependency path between them run concurrently."""
+    barrier = threading.Barrier(2, timeout=5)
+    tasks = {'Plugin': (barrier.wait, ()), 'Plugin1': (barrier.wait, ())}
+
+    scheduler = DagScheduler(mocker.Mock(), max_workers=2)
+    scheduler.run(tasks, {})
+
+    assert set(scheduler.results) == {'Plugin', 'Plugin1'}
+
+
+def test_run_skips_dependents_of_failed_plugin(mocker):
+    """Test that dependents of a failed plugin are skipped."""
+
+    def fail():
+        raise RuntimeError('boom')
+
+    tasks = {'Plugin': (fail, ()), 'Plugin1': (str, ()), 'Plugin2': (str, ()), 'Plugin3': (str, ())}
+    dependencies = {'Plugin1': ['Plugin'], 'Plugin2': ['Plugin1']}
+
+    scheduler = DagScheduler(mocker.Mock(), max_workers=2)
+    with pytest.raises(PluginExecutionError):
+        scheduler.run(tasks, dependencies)
+
+    assert list(scheduler.failed) == ['Plugin']
+    assert sorted(scheduler.skipped) == ['Plugin1', 'Plugin2']
+    assert 'Plugin3' in scheduler.results
+
+
+def test_run_degrades_dependents_of_failed_plugin(mocker):
+    """Test that dependents of a failed plugin run without its result when degraded."""
+
+    def fail():
+        raise RuntimeError('boom')
+
+    tasks = {'Plugin': (fail, ()), 'Plugin1': (str, ()), 'Plugin2': (str, ()), 'Plugin3': (str, ())}
+    dependencies = {'Plugin1': ['Plugin'], 'Plugin2': ['Plugin1']}
+
+    scheduler = DagScheduler(mocker.Mock(), max_workers=2, on_failure='degrade')
+    with pytest.raises(PluginExecutionError, match='degraded: Plugin1, Plugin2'):
+        scheduler.run(tasks, dependencies)
+
+    assert list(scheduler.failed) == ['Plugin']
+    assert scheduler.skipped == []
+    assert set(scheduler.results) == {'Plugin1', 'Plugin2', 'Plugin3'}
+
+
+def test_unknown_executor(mocker):
+    """Test that an unknown executor type is rejected."""
+    with pytest.raises(ValueError):
+        DagScheduler(mocker.Mock(), executor='fiber')
+
+
+class AsyncPlugin:
+    def __init__(self, hooks=None):
+        self.hooks = hooks
+        self.steps = []
+
+    async def execute(self):
+        await asyncio.sleep(0.01)
+        self.steps.append('execute')
+
+    async def process_results(self):
+        self.steps.append(await self.hooks['export'].trigger())
+
+
+class SyncPlugin(AsyncPlugin):
+    def execute(self):
+        self.steps.append('execute')
+
+    def process_results(self):
+        self.steps.append(self.hooks['export'].trigger())
+
+
+class AsyncExporter:
+    async def trigger(self):
+        await asyncio.sleep(0)
+        return 'exported'
+
+
+class TriggeringPlugin:
+    def __init__(self, hooks=None):
+        self.hooks = hooks
+
+    def execute(self):
+        self.hooks['export'].trigger('result')
+
+    def process_results(self):
+        pass
+
+
+class LockedExporter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = []
+
+    def trigger(self, event):
+        with self.lock:
+            self.events.append(event)
+
+
+def test_process_executor_replays_hook_triggers(mocker):
+    """Test that hook triggers of plugins run in worker processes reach the hooks of the parent."""
+    hooks = {'export': LockedExporter()}
+    scheduler = DagScheduler(mocker.Mock(), executor='process', max_workers=2)
+    tasks = {name: scheduler.task(TriggeringPlugin(hooks), name) for name in ('Plugin', 'Plugin1')}
+
+    scheduler.run(tasks, {'Plugin1': ['Plugin']}, hooks)
+
+    assert hooks['export'].events == ['result', 'result']
+    assert isinstance(hooks['export'], LockedExporter)
+
+
+def test_async_scheduler_runs_sync_and_async_plugins(mocker):
+    """Test that async and sync plugins both run and can trigger async hooks."""
+    hooks = {'export': AsyncExporter()}
+    plugins = {'Async': AsyncPlugin(hooks), 'Sync': SyncPlugin(hooks)}
+
+    scheduler = AsyncDagScheduler(mocker.Mock(), max_workers=2, max_concurrency=10)
+    tasks = {name: scheduler.task(plugin) for name, plugin in plugins.items()}
+    scheduler.run(tasks, {'Sync': ['Async']}, hooks)
+
+    assert plugins['Async'].steps == ['execute', 'exported']
+    assert plugins['Sync'].steps == ['execute', 'exported']
+    assert isinstance(hooks['export'], AsyncExporter)
+
+
+def test_async_scheduler_bounds_concurrency(mocker):
+    """Test that no more than max_concurrency plugins are in flight."""
+    in_flight = []
+    peak = []
+
+    async def task():
+        in_flight.append(1)
+        peak.append(len(in_flight))
+        await asyncio.sleep(0.01)
+        in_flight.pop()
+
+    tasks = {f'Plugin{i}': (task, ()) for i in range(20)}
+    scheduler = AsyncDagScheduler(mocker.Mock(), max_concurrency=5)
+    scheduler.run(tasks, {})
+
+    assert len(scheduler.results) == 20
+    assert max(peak) == 5
+
+
+def test_run_starts_critical_path_first(mocker):
+    """Test that the plugin with the longest path to the end of the run starts first when they cannot all run."""
+    started = []
+    tasks = {name: (started.append, (name,)) for name in ('Short', 'Long', 'Tail')}
+
+    scheduler = DagScheduler(mocker.Mock(), max_workers=1)
+    scheduler.run(tasks, {'Tail': ['Long']})
+
+    assert started == ['Long', 'Short', 'Tail']
+
+
+def test_run_orders_by_history_and_priorities(tmp_path, mocker):
+    """Test that estimated durations come from the history, and priority hints go first along with their dependencies."""
+    history = RuntimeHistory(mocker.Mock(), str(tmp_path / 'history.json'))
+    for name, duration in (('Short', 10.0), ('Long', 1.0), ('Tail', 1.0)):
+        history.record(name, duration)
+    started = []
+    tasks = {name: (started.append, (name,)) for name in ('Short', 'Long', 'Tail')}
+
+    scheduler = DagScheduler(mocker.Mock(), max_workers=1, history=history)
+    scheduler.run(tasks, {'Tail': ['Long']})
+    assert started == ['Short', 'Long', 'Tail']
+    assert history.estimate('Short') < 10.0
+
+    started.clear()
+    scheduler.run(tasks, {'Tail': ['Long']}, priorities={'Tail': 1})
+    assert started == ['Long', 'Tail', 'Short']
+
+
+def test_history_is_keyed_by_plugin_type(tmp_path, mocker):
+    """Test that plugins of different types with the same name have their own estimate."""
+    history = RuntimeHistory(mocker.Mock(), str(tmp_path / 'history.json'))
+    for key, duration in (('users:Short', 10.0), ('core:Short', 0.1), ('core:Long', 1.0)):
+        history.record(key, duration)
+    started = []
+    tasks = {name: (started.append, (name,)) for name in ('Short', 'Long')}
+    scheduler = DagScheduler(mocker.Mock(), max_workers=1, history=history)
+
+    scheduler.run(tasks, {}, types={'Short': 'core', 'Long': 'core'})
+    assert started == ['Long', 'Short']
+
+    started.clear()
+    scheduler.run(tasks, {}, types={'Short': 'users', 'Long': 'core'})
+    assert started == ['Short', 'Long']
+    assert sorted(history.entries) == ['core:Long', 'core:Short', 'users:Short']
+
+
+def test_async_scheduler_shuts_down_its_thread_pool(mocker):
+    """Test that the thread pool running sync plugin steps is shut down after a run on a running loop."""
+    shutdown = mocker.spy(ThreadPoolExecutor, 'shutdown')
+    tasks = {'Plugin': (run_plugin_async, (mocker.Mock(result_type=None), 'Plugin'))}
+
+    async def main():
+        await AsyncDagScheduler(mocker.Mock(), max_workers=1).run_async(tasks, {})
+        # Before the event loop shuts down its default executor
+        shutdown.assert_called_once()
+        # The default executor of the loop is not the one shut down
+        assert await asyncio.get_running_loop().run_in_executor(None, int, '1') == 1
+
+    asyncio.run(main())
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+import datetime
+
+import pytest
+
+from src.lib import serializers
+from src.lib.serializers import get_serializer
+
+
+def test_json_fallback_to_stdlib(mocker):
+    """Test that the standard library is used when no fast encoder is installed."""
+    mocker.patch.object(serializers, 'orjson', None)
+    mocker.patch.object(serializers, 'msgspec', None)
+
+    serializer = get_serializer('json')
+
+    assert serializer.name == 'json'
+    assert serializer.loads(serializer.dumps({'key': [1, 2]})) == {'key': [1, 2]}
+
+
+@pytest.mark.parametrize('backend', list(serializers.json_backends()))
+def test_json_backends_roundtrip(backend):
+    """Test that every installed JSON backend encodes the same data."""
+    serializer = get_serializer('json', backend)
+    when = datetime.date(2024, 1, 1)
+
+    assert serializer.loads(serializer.dumps({'plugin': 'Test', 'when': when})) == {
+        'plugin': 'Test',
+        'when': str(when),
+    }
+
+
+def test_unavailable_backend(mocker):
+    """Test that requesting a missing backend raises ImportError."""
+    mocker.patch.object(serializers, 'msgspec', None)
+    mocker.patch.object(serializers, 'msgpack', None)
+
+    with pytest.raises(ImportError):
+        get_serializer('msgpack')
+
+
+def test_unknown_format():
+    """Test that an unknown format raises ValueError."""
+    with pytest.raises(ValueError):
+        get_serializer('xml')
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+import pickle
+import threading
+
+from src.lib.results import ResultStore
+from src.lib.scheduler import DagScheduler
+from src.lib.state import RunState
+
+
+DEPENDENCIES = {'Plugin': [], 'Plugin1': ['Plugin'], 'Plugin2': []}
+
+
+def make_sources(tmp_path):
+    sources = {}
+    for name in DEPENDENCIES:
+        directory = tmp_path / 'plugins' / name
+        directory.mkdir(parents=True)
+        (directory / 'plugin.py').write_text('class Plugin:\n    pass\n')
+        (directory / 'VERSION').write_text('1.0.0')
+        sources[name] = (str(directory), {})
+    return sources
+
+
+class Plugin:
+    def __init__(self, value):
+        self.value = value
+        self.inputs = None
+        self.runs = 0
+
+    def execute(self):
+        self.runs += 1
+        return self.value + sum(self.inputs.values())
+
+    def process_results(self):
+        pass
+
+
+def run(tmp_path, mocker, plugins, sources, **kwargs):
+    state = RunState(mocker.Mock(), str(tmp_path / 'state.pickle'), **kwargs)
+    store = ResultStore(
+        mocker.Mock(), DEPENDENCIES, state=state.plan('core', list(DEPENDENCIES), DEPENDENCIES, sources)
+    )
+    scheduler = DagScheduler(mocker.Mock(), max_workers=2)
+    tasks = {name: scheduler.task(plugin, name) for name, plugin in plugins.items()}
+    scheduler.run(tasks, DEPENDENCIES, store=store)
+    state.save()
+    return state
+
+
+def test_only_changed_plugins_and_dependents_run_again(tmp_path, mocker):
+    """Test that an incremental run replays unchanged plugins and runs the plugins downstream of a change."""
+    sources = make_sources(tmp_path)
+    plugins = {'Plugin': Plugin(1), 'Plugin1': Plugin(10), 'Plugin2': Plugin(100)}
+    run(tmp_path, mocker, plugins, sources)
+    run(tmp_path, mocker, plugins, sources)
+
+    assert [plugin.runs for plugin in plugins.values()] == [1, 1, 1]
+
+    (tmp_path / 'plugins' / 'Plugin' / 'VERSION').write_text('1.0.1')
+    run(tmp_path, mocker, plugins, sources)
+
+    assert [plugin.runs for plugin in plugins.values()] == [2, 2, 1]
+
+
+def test_excluded_and_full_runs(tmp_path, mocker):
+    """Test that excluded plugins and full runs always run."""
+    sources = make_sources(tmp_path)
+    plugins = {'Plugin': Plugin(1), 'Plugin1': Plugin(10), 'Plugin2': Plugin(100)}
+    run(tmp_path, mocker, plugins, sources)
+    run(tmp_path, mocker, plugins, sources, exclude=['Plugin'])
+
+    assert [plugin.runs for plugin in plugins.values()] == [2, 2, 1]
+
+    run(tmp_path, mocker, plugins, sources, full=True)
+
+    assert [plugin.runs for plugin in plugins.values()] == [3, 3, 2]
+
+
+def test_unpicklable_results_run_again(tmp_path, mocker):
+    """Test that a plugin whose result cannot be saved runs again."""
+    sources = make_sources(tmp_path)
+    state = RunState(mocker.Mock(), str(tmp_path / 'state.pickle'))
+    plan = state.plan('core', list(DEPENDENCIES), DEPENDENCIES, sources)
+
+    assert plan.record('Plugin', 1)
+    assert not plan.record('Plugin2', threading.Lock())
+    state.save()
+
+    plan = RunState(mocker.Mock(), str(tmp_path / 'state.pickle')).plan(
+        'core', list(DEPENDENCIES), DEPENDENCIES, sources
+    )
+
+    assert plan.lookup('Plugin') == (True, 1)
+    assert plan.lookup('Plugin1') == (False, None)
+    assert plan.lookup('Plugin2') == (False, None)
+
+
+def test_outdated_state_runs_every_plugin(tmp_path, mocker):
+    """Test that a state saved in a previous format is not replayed."""
+    sources = make_sources(tmp_path)
+    logger = mocker.Mock()
+    state = RunState(logger, str(tmp_path / 'state.pickle'))
+    fingerprint = state.fingerprint('Plugin', sources['Plugin'][0], {}, [])
+    (tmp_path / 'state.pickle').write_bytes(pickle.dumps({'core': {'Plugin': (fingerprint, pickle.dumps(1))}}))
+
+    plan = state.plan('core', list(DEPENDENCIES), DEPENDENCIES, sources)
+
+    assert plan.lookup('Plugin') == (False, None)
+    logger.info.assert_any_call("Run state %s is outdated, running every plugin", str(tmp_path / 'state.pickle'))
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import os
+
+from src.lib import watcher
+from src.lib.watcher import Watcher
+
+
+def test_changes(tmp_path, mocker):
+    """Test that added, modified and removed files are reported by directory."""
+    mocker.patch.object(watcher, 'inotify_simple', None)
+    plugin_dir = tmp_path / 'plugin1'
+    plugin_dir.mkdir()
+    (plugin_dir / 'plugin.py').write_text('')
+    watch = Watcher(mocker.Mock(), [str(tmp_path)], interval=0.01)
+
+    assert watch.changes() == set()
+
+    (plugin_dir / 'plugin.py').write_text('changed')
+    assert watch.changes() == {str(plugin_dir)}
+
+    (tmp_path / 'plugin2').mkdir()
+    assert watch.changes() == {str(tmp_path), str(tmp_path / 'plugin2')}
+
+    os.unlink(plugin_dir / 'plugin.py')
+    assert watch.changes() == {str(plugin_dir)}
+
+
+def test_ignores_bytecode(tmp_path, mocker):
+    """Test that bytecode caches are not reported as changes."""
+    mocker.patch.object(watcher, 'inotify_simple', None)
+    watch = Watcher(mocker.Mock(), [str(tmp_path)])
+    (tmp_path / '__pycache__').mkdir()
+    (tmp_path / '__pycache__' / 'plugin.cpython.pyc').write_text('')
+
+    # __pycache__ directories are not part of the snapshots
+    assert watch.changes() == set()
+
+
+def test_wait_stopped(tmp_path, mocker):
+    """Test that waiting returns False once the watcher is stopped."""
+    mocker.patch.object(watcher, 'inotify_simple', None)
+    watch = Watcher(mocker.Mock(), [str(tmp_path)])
+
+    assert watch.wait(0.01)
+    watch.stop()
+    assert not watch.wait(0.01)
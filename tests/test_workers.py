@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+import logging
+
+import pytest
+
+from src.lib.exceptions import PluginBudgetError, PluginExecutionError
+from src.lib.handler import run_plugins
+from src.lib.workers import WorkerPool
+
+
+@pytest.fixture
+def pool():
+    plugins = {'Slow': {'timeout': 0.5}, 'Spin': {'cpu': 1, 'timeout': 10}, 'Hog': {'memory': 64 * 1024 * 1024}}
+    pool = WorkerPool(logging.getLogger('test_workers'), processes=1, max_tasks=2, plugins=plugins)
+    yield pool
+    pool.close()
+
+
+def test_run_relays_hook_triggers(pool, module_path, mocker):
+    """Test that an isolated plugin runs in a worker and its hook triggers reach the hooks."""
+    hooks = {'record': mocker.Mock()}
+
+    pool.run('plugins', module_path, 'Plugin', hooks)
+
+    (pid,), _kwargs = hooks['record'].trigger.call_args
+    assert pid == pool.workers[0].process.pid
+
+
+def test_recycles_workers(pool, module_path, mocker):
+    """Test that workers are reused, then replaced after max_tasks tasks."""
+    hooks = {'record': mocker.Mock()}
+
+    for _ in range(3):
+        pool.run('plugins', module_path, 'Plugin', hooks)
+
+    pids = [call.args[0] for call in hooks['record'].trigger.call_args_list]
+    assert pids[0] == pids[1]
+    assert pids[2] != pids[0]
+
+
+def test_crash_and_timeout(pool, module_path, mocker):
+    """Test that crashing and slow plugins fail without taking the pool down."""
+    hooks = {'record': mocker.Mock()}
+
+    with pytest.raises(PluginExecutionError, match='exited with code 3'):
+        pool.run('plugins', module_path, 'Crash', hooks)
+    with pytest.raises(PluginExecutionError, match='timed out'):
+        pool.run('plugins', module_path, 'Slow', hooks)
+    with pytest.raises(PluginExecutionError, match='ValueError: boom'):
+        pool.run('plugins', module_path, 'Broken', hooks)
+
+    pool.run('plugins', module_path, 'Plugin', hooks)
+    hooks['record'].trigger.assert_called_once()
+
+
+def test_budgets(pool, module_path, mocker):
+    """Test that plugins exceeding their CPU time or memory budget fail, and their worker is replaced."""
+    hooks = {'record': mocker.Mock()}
+
+    with pytest.raises(PluginBudgetError, match='CPU time budget'):
+        pool.run('plugins', module_path, 'Spin', hooks)
+    with pytest.raises(PluginBudgetError, match='memory budget'):
+        pool.run('plugins', module_path, 'Hog', hooks)
+
+    pool.run('plugins', module_path, 'Plugin', hooks)
+    hooks['record'].trigger.assert_called_once()
+
+
+def test_serial_run_skips_dependents_of_plugin_over_budget(pool, module_path, mocker):
+    """Test that without a scheduler, a plugin over its budget only skips the plugins depending on it."""
+    dependent = mocker.Mock(result_type=None)
+    independent = mocker.Mock(result_type=None)
+    plugin_manager = mocker.Mock(
+        sorted_plugins=['Spin', 'Dependent', 'Independent'],
+        hooks={},
+        types={},
+        dependencies={'Dependent': ['Spin']},
+        plugins={'Spin': {'module_name': 'plugins', 'module_path': module_path}},
+        registered_plugins={'Dependent': dependent, 'Independent': independent},
+    )
+
+    with pytest.raises(PluginExecutionError, match='Plugins failed: Spin'):
+        run_plugins(plugin_manager, workers=pool, plugin_type='core')
+
+    dependent.execute.assert_not_called()
+    independent.execute.assert_called_once()
+
+
+def test_isolates(pool):
+    """Test that plugins are isolated by name or by type."""
+    pool.types = {'users'}
+
+    assert pool.isolates('core', 'Slow')
+    assert pool.isolates('users', 'Plugin')
+    assert not pool.isolates('core', 'Plugin')